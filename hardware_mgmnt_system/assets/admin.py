@@ -1,10 +1,75 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import Employee, Department, Computer, ComputerInfo, Role, ComputerAssignment, ComputerRepairHistory
+from .models import (
+    Employee, Department, Computer, ComputerInfo, Role, ComputerAssignment, ComputerRepairHistory, ComputerTransition,
+    HardwareModel, Job,
+)
 from django.contrib.auth.models import User
 from django.contrib import messages
+from django.contrib.admin.widgets import ForeignKeyRawIdWidget
+from django.core.paginator import Paginator
+from django.db import connection
+from django.forms.models import BaseInlineFormSet
+from django.urls import NoReverseMatch, reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+from django.utils import timezone
+from django.utils.text import Truncator, smart_split, unescape_string_literal
+from . import caching, jobs, search
+from .services import bulk_return
 
 # Register your models here.
+class EstimatedCountPaginator(Paginator):
+    '''
+    Use the table statistics instead of COUNT(*) for unfiltered changelists of large tables.
+    Small tables, filtered querysets and backends without statistics get an exact count.
+    '''
+    exact_below = 10000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = self.estimated_rows(self.object_list.model._meta.db_table)
+            if estimate is not None and estimate >= self.exact_below:
+                return estimate
+        return super().count
+
+    @staticmethod
+    def estimated_rows(table):
+        if connection.vendor == 'mysql':
+            sql = 'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s'
+        elif connection.vendor == 'postgresql':
+            sql = 'SELECT reltuples::bigint FROM pg_class WHERE relname = %s'
+        else:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [table])
+            row = cursor.fetchone()
+        return row[0] if row and row[0] is not None and row[0] >= 0 else None
+
+class CachedChoicesFilter(admin.SimpleListFilter):
+    '''Related-field filter whose choices come from the cache instead of a query per page'''
+    choices_function = None
+
+    def lookups(self, request, model_admin):
+        return type(self).choices_function()
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{f'{self.parameter_name}__exact': self.value()})
+        return queryset
+
+class DepartmentFilter(CachedChoicesFilter):
+    title = 'department'
+    parameter_name = 'department__id'
+    choices_function = caching.department_choices
+
+class RoleFilter(CachedChoicesFilter):
+    title = 'role'
+    parameter_name = 'role__id'
+    choices_function = caching.role_choices
+
 class EmployeeInline(admin.StackedInline):
     model = Employee
     fields = ['department', 'date_of_birth', 'gender', 'role']
@@ -25,7 +90,8 @@ class RoleInline(admin.TabularInline):
 @admin.register(Role)
 class RoleAdmin(admin.ModelAdmin):
     list_display = ['name', 'department']
-    list_filter = ['department']
+    list_filter = [DepartmentFilter]
+    list_select_related = ['department']
     search_fields = ['name']
 
     def has_add_permission(self, request):
@@ -42,8 +108,11 @@ class DepartmentAdmin(admin.ModelAdmin):
 @admin.register(Employee)
 class EmployeeAdmin(admin.ModelAdmin):
     list_display = ['user', 'department', 'role']
-    list_filter = ['department', 'role']
+    list_filter = [DepartmentFilter, RoleFilter]
+    list_select_related = ['user', 'department', 'role__department']
     raw_id_fields = ['user']
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
 
     def has_add_permission(self, request):
         return False
@@ -53,42 +122,103 @@ class ComputerInfoInline(admin.StackedInline):
     fields = ['brand', 'name', 'screen_type', 'screen_aspect_ratio', 'memory_size', 'storage_size', 'storage_type']
     extra = 0
 
-class ComputerAssignmentInline(admin.TabularInline):
+def changed_computer(request):
+    '''The computer loaded by ComputerAdmin.get_object for this request, if any'''
+    return getattr(request, '_admin_computer', None)
+
+class LoadedRawIdWidget(ForeignKeyRawIdWidget):
+    '''Raw id widget that labels the value with the row's already loaded object instead of fetching it'''
+    loaded = None
+
+    def label_and_url_for_value(self, value):
+        obj = self.loaded
+        if obj is None or str(obj.pk) != str(value):
+            return super().label_and_url_for_value(value)
+        try:
+            url = reverse(f'{self.admin_site.name}:{obj._meta.app_label}_{obj._meta.model_name}_change', args=(obj.pk,))
+        except NoReverseMatch:
+            url = ''
+        return Truncator(obj).words(14), url
+
+class ComputerInlineFormSet(BaseInlineFormSet):
+    '''Give every row the parent computer and its loaded relations so rendering the rows does not reload them'''
+    def _construct_form(self, i, **kwargs):
+        form = super()._construct_form(i, **kwargs)
+        if self.instance.pk is not None:
+            self.fk.set_cached_value(form.instance, self.instance)
+        for name, field in form.fields.items():
+            if isinstance(field.widget, LoadedRawIdWidget) and form.instance._meta.get_field(name).is_cached(form.instance):
+                field.widget.loaded = getattr(form.instance, name)
+        return form
+
+class RecentRowsInline(admin.TabularInline):
+    '''
+    Only build forms for the most recent rows of the computer's history.
+    The full history is shown when the page is opened with ?<show_all_param>=1.
+    '''
+    formset = ComputerInlineFormSet
+    max_rows = 20
+    recent_ordering = None
+    show_all_param = None
+    rows_label = None
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        computer = changed_computer(request)
+        if computer is None or request.GET.get(self.show_all_param):
+            return queryset
+        ids = list(
+            queryset.filter(computer=computer).order_by(*self.recent_ordering)
+            .values_list('pk', flat=True)[:self.max_rows + 1]
+        )
+        if len(ids) > self.max_rows and request.method == 'GET':
+            query = request.GET.copy()
+            query[self.show_all_param] = '1'
+            messages.info(request, format_html(
+                'Showing the {} most recent {}. <a href="?{}">Show all</a>',
+                self.max_rows, self.rows_label, query.urlencode()
+            ))
+        return queryset.filter(pk__in=ids[:self.max_rows])
+
+class ComputerAssignmentFormSet(ComputerInlineFormSet):
+    def delete_existing(self, obj, commit=True):
+        '''Deleting an assignment row ends it instead, so the history is kept'''
+        if commit and obj.end_date is None:
+            obj.end_date = timezone.now()
+            # the assignment signals reconcile the computer and drop the cached responses
+            obj.save(update_fields=['end_date'])
+
+class ComputerAssignmentInline(RecentRowsInline):
     model = ComputerAssignment
+    formset = ComputerAssignmentFormSet
     fields = ['employee', 'start_date', 'end_date']
     extra = 0
     raw_id_fields = ['employee']
     can_delete=True
+    recent_ordering = ['-start_date', '-pk']
+    show_all_param = 'all_assignments'
+    rows_label = 'assignments'
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('employee__user')
 
-    def delete_queryset(self, request, queryset):
-        '''Instead of deleting, set end_date to now'''
-        from django.utils import timezone
-        now = timezone.now().date()
-        updated = queryset.update(end_date=now)
-        self.message_user(
-            request,
-            f'{updated} assignments(s) ended on {now}',
-            messages.SUCCESS
-        )
-    
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
         if db_field.name == 'employee':
-            object_id = request.resolver_match.kwargs.get('object_id')
-            if object_id:
-                try:
-                    computer = Computer.objects.get(pk=object_id)
-                    if computer.status == 'Faulty':
-                        kwargs['queryset'] = Employee.objects.none()
-                except Computer.DoesNotExist:
-                    pass
+            computer = changed_computer(request)
+            if computer is not None and computer.status == 'Faulty':
+                kwargs['queryset'] = Employee.objects.none()
+            kwargs['widget'] = LoadedRawIdWidget(db_field.remote_field, self.admin_site, using=kwargs.get('using'))
         return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
-class ComputerRepairHistoryInline(admin.TabularInline):
+class ComputerRepairHistoryInline(RecentRowsInline):
     model = ComputerRepairHistory
     fields = ['repaired_component', 'date_of_repair', 'repair_cost', 'comments']
     readonly_fields = fields
     extra = 0
     can_delete = False
+    recent_ordering = ['-date_of_repair', '-id']
+    show_all_param = 'all_repairs'
+    rows_label = 'repairs'
 
     def has_add_permission(self, request, obj):
         return False
@@ -98,36 +228,103 @@ class ComputerRepairHistoryInline(admin.TabularInline):
 class ComputerRepairHistoryAdmin(admin.ModelAdmin):
     list_display = ['computer', 'repaired_component', 'date_of_repair', 'repair_cost']
     list_filter = ['date_of_repair', 'repaired_component']
+    list_select_related = ['computer']
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
     raw_id_fields = ['computer']
     search_fields = ['computer__computer_name', 'computer__asset_tag', 'comments']
     date_hierarchy = 'date_of_repair'
     fields = ['computer', 'repaired_component', 'date_of_repair', 'repair_cost', 'comments']
 
+    def get_search_results(self, request, queryset, search_term):
+        '''
+        Narrow the repairs to the computers whose search document contains every term, so
+        the icontains filters only scan their rows instead of the whole history. A document
+        holds the computer's name, tag and every repair comment, so it contains each term a
+        matching repair does. Documents refreshed by the job queue can lag behind the
+        repairs, so then the plain search runs.
+        '''
+        terms = [
+            unescape_string_literal(bit) if bit.startswith(('"', "'")) and bit[0] == bit[-1] else bit
+            for bit in smart_split(search_term)
+        ]
+        if terms and not jobs.enabled():
+            queryset = queryset.filter(computer_id__in=search.containing(terms).values('computer_id'))
+        return super().get_search_results(request, queryset, search_term)
+
+@admin.register(ComputerTransition)
+class ComputerTransitionAdmin(admin.ModelAdmin):
+    '''The transition log is append-only, so it can be browsed but not edited'''
+    list_display = ['asset_tag', 'occurred_at', 'from_status', 'status', 'employee_id', 'department_id']
+    list_filter = ['status']
+    search_fields = ['=asset_tag']
+    date_hierarchy = 'occurred_at'
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(HardwareModel)
+class HardwareModelAdmin(admin.ModelAdmin):
+    '''The catalogue follows the ComputerInfo rows, so it can be browsed but not edited'''
+    list_display = ['brand', 'name', 'memory_size', 'storage_type', 'storage_size_gb', 'screen_type', 'screen_aspect_ratio']
+    list_filter = ['brand', 'storage_type', 'memory_size']
+    search_fields = ['brand', 'name']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['key', 'task', 'status', 'attempts', 'created_at', 'run_after', 'finished_at']
+    list_filter = ['status', 'task']
+    search_fields = ['=key']
+    readonly_fields = ['task', 'key', 'payload', 'attempts', 'created_at', 'started_at', 'finished_at', 'claimed_by', 'last_error']
+    fields = readonly_fields[:2] + ['status', 'run_after'] + readonly_fields[2:]
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
+
+    def has_add_permission(self, request):
+        return False
+
 @admin.register(Computer)
 class ComputerAdmin(admin.ModelAdmin):
     inlines = [ComputerInfoInline, ComputerAssignmentInline, ComputerRepairHistoryInline]
     list_display = ['computer_name', 'asset_tag', 'department', 'current_user', 'status']
-    list_filter = ['department']
+    list_filter = [DepartmentFilter]
+    list_select_related = ['department', 'current_user__user']
+    show_full_result_count = False
+    paginator = EstimatedCountPaginator
     readonly_fields = ['asset_tag']
     fields = ['computer_name', 'department', 'asset_tag', 'status']
+    actions = ['return_to_inventory']
+
+    def get_object(self, request, object_id, from_field=None):
+        '''Load the computer once per request; the inlines read it through changed_computer()'''
+        computer = changed_computer(request)
+        if computer is None or str(computer.pk) != str(object_id):
+            computer = super().get_object(request, object_id, from_field)
+            request._admin_computer = computer
+        return computer
+
+    @admin.action(description='End assignments and return selected computers to inventory')
+    def return_to_inventory(self, request, queryset):
+        ended = bulk_return(queryset.values_list('pk', flat=True))
+        self.message_user(request, f'{ended} assignment(s) ended', messages.SUCCESS)
 
-    def save_model(self, request, obj, form, change):
-        original_status = obj.status
-
-        super().save_model(request, obj, form, change)
-        
-        if obj.status == 'Faulty':
-            return
-        
-        if obj.current_user:
-            obj.status = 'Issued'
-        elif not obj.current_user and not ComputerAssignment.objects.filter(
-            computer=obj, end_date__isnull=True
-        ).exists():
-            obj.status = 'Inventory'
-        
-        obj.save(update_fields=['status'])
-    
     def save_formset(self, request, form, formset, change):
         '''Block assingment to faulty computers'''
         if formset.model == ComputerAssignment:
@@ -136,13 +333,15 @@ class ComputerAdmin(admin.ModelAdmin):
                     self.message_user(request, "Cannot assign to Faulty computer", messages.ERROR)
                     return
             
+        # the assignment signals reconcile the computer's status and current user
         super().save_formset(request, form, formset, change)
-        if formset.model == ComputerAssignment:
-            form.instance.save()
     
     def has_delete_permission(self, request, obj=None):
         if obj and obj.status == 'Faulty':
-            self.message_user(request, "Faulty computers canot be deleted", level="warning")
+            # asked several times per page, warn once
+            if not getattr(request, '_faulty_delete_warned', False):
+                request._faulty_delete_warned = True
+                self.message_user(request, "Faulty computers canot be deleted", level="warning")
             return False
         return super().has_delete_permission(request, obj)
     
@@ -1,8 +1,11 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class AssetsConfig(AppConfig):
     name = 'assets'
 
     def ready(self):
-        import assets.signals
\ No newline at end of file
+        import assets.signals
+        from assets import search
+        post_migrate.connect(search.install_fulltext, sender=self)
@@ -0,0 +1,179 @@
+'''
+Async versions of the dashboard read endpoints, served under /api/ITAMS/async/.
+
+They return the same JSON as the DRF views they mirror, but use the async ORM and
+cache methods, so under an ASGI server (uvicorn hardware_mgmnt_system.asgi:application)
+they skip the sync view bridge. Django still runs each query and each call to a sync
+cache backend in one thread per process, so database-bound throughput does not
+improve; measure with the benchmark_asgi command before switching deployments.
+DRF has no async views, so these are plain Django views that check permissions themselves.
+'''
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_GET
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, NotFound, PermissionDenied, ValidationError
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import caching
+from .models import Computer, ComputerAssignment, ComputerSummary
+from .routers import replica_reads
+from .serializers import (
+    ComputerRepairHistorySerializer, ComputerSummaryListSerializer, UserComputerSerializer,
+    UserComputerSummarySerializer,
+)
+from .views import (
+    FleetCursorPagination, UserComputerView, filter_fleet, my_computer_queryset, repairs_limit,
+    repairs_page_queryset, set_repair_page,
+)
+
+
+def _json(data, status=status.HTTP_200_OK, **kwargs):
+    return JsonResponse(data, encoder=JSONEncoder, status=status, safe=False, **kwargs)
+
+
+def _error(exc):
+    detail = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+    return _json(detail, status=exc.status_code)
+
+
+async def _user(request, staff=False):
+    user = await request.auser()
+    if not user.is_authenticated:
+        raise NotAuthenticated()
+    if staff and not user.is_staff:
+        raise PermissionDenied()
+    return user
+
+
+async def _open_computer_id(user):
+    computer_id = await caching.aget_computer_id(user.pk)
+    if computer_id is None:
+        computer_id = await ComputerAssignment.objects.filter(
+            employee__user=user, end_date__isnull=True
+        ).values_list('computer_id', flat=True).afirst()
+        if computer_id is None:
+            raise NotFound("No computer assigned to you currently.")
+        await caching.aset_computer_id(user.pk, computer_id)
+    return computer_id
+
+
+async def _open_computer_data(user, params):
+    '''The user's computer from its open assignment with a page of repairs'''
+    computer = await my_computer_queryset(user).afirst()
+    if computer is None:
+        raise NotFound("No computer assigned to you currently.")
+    limit = repairs_limit(params, UserComputerView.max_repairs_limit)
+    repairs = repairs_page_queryset(computer, limit, params.get('repairs_cursor'))
+    set_repair_page(computer, [repair async for repair in repairs], limit)
+    return UserComputerSerializer(computer).data, computer.pk
+
+
+async def _my_computer_data(user, computer_id, params):
+    '''UserComputerView.get_data: the summary row and a page of repairs, or None if the user no longer holds it'''
+    limit = repairs_limit(params, UserComputerView.max_repairs_limit)
+    summary = await ComputerSummary.objects.filter(pk=computer_id).afirst()
+    if summary is None:
+        if not await my_computer_queryset(user).filter(pk=computer_id).aexists():
+            return None
+        data, _ = await _open_computer_data(user, params)
+        return data
+    if summary.user_id != user.pk:
+        return None
+
+    repairs = repairs_page_queryset(summary, limit, params.get('repairs_cursor'))
+    set_repair_page(summary, [repair async for repair in repairs], limit)
+    return UserComputerSummarySerializer(summary).data
+
+
+@require_GET
+async def my_computer(request):
+    '''Async UserComputerView: same response, cache entries and ETags'''
+    try:
+        with replica_reads():
+            user = await _user(request)
+            computer_id = await _open_computer_id(user)
+            params = {
+                name: request.GET[name]
+                for name in ('repairs_limit', 'repairs_cursor') if name in request.GET
+            }
+            key = caching.response_key(user.pk, computer_id, await caching.aget_version(computer_id), params)
+            cached = await cache.aget(key)
+            if cached is None:
+                await caching.arecord('miss')
+                data = await _my_computer_data(user, computer_id, params)
+                if data is None:
+                    # stale pointer: drop it and answer from the open assignment, uncached
+                    await caching.ainvalidate_user(user.pk)
+                    data, _ = await _open_computer_data(user, params)
+                    etag = caching.make_etag(data)
+                else:
+                    etag = caching.make_etag(data)
+                    await cache.aset(key, (etag, data), caching.timeout())
+            else:
+                await caching.arecord('hit')
+                etag, data = cached
+    except APIException as exc:
+        return _error(exc)
+
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    if etag in if_none_match or '*' in if_none_match:
+        return HttpResponse(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+    return _json(data, headers={'ETag': etag})
+
+
+@require_GET
+async def my_repairs(request):
+    '''
+    One page of the signed-in employee's repair history, newest first.
+    ?repairs_limit=N (default 50) and ?repairs_cursor= as on /my_computer/.
+    '''
+    try:
+        with replica_reads():
+            user = await _user(request)
+            computer = Computer(pk=await _open_computer_id(user))
+            limit = repairs_limit(request.GET, UserComputerView.max_repairs_limit) or 50
+            repairs = repairs_page_queryset(computer, limit, request.GET.get('repairs_cursor'))
+            set_repair_page(computer, [repair async for repair in repairs], limit)
+    except APIException as exc:
+        return _error(exc)
+
+    return _json({
+        'results': ComputerRepairHistorySerializer(computer.repair_page, many=True).data,
+        'next_cursor': getattr(computer, 'repairs_next_cursor', None),
+    })
+
+
+@require_GET
+async def computer_list(request):
+    '''
+    Async ComputerListView for IT staff, with the same filters.
+    Pages are keyed on the id: follow ?after=<last id> from the "next" link.
+    '''
+    pagination = FleetCursorPagination
+    try:
+        with replica_reads():
+            await _user(request, staff=True)
+            queryset = filter_fleet(ComputerSummary.objects.all(), request.GET)
+            try:
+                after = int(request.GET.get('after', 0))
+                page_size = min(int(request.GET.get(pagination.page_size_query_param, pagination.page_size)),
+                                pagination.max_page_size)
+            except ValueError:
+                raise ValidationError({"detail": "after and page_size must be integers."})
+            if page_size < 1:
+                raise ValidationError({pagination.page_size_query_param: "Must be a positive integer."})
+            computers = [
+                computer async for computer in queryset.filter(computer_id__gt=after).order_by('computer_id')[:page_size + 1]
+            ]
+    except APIException as exc:
+        return _error(exc)
+
+    next_url = None
+    if len(computers) > page_size:
+        computers = computers[:page_size]
+        query = request.GET.copy()
+        query['after'] = computers[-1].computer_id
+        next_url = request.build_absolute_uri(f"{request.path}?{query.urlencode()}")
+    return _json({'next': next_url, 'results': ComputerSummaryListSerializer(computers, many=True).data})
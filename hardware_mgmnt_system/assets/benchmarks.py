@@ -0,0 +1,181 @@
+'''
+Seeded synthetic fleets and timing helpers for the benchmark commands.
+
+generate_fleet() fills the database with bulk inserts only: departments and roles from
+the fixtures, employees, computers with ComputerInfo, past assignments and years of
+repairs. The same seed always produces the same data, so results from different
+commits can be compared.
+'''
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+
+from . import catalogue, rollups, search, summaries
+from .models import Computer, ComputerAssignment, ComputerInfo, ComputerRepairHistory, Employee, Role
+from .services import QueryCounter
+
+BRANDS = {'Dell': ['Latitude 5440', 'OptiPlex 7010'], 'HP': ['EliteBook 840', 'ProDesk 600'],
+          'Lenovo': ['ThinkPad T14', 'ThinkCentre M70'], 'Apple': ['MacBook Pro 14', 'iMac 24']}
+PASSWORD = 'benchmark-password'
+
+
+@contextmanager
+def private_cache():
+    '''Serve the benchmark from a cache of its own, so it neither reads nor clears the shared one'''
+    with override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark',
+    }}):
+        yield
+
+
+@contextmanager
+def throwaway_database():
+    '''
+    Point the default database at a new test database, as the test runner does, for
+    benchmarks that must commit so other threads can read their data
+    '''
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def summarize(timings, queries=None):
+    '''p50/p95/p99 and mean in milliseconds, plus the median query count'''
+    summary = {
+        'iterations': len(timings),
+        'p50_ms': round(percentile(timings, .5), 3),
+        'p95_ms': round(percentile(timings, .95), 3),
+        'p99_ms': round(percentile(timings, .99), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+    }
+    if queries:
+        summary['queries'] = statistics.median_low(queries)
+    return summary
+
+
+def measure(func, iterations, setup=None, warmup=1):
+    '''
+    Call func(*setup(i)) warmup + iterations times and summarize the timed calls.
+    Only func is timed and only its queries are counted.
+    '''
+    timings, queries = [], []
+    for i in range(warmup + iterations):
+        args = setup(i) if setup else ()
+        counter = QueryCounter()
+        with connection.execute_wrapper(counter):
+            started = time.perf_counter()
+            func(*args)
+            elapsed = (time.perf_counter() - started) * 1000
+        if i >= warmup:
+            timings.append(elapsed)
+            queries.append(counter.count)
+    return summarize(timings, queries)
+
+
+def generate_fleet(employees=500, computers=1000, repairs=2.0, churn=2, years=3, seed=0, prefix='bench'):
+    '''
+    Create a synthetic fleet and return the number of rows of each kind.
+    Every computer gets churn ended assignments and about repairs repairs over the last years;
+    three in four of them end up issued to an employee.
+    '''
+    rng = random.Random(seed)
+    now = timezone.now()
+    if not Role.objects.exists():
+        call_command('loaddata', 'initial_data', 'roles', verbosity=0)
+    roles = list(Role.objects.order_by('pk').values_list('pk', 'department_id'))
+
+    # one hash for everyone, so generating users does not run the hasher thousands of times
+    password = make_password(PASSWORD)
+    User.objects.bulk_create([
+        User(username=f"{prefix}-user-{i:06d}", password=password) for i in range(employees)
+    ], batch_size=1000)
+    user_ids = User.objects.filter(username__startswith=f"{prefix}-user-").order_by('username').values_list('pk', flat=True)
+    placements = [rng.choice(roles) for _ in range(employees)]
+    Employee.objects.bulk_create([
+        Employee(user_id=user_id, role_id=role_id, department_id=department_id, gender=rng.choice('MF'))
+        for user_id, (role_id, department_id) in zip(user_ids, placements)
+    ], batch_size=1000)
+    employee_ids = list(Employee.objects.filter(user__username__startswith=f"{prefix}-user-").order_by(
+        'user__username'
+    ).values_list('pk', flat=True))
+
+    Computer.objects.bulk_create([
+        Computer(computer_name=prefix.title(), asset_tag=f"{prefix.upper()}-{i:07d}", department_id=rng.choice(roles)[1])
+        for i in range(computers)
+    ], batch_size=1000)
+    computer_ids = list(Computer.objects.filter(asset_tag__startswith=f"{prefix.upper()}-").order_by(
+        'asset_tag'
+    ).values_list('pk', flat=True))
+    infos = []
+    for computer_id in computer_ids:
+        brand = rng.choice(list(BRANDS))
+        infos.append(ComputerInfo(
+            computer_id=computer_id, brand=brand, name=rng.choice(BRANDS[brand]),
+            screen_type=rng.choice(ComputerInfo.SCREEN_CHOICES)[0],
+            screen_aspect_ratio=rng.choice(ComputerInfo.ASPECT_CHOICES)[0],
+            memory_size=rng.choice([8, 16, 16, 32]),
+            storage_type=rng.choice(['SSD', 'SSD', 'SSD', 'HDD']),
+            storage_size=rng.choice(ComputerInfo.STORAGE_SIZE_CHOICES)[0],
+        ))
+    for info in infos:
+        catalogue.link(info)
+    ComputerInfo.objects.bulk_create(infos, batch_size=1000)
+
+    span = timedelta(days=365 * years)
+    assignments = []
+    for computer_id in computer_ids:
+        started = now - span
+        for _ in range(churn):
+            started += timedelta(seconds=rng.uniform(0, span.total_seconds() / (churn + 1)))
+            ended = started + timedelta(days=rng.randint(30, 365))
+            if ended >= now:
+                break
+            assignments.append(ComputerAssignment(
+                computer_id=computer_id, employee_id=rng.choice(employee_ids), start_date=started, end_date=ended
+            ))
+            started = ended
+    holders = rng.sample(employee_ids, min(len(employee_ids), len(computer_ids) * 3 // 4))
+    assignments += [
+        ComputerAssignment(computer_id=computer_id, employee_id=employee_id, start_date=now - timedelta(days=rng.randint(1, 90)))
+        for computer_id, employee_id in zip(rng.sample(computer_ids, len(holders)), holders)
+    ]
+    ComputerAssignment.objects.bulk_create(assignments, batch_size=1000)
+
+    repair_rows = []
+    for computer_id in computer_ids:
+        for _ in range(int(rng.uniform(0, 2 * repairs) + .5)):
+            repair_rows.append(ComputerRepairHistory(
+                computer_id=computer_id, repaired_component=rng.choice(ComputerRepairHistory.COMPONENT_CHOICES)[0],
+                repair_cost=f"{rng.uniform(20, 400):.2f}", date_of_repair=(now - rng.random() * span).date(),
+                comments=rng.choice(['', 'Replaced under warranty', 'Customer reported intermittent fault']),
+            ))
+    ComputerRepairHistory.objects.bulk_create(repair_rows, batch_size=1000)
+
+    # bulk inserts skip the signals, so bring the derived state up to date in bulk
+    Computer.objects.filter(asset_tag__startswith=f"{prefix.upper()}-").reconcile_state()
+    rollups.rebuild()
+    search.refresh(computer_ids)
+    summaries.refresh(computer_ids)
+    return {
+        'employees': len(employee_ids),
+        'computers': len(computer_ids),
+        'assignments': len(assignments),
+        'repairs': len(repair_rows),
+    }
@@ -0,0 +1,243 @@
+'''
+Bulk loader for large fixture-style JSON and CSV files, such as years of legacy repair logs.
+
+loaddata saves records one by one, and every saved repair or assignment runs its signals:
+reconcile the computer, bump the rollups, queue the search document and the summary.
+This loader streams the file holding one record at a time, and writes each chunk with
+bulk_create inside its own transaction. bulk_create sends no per-row signals, so the
+derived state is brought up to date once at the end: computer status, asset tag counters,
+rollups, search documents, summaries and the cached department and role choices.
+
+After every committed chunk a checkpoint file records how many records are done, so a
+failed load can be resumed from there. Resuming assumes those records are unchanged.
+'''
+import csv
+import json
+import os
+import time
+from io import StringIO
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.core.serializers.base import DeserializationError
+from django.core.serializers.python import Deserializer
+from django.db import connection, transaction
+
+from . import caching, catalogue, rollups, search, summaries
+from .models import (
+    Computer, ComputerAssignment, ComputerInfo, ComputerRepairHistory, ComputerTransition, Department, Employee, Role,
+)
+from .services import QueryCounter, _chunks
+
+# in dependency order; rollups, transitions, search documents and summaries are derived and rebuilt instead
+LOADABLE_MODELS = [
+    Department, Role, User, Employee, Computer, ComputerInfo, ComputerAssignment, ComputerRepairHistory,
+]
+MAX_ERRORS = 1000
+
+
+def loadable_model(label):
+    try:
+        model = apps.get_model(label)
+    except (LookupError, ValueError):
+        raise ValueError(f"Unknown model '{label}'")
+    if model not in LOADABLE_MODELS:
+        raise ValueError(f"{label} cannot be bulk loaded")
+    return model
+
+
+def iter_json_records(stream, buffer_size=1 << 16):
+    '''
+    Yield the objects of a top-level JSON array, or of JSON Lines, reading buffer_size
+    characters at a time, so memory holds one buffer and one record however big the file is.
+    '''
+    decoder = json.JSONDecoder()
+    buffer, position, eof, started = '', 0, False, False
+    while True:
+        while position < len(buffer) and buffer[position] in ' \t\r\n,':
+            position += 1
+        if position == len(buffer):
+            if eof:
+                return
+            buffer, position = stream.read(buffer_size), 0
+            eof = not buffer
+            continue
+        if not started:
+            started = True
+            if buffer[position] == '[':
+                position += 1
+                continue
+        if buffer[position] == ']':
+            return
+        try:
+            record, end = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # the record runs past the buffer: keep its start and read more
+            more = stream.read(buffer_size)
+            eof = not more
+            buffer, position = buffer[position:] + more, 0
+            continue
+        yield record
+        position = end
+
+
+def iter_csv_records(stream, model):
+    '''Yield fixture records from a CSV of one model: an optional pk column and one column per field'''
+    nullable = {field.name for field in model._meta.fields if field.null}
+    for row in csv.DictReader(stream):
+        pk = row.pop('pk', None) or None
+        fields = {
+            name: None if value == '' and name in nullable else value
+            for name, value in row.items()
+        }
+        yield {'model': model._meta.label_lower, 'pk': pk, 'fields': fields}
+
+
+def read_records(stream, fmt='json', model=None):
+    if fmt == 'json':
+        return iter_json_records(stream)
+    if fmt == 'csv':
+        if model is None:
+            raise ValueError('CSV files hold one model; name it')
+        return iter_csv_records(stream, loadable_model(model))
+    raise ValueError(f"Unsupported load format: {fmt}")
+
+
+def build_instance(record):
+    '''An unsaved, validated model instance from a fixture record'''
+    try:
+        loadable_model(record.get('model', ''))
+        deserialized = next(iter(Deserializer([record])))
+    except (DeserializationError, KeyError, TypeError, ValueError) as exc:
+        raise ValidationError(str(exc))
+    if deserialized.m2m_data:
+        raise ValidationError('Many-to-many fields cannot be bulk loaded')
+    instance = deserialized.object
+    # foreign keys are checked by the database when the chunk is written
+    instance.clean_fields(exclude=[field.name for field in instance._meta.fields if field.is_relation])
+    if isinstance(instance, ComputerInfo):
+        catalogue.link(instance)
+    return instance
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as checkpoint:
+            return json.load(checkpoint)
+    except FileNotFoundError:
+        return None
+
+
+def write_checkpoint(path, state):
+    # written aside and renamed, so a crash never leaves half a checkpoint
+    with open(f"{path}.tmp", 'w') as checkpoint:
+        json.dump(state, checkpoint)
+    os.replace(f"{path}.tmp", path)
+
+
+def _write_chunk(instances):
+    by_model = {}
+    for instance in instances:
+        by_model.setdefault(type(instance), []).append(instance)
+
+    computer_ids = set()
+    with transaction.atomic():
+        for model in sorted(by_model, key=LOADABLE_MODELS.index):
+            rows = by_model[model]
+            model.objects.bulk_create(rows)
+            if model is Computer:
+                # not every backend returns primary keys from bulk_create, so look them up by tag
+                ids = dict(Computer.objects.filter(
+                    asset_tag__in=[computer.asset_tag for computer in rows]
+                ).values_list('asset_tag', 'id'))
+                ComputerTransition.objects.bulk_create([
+                    ComputerTransition(
+                        computer_id=ids[computer.asset_tag], asset_tag=computer.asset_tag,
+                        department_id=computer.department_id, status=computer.status,
+                    ) for computer in rows
+                ])
+                computer_ids.update(ids.values())
+            elif model in (ComputerInfo, ComputerAssignment, ComputerRepairHistory):
+                computer_ids.update(row.computer_id for row in rows)
+    return computer_ids
+
+
+def load(records, checkpoint_path, chunk_size=1000, resume=False):
+    '''
+    Bulk load fixture records, one transaction per chunk of chunk_size records, then
+    rebuild the derived state. Invalid records are reported and skipped; a database error
+    aborts the load with the checkpoint at the last committed chunk. With resume, the
+    records the checkpoint covers are skipped.
+    '''
+    state = read_checkpoint(checkpoint_path) if resume else None
+    state = state or {'phase': 'load', 'records': 0, 'created': {}, 'errors': 0}
+    counter = QueryCounter()
+    errors = []
+    computer_ids = set()
+    started = time.perf_counter()
+
+    with connection.execute_wrapper(counter):
+        if state['phase'] == 'load':
+            done = state['records']
+            for chunk in _chunks(enumerate(records, start=1), chunk_size):
+                if chunk[-1][0] <= done:
+                    continue
+                instances = []
+                for number, record in chunk:
+                    if number <= done:
+                        continue
+                    try:
+                        instances.append(build_instance(record))
+                    except ValidationError as exc:
+                        state['errors'] += 1
+                        if len(errors) < MAX_ERRORS:
+                            errors.append({'record': number, 'errors': exc.messages})
+                computer_ids |= _write_chunk(instances)
+                for instance in instances:
+                    label = instance._meta.label_lower
+                    state['created'][label] = state['created'].get(label, 0) + 1
+                state['records'] = chunk[-1][0]
+                write_checkpoint(checkpoint_path, state)
+            state['phase'] = 'finish'
+            write_checkpoint(checkpoint_path, state)
+
+        finish(state['created'])
+
+    for computer_id in computer_ids:
+        caching.invalidate_computer(computer_id)
+    os.remove(checkpoint_path)
+    elapsed = time.perf_counter() - started
+    return {
+        'records': state['records'],
+        'created': state['created'],
+        'error_count': state['errors'],
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'records_per_second': round(state['records'] / elapsed, 1) if elapsed else None,
+        'queries': counter.count,
+    }
+
+
+def finish(created):
+    '''Bring everything the per-row signals would have maintained up to date, once'''
+    models = [apps.get_model(label) for label in created]
+    # explicit primary keys leave the sequences behind on some backends, as loaddata knows
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    if statements:
+        with connection.cursor() as cursor:
+            for sql in statements:
+                cursor.execute(sql)
+
+    Computer.objects.reconcile_state()
+    if Computer in models:
+        call_command('seed_asset_tag_sequences', stdout=StringIO())
+    if Department in models or Role in models:
+        caching.invalidate_choices()
+    rollups.rebuild()
+    search.rebuild()
+    summaries.rebuild()
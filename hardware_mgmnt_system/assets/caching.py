@@ -0,0 +1,166 @@
+'''
+Response cache for /my_computer/, plus the cached filter choices used by the admin.
+
+Each user's open assignment is remembered as a pointer to their computer, and
+responses are stored per user and computer under a per-computer version number.
+The signals bump the version (or drop the pointer) whenever something shown in
+the response changes, so stale entries are simply never read again. They do so once
+the write commits: a request served before the commit would cache the old state again.
+'''
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import metrics
+from .models import Department, Role
+
+STATS_KEYS = {'hit': 'my_computer:stats:hits', 'miss': 'my_computer:stats:misses'}
+
+
+def timeout():
+    return getattr(settings, 'MY_COMPUTER_CACHE_TIMEOUT', 300)
+
+
+def _user_key(user_id):
+    return f"my_computer:user:{user_id}"
+
+
+def _version_key(computer_id):
+    return f"my_computer:version:{computer_id}"
+
+
+def get_computer_id(user_id):
+    return cache.get(_user_key(user_id))
+
+
+def set_computer_id(user_id, computer_id):
+    cache.set(_user_key(user_id), computer_id, timeout())
+
+
+def get_version(computer_id):
+    version = cache.get(_version_key(computer_id))
+    if version is None:
+        # a fresh version is time based, so an evicted counter can never reuse an old number
+        cache.add(_version_key(computer_id), time.time_ns(), None)
+        version = cache.get(_version_key(computer_id))
+    return version
+
+
+async def aget_computer_id(user_id):
+    return await cache.aget(_user_key(user_id))
+
+
+async def aset_computer_id(user_id, computer_id):
+    await cache.aset(_user_key(user_id), computer_id, timeout())
+
+
+async def aget_version(computer_id):
+    version = await cache.aget(_version_key(computer_id))
+    if version is None:
+        await cache.aadd(_version_key(computer_id), time.time_ns(), None)
+        version = await cache.aget(_version_key(computer_id))
+    return version
+
+
+def response_key(user_id, computer_id, version, params):
+    query = '&'.join(f"{name}={params[name]}" for name in sorted(params))
+    return f"my_computer:response:{user_id}:{computer_id}:{version}:{query}"
+
+
+def make_etag(data):
+    body = json.dumps(data, cls=JSONEncoder, sort_keys=True).encode()
+    return f'"{hashlib.sha1(body).hexdigest()}"'
+
+
+def record(outcome):
+    metrics.record_cache(outcome)
+    key = STATS_KEYS[outcome]
+    try:
+        cache.incr(key)
+    except ValueError:
+        # first count, or the counter was evicted; someone else may add it first
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+async def arecord(outcome):
+    metrics.record_cache(outcome)
+    key = STATS_KEYS[outcome]
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        if not await cache.aadd(key, 1, None):
+            await cache.aincr(key)
+
+
+def stats():
+    values = cache.get_many(STATS_KEYS.values())
+    hits = values.get(STATS_KEYS['hit'], 0)
+    misses = values.get(STATS_KEYS['miss'], 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / (hits + misses), 4) if hits + misses else None,
+    }
+
+
+def invalidate_computer(computer_id):
+    try:
+        cache.incr(_version_key(computer_id))
+    except ValueError:
+        # no version yet means nothing has been cached for this computer
+        pass
+
+
+def invalidate_user(user_id):
+    cache.delete(_user_key(user_id))
+
+
+async def ainvalidate_user(user_id):
+    await cache.adelete(_user_key(user_id))
+
+
+def invalidate_on_commit(computer_ids=(), user_ids=()):
+    '''Invalidate computers' responses and users' pointers once the current transaction commits'''
+    computer_ids, user_ids = list(computer_ids), [user_id for user_id in user_ids if user_id]
+
+    def invalidate():
+        for computer_id in computer_ids:
+            invalidate_computer(computer_id)
+        for user_id in user_ids:
+            invalidate_user(user_id)
+
+    transaction.on_commit(invalidate)
+
+
+CHOICES_KEYS = {'department': 'admin:choices:department', 'role': 'admin:choices:role'}
+
+
+def department_choices():
+    return cache.get_or_set(
+        CHOICES_KEYS['department'],
+        lambda: list(Department.objects.order_by('name').values_list('pk', 'name')),
+        None,
+    )
+
+
+def role_choices():
+    return cache.get_or_set(
+        CHOICES_KEYS['role'],
+        lambda: [
+            (pk, f"{department} - {name}")
+            for pk, department, name in Role.objects.order_by('department__name', 'name').values_list(
+                'pk', 'department__name', 'name'
+            )
+        ],
+        None,
+    )
+
+
+def invalidate_choices():
+    cache.delete_many(CHOICES_KEYS.values())
@@ -0,0 +1,102 @@
+'''
+The HardwareModel catalogue behind ComputerInfo.
+
+Every ComputerInfo points at the catalogue row for its brand, model and specs. Spellings
+that differ only in case or surrounding spaces share a row, and storage sizes such as
+"1 TB" are also kept as whole GB. The catalogue is small and changes rarely, so each
+process keeps all of it in memory and reloads it every HARDWARE_CATALOGUE_CACHE_SECONDS.
+A configuration missing from the cache is looked up, or created, in the database.
+'''
+import re
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import ComputerInfo, HardwareModel
+
+SPEC_FIELDS = ['brand', 'name', 'screen_type', 'screen_aspect_ratio', 'memory_size', 'storage_type', 'storage_size']
+STORAGE_PATTERN = re.compile(r'^\s*(?P<size>\d+(?:\.\d+)?)\s*(?P<unit>GB|TB)\s*$', re.IGNORECASE)
+
+_cache = {'loaded': None, 'models': {}}
+
+
+def cache_seconds():
+    return getattr(settings, 'HARDWARE_CATALOGUE_CACHE_SECONDS', 300)
+
+
+def storage_gb(text):
+    '''Whole GB in a size like "512 GB" or "1 TB" (1024 GB), or None when it cannot be read'''
+    match = STORAGE_PATTERN.match(text or '')
+    if match is None:
+        return None
+    size = float(match['size'])
+    return round(size * 1024 if match['unit'].upper() == 'TB' else size)
+
+
+def spec_key(brand, name, screen_type, screen_aspect_ratio, memory_size, storage_type, storage_size_gb):
+    return (
+        (brand or '').strip().casefold(), (name or '').strip().casefold(), screen_type, screen_aspect_ratio,
+        memory_size, storage_type, storage_size_gb,
+    )
+
+
+def _model_key(model):
+    return spec_key(
+        model.brand, model.name, model.screen_type, model.screen_aspect_ratio, model.memory_size,
+        model.storage_type, model.storage_size_gb,
+    )
+
+
+def catalogue():
+    '''{spec key: HardwareModel} for the whole catalogue, from this process's cache'''
+    if _cache['loaded'] is None or time.monotonic() - _cache['loaded'] > cache_seconds():
+        _cache['models'] = {_model_key(model): model for model in HardwareModel.objects.all()}
+        _cache['loaded'] = time.monotonic()
+    return _cache['models']
+
+
+def clear():
+    _cache['loaded'] = None
+
+
+def resolve(brand, name, screen_type, screen_aspect_ratio, memory_size, storage_type, storage_size):
+    '''The catalogue row for a configuration, created if it is new'''
+    size_gb = storage_gb(storage_size)
+    key = spec_key(brand, name, screen_type, screen_aspect_ratio, memory_size, storage_type, size_gb)
+    model = catalogue().get(key)
+    if model is not None:
+        return model
+
+    model, _ = HardwareModel.objects.get_or_create(
+        brand__iexact=key[0], name__iexact=key[1], screen_type=screen_type, screen_aspect_ratio=screen_aspect_ratio,
+        memory_size=memory_size, storage_type=storage_type, storage_size_gb=size_gb,
+        defaults={'brand': brand.strip(), 'name': name.strip()},
+    )
+    # cached once committed, so a rolled back row is never handed out
+    transaction.on_commit(lambda: _cache['models'].setdefault(key, model))
+    return model
+
+
+def link(info):
+    '''Point a ComputerInfo about to be saved at its catalogue row, with the catalogue's spelling'''
+    model = resolve(*(getattr(info, field) for field in SPEC_FIELDS))
+    info.hardware_model = model
+    info.brand, info.name, info.storage_size_gb = model.brand, model.name, model.storage_size_gb
+
+
+def normalise(infos=None):
+    '''
+    Link ComputerInfo rows to the catalogue, fill in storage_size_gb and use the catalogue's
+    spelling of brand and model, with one UPDATE per distinct configuration. Creates
+    catalogue rows as needed and returns the number of rows changed.
+    '''
+    infos = ComputerInfo.objects.all() if infos is None else infos
+    configurations = list(infos.order_by().values_list(*SPEC_FIELDS).distinct())
+    changed = 0
+    for values in configurations:
+        model = resolve(*values)
+        changed += infos.filter(**dict(zip(SPEC_FIELDS, values))).exclude(
+            hardware_model=model, brand=model.brand, name=model.name
+        ).update(hardware_model=model, brand=model.brand, name=model.name, storage_size_gb=model.storage_size_gb)
+    return changed
@@ -0,0 +1,114 @@
+'''
+Streaming fleet export.
+
+Rows are read with .values_list() in keyset batches of chunk_size (pk > the last pk
+seen), so neither model instances nor whole result sets are kept in memory, and are
+written out one by one. .iterator() would not do: mysqlclient fetches a whole result
+set into client memory whatever the chunk size.
+'''
+import csv
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import Q
+
+from .models import Computer, ComputerAssignment, ComputerRepairHistory
+
+EXPORT_COLUMNS = [
+    'record_type', 'asset_tag', 'computer_name', 'department', 'status',
+    'brand', 'model', 'memory_gb', 'storage_type', 'storage_size',
+    'employee', 'start_date', 'end_date',
+    'repaired_component', 'date_of_repair', 'repair_cost', 'comments',
+]
+COMPUTER_FIELDS = [
+    'asset_tag', 'computer_name', 'department__name', 'status',
+    'info__brand', 'info__name', 'info__memory_size', 'info__storage_type', 'info__storage_size',
+]
+
+
+class Echo:
+    '''File-like object that hands back whatever csv.writer writes to it'''
+    def write(self, value):
+        return value
+
+
+def _department_filter(department, prefix=''):
+    if not department:
+        return Q()
+    if str(department).isdigit():
+        return Q(**{f'{prefix}department_id': int(department)})
+    return Q(**{f'{prefix}department__name': department})
+
+
+def _batched(queryset, fields, chunk_size):
+    '''values_list rows of queryset, fetched chunk_size at a time in primary key order'''
+    last = None
+    while True:
+        page = queryset if last is None else queryset.filter(pk__gt=last)
+        rows = list(page.order_by('pk').values_list('pk', *fields)[:chunk_size])
+        for row in rows:
+            yield row[1:]
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1][0]
+
+
+def export_rows(start=None, end=None, department=None, chunk_size=2000):
+    '''
+    Yield the header followed by one row per computer, assignment and repair.
+    start/end limit assignments to those overlapping the range and repairs to those inside it.
+    '''
+    yield EXPORT_COLUMNS
+    blank_assignment = [''] * 3
+    blank_repair = [''] * 4
+
+    computers = Computer.objects.filter(_department_filter(department))
+    for row in _batched(computers, COMPUTER_FIELDS, chunk_size):
+        yield ['computer', *row, *blank_assignment, *blank_repair]
+
+    assignments = ComputerAssignment.objects.filter(_department_filter(department, 'computer__'))
+    if start:
+        assignments = assignments.filter(Q(end_date__isnull=True) | Q(end_date__date__gte=start))
+    if end:
+        assignments = assignments.filter(start_date__date__lte=end)
+    assignment_fields = ['computer__' + field for field in COMPUTER_FIELDS]
+    assignment_fields += ['employee__user__username', 'start_date', 'end_date']
+    for row in _batched(assignments, assignment_fields, chunk_size):
+        yield ['assignment', *row, *blank_repair]
+
+    repairs = ComputerRepairHistory.objects.filter(_department_filter(department, 'computer__'))
+    if start:
+        repairs = repairs.filter(date_of_repair__gte=start)
+    if end:
+        repairs = repairs.filter(date_of_repair__lte=end)
+    repair_fields = ['computer__' + field for field in COMPUTER_FIELDS]
+    repair_fields += ['repaired_component', 'date_of_repair', 'repair_cost', 'comments']
+    for row in _batched(repairs, repair_fields, chunk_size):
+        yield ['repair', *row[:len(COMPUTER_FIELDS)], *blank_assignment, *row[len(COMPUTER_FIELDS):]]
+
+
+def stream_csv(rows):
+    '''Encode rows as CSV lines one at a time'''
+    writer = csv.writer(Echo())
+    for row in rows:
+        yield writer.writerow(['' if value is None else value for value in row])
+
+
+def _excel_value(value):
+    # Excel has no time zones; export aware datetimes in UTC
+    if isinstance(value, datetime) and value.tzinfo:
+        return value.astimezone(dt_timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def write_xlsx(rows, path):
+    '''Write rows to an .xlsx file with openpyxl's constant-memory writer'''
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ImportError('XLSX export needs openpyxl: pip install openpyxl')
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Fleet')
+    for row in rows:
+        sheet.append([_excel_value(value) for value in row])
+    workbook.save(path)
@@ -0,0 +1,132 @@
+'''
+Point-in-time state of computers, read from the transition log.
+
+One computer is a single index seek on (asset_tag, occurred_at). The whole fleet starts
+from the latest FleetSnapshot taken at or before the moment and applies only the
+transitions after it, so the cost follows the snapshot interval, not the length of the history.
+Transitions recorded after the snapshot but back-dated before it are not in the snapshot;
+the computers they belong to are replayed from their whole log instead.
+'''
+from datetime import datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Computer, ComputerTransition, ComputerSnapshot, Department, Employee, FleetSnapshot
+
+STATE_FIELDS = ['computer_id', 'asset_tag', 'status', 'employee_id', 'department_id']
+# transitions written while a snapshot was being read may be missing from it, so replay a little before it
+SNAPSHOT_OVERLAP = timedelta(minutes=10)
+
+
+def parse_moment(value):
+    '''A datetime, or a date meaning the end of that day; None if value is neither'''
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            return None
+        moment = datetime.combine(day, time.max)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _describe(states):
+    '''Turn STATE_FIELDS rows into dicts with the employee's username and department name'''
+    users = dict(Employee.objects.filter(
+        pk__in={row[3] for row in states if row[3]}
+    ).values_list('pk', 'user__username'))
+    departments = dict(Department.objects.filter(pk__in={row[4] for row in states}).values_list('pk', 'name'))
+    return [
+        {'asset_tag': tag, 'status': status, 'current_user': users.get(employee_id), 'department': departments.get(department_id)}
+        for _, tag, status, employee_id, department_id in states
+    ]
+
+
+def computer_as_of(asset_tag, moment):
+    '''The computer's state at moment with the time it took that state, or None if it did not exist yet'''
+    transition = ComputerTransition.objects.filter(
+        asset_tag=asset_tag, occurred_at__lte=moment
+    ).order_by('-occurred_at', '-id').values_list(*STATE_FIELDS, 'occurred_at').first()
+    if transition is None:
+        # computers that predate the log are only known from snapshots
+        transition = ComputerSnapshot.objects.filter(
+            asset_tag=asset_tag, snapshot__taken_at__lte=moment
+        ).order_by('-snapshot').values_list(*STATE_FIELDS, 'snapshot__taken_at').first()
+    if transition is None or transition[2] == ComputerTransition.DELETED:
+        return None
+    state = _describe([transition[:5]])[0]
+    state['since'] = transition[5]
+    return state
+
+
+def fleet_as_of(moment, department=None, status=None):
+    '''Every computer that existed at moment with its state then, and the snapshot used (or None)'''
+    snapshot = FleetSnapshot.objects.filter(taken_at__lte=moment).order_by('-taken_at').first()
+    states = {}
+    back_dated = set()
+    transitions = ComputerTransition.objects.filter(occurred_at__lte=moment)
+    if snapshot is not None:
+        for row in snapshot.computers.values_list(*STATE_FIELDS).iterator(chunk_size=2000):
+            states[row[0]] = row
+        since = snapshot.taken_at - SNAPSHOT_OVERLAP
+        transitions = transitions.filter(Q(occurred_at__gt=since) | Q(recorded_at__gt=since))
+    for row in transitions.order_by('occurred_at', 'id').values_list(
+        *STATE_FIELDS, 'occurred_at'
+    ).iterator(chunk_size=2000):
+        if snapshot is not None and row[5] <= since:
+            back_dated.add(row[0])
+        else:
+            states[row[0]] = row[:5]
+    if back_dated:
+        # the snapshot already holds a later state than these rows; replay those computers as computer_as_of reads them
+        for row in ComputerTransition.objects.filter(
+            computer_id__in=back_dated, occurred_at__lte=moment
+        ).order_by('occurred_at', 'id').values_list(*STATE_FIELDS).iterator(chunk_size=2000):
+            states[row[0]] = row
+
+    rows = sorted(
+        (row for row in states.values()
+         if row[2] != ComputerTransition.DELETED
+         and (department is None or row[4] == department)
+         and (status is None or row[2] == status)),
+        key=lambda row: row[1],
+    )
+    return _describe(rows), snapshot
+
+
+def take_snapshot(batch_size=2000):
+    with transaction.atomic():
+        snapshot = FleetSnapshot.objects.create(taken_at=timezone.now())
+        batch = []
+        count = 0
+        computers = Computer.objects.order_by('pk').values_list('pk', 'asset_tag', 'status', 'current_user_id', 'department_id')
+        for computer_id, asset_tag, status, employee_id, department_id in computers.iterator(chunk_size=batch_size):
+            batch.append(ComputerSnapshot(
+                snapshot=snapshot, computer_id=computer_id, asset_tag=asset_tag, status=status,
+                employee_id=employee_id, department_id=department_id,
+            ))
+            if len(batch) == batch_size:
+                ComputerSnapshot.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        ComputerSnapshot.objects.bulk_create(batch)
+        snapshot.computer_count = count + len(batch)
+        snapshot.save(update_fields=['computer_count'])
+    return snapshot
+
+
+def prune_snapshots(keep):
+    '''Delete all but the newest keep snapshots'''
+    old = FleetSnapshot.objects.order_by('-taken_at').values_list('pk', flat=True)[keep:]
+    return FleetSnapshot.objects.filter(pk__in=list(old)).delete()[1].get(FleetSnapshot._meta.label, 0)
+
+
+def record_deletion(computer):
+    ComputerTransition.objects.create(
+        computer_id=computer.pk, asset_tag=computer.asset_tag, department_id=computer.department_id,
+        from_status=computer.status, status=ComputerTransition.DELETED,
+    )
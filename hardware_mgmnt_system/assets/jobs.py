@@ -0,0 +1,229 @@
+'''
+A database-backed queue for side effects that do not have to finish inside the request.
+
+enqueue() collects jobs while a transaction runs and writes them with one INSERT when it
+commits. A job whose key is already queued is dropped, because the queued one will do
+the same work. The run_jobs command claims due jobs with SELECT ... FOR UPDATE SKIP LOCKED
+where the database supports it, so several workers can share the queue. It runs the jobs
+and retries failures with exponential backoff. Several workers on SQLite need
+OPTIONS={'transaction_mode': 'IMMEDIATE'}, or jobs fail with "database is locked" and wait for a retry.
+'''
+import os
+import socket
+import threading
+import time
+import traceback
+from collections import defaultdict
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from .models import Job
+
+DEFAULT_SETTINGS = {
+    'ENABLED': False,
+    'MAX_ATTEMPTS': 5,
+    # seconds before the first retry, doubled for every further attempt up to MAX_BACKOFF
+    'RETRY_BACKOFF': 10,
+    'MAX_BACKOFF': 3600,
+    # running jobs older than this are assumed lost with their worker and retried
+    'TIMEOUT': 600,
+    # seconds finished jobs are kept for the stats
+    'RETENTION': 86400,
+}
+
+_tasks = {}
+_pending = threading.local()
+
+
+def queue_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'JOB_QUEUE', {})}
+
+
+def enabled():
+    return queue_settings()['ENABLED']
+
+
+def task(name, batch=False):
+    '''Register a task; a batch task is called once with the payloads of all the jobs claimed together'''
+    def register(func):
+        _tasks[name] = (func, batch)
+        return func
+    return register
+
+
+def _flush():
+    jobs = getattr(_pending, 'jobs', None)
+    if not jobs:
+        return
+    _pending.jobs = {}
+    now = timezone.now()
+    # keys that are already queued hit one_queued_job_per_key and are skipped
+    Job.objects.bulk_create([
+        Job(task=name, key=key, payload=payload, created_at=now, run_after=now)
+        for key, (name, payload) in jobs.items()
+    ], ignore_conflicts=True)
+
+
+def enqueue_many(name, payloads):
+    '''
+    Queue a job per key of payloads when the current transaction commits. Jobs queued
+    with the same key in one transaction collapse into the last one; keys left over
+    from a rollback are written with the next commit.
+    '''
+    if not hasattr(_pending, 'jobs'):
+        _pending.jobs = {}
+    _pending.jobs.update((key, (name, payload)) for key, payload in payloads.items())
+    transaction.on_commit(_flush)
+
+
+def enqueue(name, key, **payload):
+    enqueue_many(name, {key: payload})
+
+
+def claim(worker, limit):
+    now = timezone.now()
+    due = Job.objects.filter(status=Job.QUEUED, run_after__lte=now).order_by('run_after')
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    # without SKIP LOCKED (SQLite) the status check in the UPDATE alone keeps two workers
+    # from taking the same job, and a read-then-write transaction would only add lock errors
+    with transaction.atomic() if skip_locked else nullcontext():
+        if skip_locked:
+            due = due.select_for_update(skip_locked=True)
+        ids = list(due.values_list('pk', flat=True)[:limit])
+        if not ids:
+            return []
+        Job.objects.filter(pk__in=ids, status=Job.QUEUED).update(
+            status=Job.RUNNING, started_at=now, claimed_by=worker, attempts=F('attempts') + 1
+        )
+    return list(Job.objects.filter(pk__in=ids, status=Job.RUNNING, claimed_by=worker).order_by('pk'))
+
+
+def retry(jobs, error):
+    '''Queue the jobs again after their backoff, or fail those out of attempts'''
+    options = queue_settings()
+    now = timezone.now()
+    for job in jobs:
+        if job.attempts >= options['MAX_ATTEMPTS']:
+            Job.objects.filter(pk=job.pk).update(status=Job.FAILED, finished_at=now, last_error=error)
+            continue
+        delay = min(options['RETRY_BACKOFF'] * 2 ** (job.attempts - 1), options['MAX_BACKOFF'])
+        try:
+            with transaction.atomic():
+                Job.objects.filter(pk=job.pk).update(
+                    status=Job.QUEUED, run_after=now + timedelta(seconds=delay), last_error=error
+                )
+        except IntegrityError:
+            # the key was queued again meanwhile, and that job will redo the work
+            Job.objects.filter(pk=job.pk).delete()
+
+
+def _run(jobs, call):
+    try:
+        with transaction.atomic():
+            call()
+    except Exception:
+        retry(jobs, traceback.format_exc())
+        return 0
+    Job.objects.filter(pk__in=[job.pk for job in jobs]).update(
+        status=Job.DONE, finished_at=timezone.now(), last_error=''
+    )
+    return len(jobs)
+
+
+def run_claimed(jobs):
+    '''Run claimed jobs, each in its own transaction; returns how many succeeded'''
+    by_task = defaultdict(list)
+    for job in jobs:
+        by_task[job.task].append(job)
+
+    succeeded = 0
+    for name, group in by_task.items():
+        if name not in _tasks:
+            Job.objects.filter(pk__in=[job.pk for job in group]).update(
+                status=Job.FAILED, finished_at=timezone.now(), last_error=f"Unknown task {name}"
+            )
+            continue
+        func, batch = _tasks[name]
+        if batch:
+            succeeded += _run(group, lambda: func([job.payload for job in group]))
+        else:
+            for job in group:
+                succeeded += _run([job], lambda: func(**job.payload))
+    return succeeded
+
+
+def requeue_stale():
+    stale = list(Job.objects.filter(
+        status=Job.RUNNING, started_at__lt=timezone.now() - timedelta(seconds=queue_settings()['TIMEOUT'])
+    ))
+    retry(stale, 'Timed out; the worker running it probably died')
+    return len(stale)
+
+
+def prune():
+    cutoff = timezone.now() - timedelta(seconds=queue_settings()['RETENTION'])
+    return Job.objects.filter(status=Job.DONE, finished_at__lt=cutoff).delete()[0]
+
+
+def work(batch=100, sleep=1.0, burst=False, stop=None):
+    '''
+    Claim and run jobs until stop is set, or with burst until the queue has no due jobs.
+    Returns the number of jobs that succeeded.
+    '''
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    pause = stop.wait if stop is not None else time.sleep
+    succeeded = 0
+    housekeeping = 0
+    while stop is None or not stop.is_set():
+        try:
+            if time.monotonic() - housekeeping > 60:
+                requeue_stale()
+                prune()
+                housekeeping = time.monotonic()
+            jobs = claim(worker, batch)
+        except OperationalError:
+            # lock timeouts, lost connections: start over with a new connection
+            connection.close()
+            pause(sleep)
+            continue
+        if jobs:
+            succeeded += run_claimed(jobs)
+        elif burst:
+            break
+        else:
+            pause(sleep)
+    return succeeded
+
+
+def stats(window=timedelta(hours=1), sample=10000):
+    '''Queue depth by status and task, and the latency from enqueue to finish over the last window'''
+    now = timezone.now()
+    depth = dict(Job.objects.order_by().values_list('status').annotate(count=Count('id')))
+    queued = [
+        {'task': row['task'], 'count': row['count'],
+         'oldest_seconds': round((now - row['oldest']).total_seconds(), 3)}
+        for row in Job.objects.filter(status=Job.QUEUED).order_by().values('task').annotate(
+            count=Count('id'), oldest=Min('created_at')
+        )
+    ]
+    latencies = sorted(
+        (finished - created).total_seconds()
+        for created, finished in Job.objects.filter(
+            status=Job.DONE, finished_at__gte=now - window
+        ).order_by('-finished_at').values_list('created_at', 'finished_at')[:sample]
+    )
+
+    def percentile(fraction):
+        return round(latencies[min(int(len(latencies) * fraction), len(latencies) - 1)], 3) if latencies else None
+
+    return {
+        'depth': {status: depth.get(status, 0) for status, _ in Job.STATUS_CHOICES},
+        'queued': queued,
+        'done_in_window': len(latencies),
+        'latency_seconds': {'p50': percentile(.5), 'p95': percentile(.95), 'max': percentile(1)},
+    }
@@ -0,0 +1,160 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from importlib import import_module
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.utils import timezone
+
+from assets.benchmarks import percentile, private_cache, throwaway_database
+from assets.models import Department, Role, Employee, Computer, ComputerAssignment
+
+PREFIX = 'asgibench-'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare requests/second of the dashboard under the WSGI and ASGI handlers with many concurrent '
+        'signed-in clients. WSGI requests are served by a pool of threads, like a threaded WSGI server; '
+        'ASGI requests all run on one event loop, like a uvicorn worker. The synthetic employees are '
+        'committed so the server threads can see them, into a test database created for the run and '
+        'dropped afterwards; responses are cached in a private in-process cache.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=500)
+        parser.add_argument('--requests', type=int, default=4, help='requests per client')
+        parser.add_argument('--wsgi-threads', type=int, default=32)
+
+    def handle(self, *args, **options):
+        engine = settings.DATABASES['default']['ENGINE']
+        with throwaway_database(), private_cache():
+            self.benchmark(engine, options)
+
+    def benchmark(self, engine, options):
+        sessions = self.create_clients(options['clients'])
+        runs = [
+            ('wsgi', '/api/ITAMS/my_computer/', self.run_wsgi),
+            ('asgi, sync view', '/api/ITAMS/my_computer/', self.run_asgi),
+            ('asgi, async view', '/api/ITAMS/async/my_computer/', self.run_asgi),
+        ]
+        self.stdout.write(
+            f"{options['clients']} clients x {options['requests']} requests, "
+            f"{options['wsgi_threads']} WSGI threads, {engine}"
+        )
+        self.stdout.write(f"{'handler':<18} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for name, url, run in runs:
+            # the private cache, so every handler starts cold
+            cache.clear()
+            started = time.perf_counter()
+            results = run(url, sessions, options)
+            elapsed = time.perf_counter() - started
+            timings = [ms for code, ms in results]
+            errors = sum(1 for code, ms in results if code != 200)
+            self.stdout.write(
+                f"{name:<18} {len(results) / elapsed:>8.0f} {percentile(timings, .5):>8.2f} "
+                f"{percentile(timings, .99):>8.2f} {errors:>7}"
+            )
+
+    def create_clients(self, count):
+        department = Department.objects.create(name='ASGI Benchmark')
+        role = Role.objects.create(department=department, name='ASGI Benchmark')
+        User.objects.bulk_create([User(username=f"{PREFIX}{i}") for i in range(count)], batch_size=1000)
+        users = list(User.objects.filter(username__startswith=PREFIX).order_by('pk'))
+        Employee.objects.bulk_create([
+            Employee(user=user, department=department, role=role, gender='F') for user in users
+        ], batch_size=1000)
+        employees = Employee.objects.filter(user__in=users).order_by('user_id')
+
+        Computer.objects.bulk_create([
+            Computer(computer_name='Bench', asset_tag=f"{PREFIX.upper()}{i}", department=department, status='Issued')
+            for i in range(count)
+        ], batch_size=1000)
+        computers = Computer.objects.filter(asset_tag__startswith=PREFIX.upper()).order_by('pk')
+        ComputerAssignment.objects.bulk_create([
+            ComputerAssignment(computer=computer, employee=employee, start_date=timezone.now())
+            for computer, employee in zip(computers, employees)
+        ], batch_size=1000)
+
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        sessions = []
+        for user in users:
+            session = store()
+            session[SESSION_KEY] = str(user.pk)
+            session[BACKEND_SESSION_KEY] = 'django.contrib.auth.backends.ModelBackend'
+            session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+            session.create()
+            sessions.append(session.session_key)
+        return sessions
+
+    def run_wsgi(self, url, sessions, options):
+        handler = WSGIHandler()
+
+        def client(session_key):
+            factory = RequestFactory(HTTP_HOST='localhost', HTTP_COOKIE=f"{settings.SESSION_COOKIE_NAME}={session_key}")
+            results = []
+            for _ in range(options['requests']):
+                status = []
+                started = time.perf_counter()
+                response = handler(factory.get(url).environ, lambda code, headers: status.append(code))
+                for _ in response:
+                    pass
+                response.close()
+                results.append((int(status[0].split()[0]), (time.perf_counter() - started) * 1000))
+            return results
+
+        with ThreadPoolExecutor(max_workers=options['wsgi_threads']) as pool:
+            return [result for results in pool.map(client, sessions) for result in results]
+
+    def run_asgi(self, url, sessions, options):
+        handler = ASGIHandler()
+
+        async def request(session_key):
+            scope = {
+                'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+                'scheme': 'http', 'path': url, 'raw_path': url.encode(), 'query_string': b'', 'root_path': '',
+                'headers': [(b'host', b'localhost'), (b'cookie', f"{settings.SESSION_COOKIE_NAME}={session_key}".encode())],
+                'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+            }
+            sent = asyncio.Event()
+            messages = iter([{'type': 'http.request', 'body': b'', 'more_body': False}])
+            status = []
+
+            async def receive():
+                message = next(messages, None)
+                if message is None:
+                    # the client stays connected until the response is sent
+                    await sent.wait()
+                    return {'type': 'http.disconnect'}
+                return message
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+                elif not message.get('more_body'):
+                    sent.set()
+
+            await handler(scope, receive, send)
+            return status[0]
+
+        async def client(session_key):
+            results = []
+            for _ in range(options['requests']):
+                started = time.perf_counter()
+                code = await request(session_key)
+                results.append((code, (time.perf_counter() - started) * 1000))
+            return results
+
+        async def run():
+            return await asyncio.gather(*(client(session_key) for session_key in sessions))
+
+        # async_to_sync runs the ORM's thread sensitive calls on this thread, as an ASGI server would on its main thread
+        return [result for results in async_to_sync(run)() for result in results]
@@ -0,0 +1,100 @@
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from assets import caching, rollups
+from assets.benchmarks import percentile
+from assets.models import Department, Role, Employee, Computer, ComputerAssignment, ComputerRepairHistory
+from assets.views import UserComputerView
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure /my_computer/ latency and query count against repair history length, '
+        'with the response cache invalidated before every request and with it warm. '
+        'The benchmark data is created inside a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repairs', default='0,10,100,1000,5000', help='comma separated history lengths')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--repairs-limit', type=int, default=20, help='page size for the paged run')
+
+    def handle(self, *args, **options):
+        try:
+            lengths = [int(length) for length in options['repairs'].split(',')]
+        except ValueError:
+            raise CommandError('--repairs must be a comma separated list of integers')
+
+        self.stdout.write(f"{'repairs':>8} {'mode':>6} {'queries':>8} {'p50 ms':>8} {'p95 ms':>8} {'bytes':>10}")
+        with transaction.atomic():
+            computer, user = self.create_fixture()
+            created = 0
+            for length in sorted(lengths):
+                self.add_repairs(computer, length - created)
+                created = length
+                modes = [
+                    ('full', {}, True),
+                    ('paged', {'repairs_limit': options['repairs_limit']}, True),
+                    ('cached', {}, False),
+                ]
+                for mode, params, cold in modes:
+                    row = self.measure(computer, user, params, options['iterations'], cold)
+                    self.stdout.write(
+                        f"{length:>8} {mode:>6} {row['queries']:>8} {row['p50']:>8.2f} {row['p95']:>8.2f} {row['bytes']:>10}"
+                    )
+            transaction.set_rollback(True)
+
+    def create_fixture(self):
+        department = Department.objects.create(name='Benchmark Department')
+        role = Role.objects.create(department=department, name='Benchmark Role')
+        # bulk_create skips create_employee_profile, which cannot build an Employee on its own
+        User.objects.bulk_create([User(username='benchmark-user')])
+        user = User.objects.get(username='benchmark-user')
+        employee = Employee.objects.create(user=user, department=department, role=role, gender='F')
+        computer = Computer.objects.create(computer_name='Benchmark', department=department)
+        ComputerAssignment.objects.create(computer=computer, employee=employee, start_date=timezone.now())
+        return computer, user
+
+    def add_repairs(self, computer, count):
+        today = timezone.now().date()
+        ComputerRepairHistory.objects.bulk_create([
+            ComputerRepairHistory(
+                computer=computer, repaired_component='RAM', repair_cost='25.00',
+                date_of_repair=today - timedelta(days=i % 3650), comments='benchmark repair'
+            ) for i in range(count)
+        ], batch_size=1000)
+        rollups.rebuild_computer_totals([computer.pk])
+
+    def authenticated(self, factory, user, params):
+        request = factory.get('/api/ITAMS/my_computer/', params)
+        force_authenticate(request, user=user)
+        return request
+
+    def measure(self, computer, user, params, iterations, cold):
+        factory = APIRequestFactory()
+        view = UserComputerView.as_view()
+        timings = []
+        view(self.authenticated(factory, user, params))
+        for _ in range(iterations):
+            if cold:
+                caching.invalidate_computer(computer.pk)
+            request = self.authenticated(factory, user, params)
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = view(request)
+                response.render()
+                timings.append((time.perf_counter() - started) * 1000)
+
+        return {
+            'queries': len(queries),
+            'p50': percentile(timings, .5),
+            'p95': percentile(timings, .95),
+            'bytes': len(response.content),
+        }
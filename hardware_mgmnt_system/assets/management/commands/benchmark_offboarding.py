@@ -0,0 +1,71 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from assets.models import Department, Role, Employee, Computer, ComputerAssignment
+from assets.services import QueryCounter, delete_users
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete synthetic users that each hold a computer, one at a time and as a batch, '
+        'and report the queries and time spent. The data is created inside a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--history', type=int, default=3, help='ended assignments per user')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            department = Department.objects.create(name='Offboarding Benchmark')
+            role = Role.objects.create(department=department, name='Offboarding Benchmark')
+
+            for mode in ('one by one', 'batch'):
+                prefix = f"offboard-{mode.replace(' ', '')}-"
+                self.create_users(prefix, options['users'], options['history'], department, role)
+                users = User.objects.filter(username__startswith=prefix)
+
+                counter = QueryCounter()
+                started = time.perf_counter()
+                with connection.execute_wrapper(counter):
+                    if mode == 'batch':
+                        delete_users(users)
+                    else:
+                        for user in users.iterator():
+                            user.delete()
+                elapsed = time.perf_counter() - started
+
+                stale = Computer.objects.filter(department=department, status='Issued').count()
+                self.stdout.write(
+                    f"{mode:>10}: {options['users']} users in {elapsed:.2f}s, {counter.count} queries "
+                    f"({counter.count / options['users']:.1f}/user), {stale} computer(s) left Issued"
+                )
+            transaction.set_rollback(True)
+
+    def create_users(self, prefix, count, history, department, role):
+        User.objects.bulk_create([User(username=f"{prefix}{i}") for i in range(count)], batch_size=1000)
+        users = User.objects.filter(username__startswith=prefix).order_by('pk')
+        Employee.objects.bulk_create([
+            Employee(user=user, department=department, role=role, gender='F') for user in users
+        ], batch_size=1000)
+        employees = list(Employee.objects.filter(user__in=users).order_by('pk'))
+
+        Computer.objects.bulk_create([
+            Computer(computer_name='Offboard', asset_tag=f"{prefix.upper()}{i}", department=department, status='Issued')
+            for i in range(count)
+        ], batch_size=1000)
+        computers = list(Computer.objects.filter(asset_tag__startswith=prefix.upper()).order_by('pk'))
+        for computer, employee in zip(computers, employees):
+            computer.current_user = employee
+        Computer.objects.bulk_update(computers, ['current_user'], batch_size=1000)
+
+        now = timezone.now()
+        ComputerAssignment.objects.bulk_create([
+            ComputerAssignment(computer=computer, employee=employee, start_date=now, end_date=None if n == 0 else now)
+            for computer, employee in zip(computers, employees)
+            for n in range(history + 1)
+        ], batch_size=1000)
@@ -0,0 +1,214 @@
+import json
+import platform
+from itertools import count
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from assets import benchmarks
+from assets.models import Computer, ComputerAssignment, Employee
+from assets.services import bulk_return
+from assets.serializers import UserComputerSerializer
+from assets.views import my_computer_queryset, repairs_page_queryset, set_repair_page
+
+ADMIN_PAGES = {
+    'admin_computer_changelist': '/admin/assets/computer/',
+    'admin_repair_changelist': '/admin/assets/computerrepairhistory/',
+    'admin_employee_changelist': '/admin/assets/employee/',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate a seeded synthetic fleet and time the hot paths: Computer.save, assignment create/end '
+        'through the signals, UserComputerSerializer, the admin changelists and login. Prints JSON with '
+        'p50/p95/p99 latency and query counts; --compare flags regressions against an earlier run. '
+        'Everything is created inside a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--employees', type=int, default=500)
+        parser.add_argument('--computers', type=int, default=1000)
+        parser.add_argument('--repairs', type=float, default=2.0, help='average repairs per computer')
+        parser.add_argument('--churn', type=int, default=2, help='ended assignments per computer')
+        parser.add_argument('--years', type=int, default=3, help='years of history')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--login-iterations', type=int, default=10, help='logins run the password hasher')
+        parser.add_argument('--output', help='write the JSON here instead of stdout')
+        parser.add_argument('--compare', help='JSON from an earlier run to compare against')
+        parser.add_argument('--threshold', type=float, default=1.25, help='p50 ratio counted as a regression')
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1 or options['login_iterations'] < 1:
+            raise CommandError('--iterations and --login-iterations must be positive')
+        baseline = self.load(options['compare']) if options['compare'] else None
+
+        # a private cache, so the shared one is neither read nor cleared
+        with benchmarks.private_cache(), transaction.atomic():
+            fleet = benchmarks.generate_fleet(
+                employees=options['employees'], computers=options['computers'], repairs=options['repairs'],
+                churn=options['churn'], years=options['years'], seed=options['seed'],
+            )
+            results = self.run(options)
+            transaction.set_rollback(True)
+
+        report = {
+            'meta': {
+                'started': timezone.now().isoformat(),
+                'seed': options['seed'],
+                'fleet': fleet,
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'results': results,
+        }
+        body = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(body + '\n')
+        else:
+            self.stdout.write(body)
+
+        if baseline is not None:
+            # keep stdout valid JSON when the report is printed there
+            out = self.stdout if options['output'] else self.stderr
+            regressions = self.compare(baseline, results, options['threshold'], out)
+            if regressions:
+                raise CommandError(f"{regressions} regression(s) against {options['compare']}")
+
+    def load(self, path):
+        try:
+            with open(path) as baseline:
+                return json.load(baseline)['results']
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f"Cannot read {path}: {exc}")
+
+    def run(self, options):
+        iterations = options['iterations']
+        results = {}
+
+        computers = list(Computer.objects.filter(asset_tag__startswith='BENCH-').order_by('pk')[:iterations + 1])
+        renames = count()
+
+        def rename(i):
+            computer = computers[i % len(computers)]
+            computer.computer_name = f"Bench {next(renames)}"
+            return (computer,)
+
+        results['computer_save'] = benchmarks.measure(lambda computer: computer.save(), iterations, rename)
+        results['computer_create'] = benchmarks.measure(
+            lambda: Computer.objects.create(computer_name='Bench New', department_id=computers[0].department_id),
+            iterations,
+        )
+
+        pairs = self.free_pairs(iterations + 1)
+
+        def assign(computer_id, employee_id):
+            return ComputerAssignment.objects.create(
+                computer_id=computer_id, employee_id=employee_id, start_date=timezone.now()
+            )
+
+        def end(assignment):
+            assignment.end_date = timezone.now()
+            assignment.save()
+
+        opened = []
+
+        def before_assign(i):
+            # end the previous round's assignment, its pair may come round again
+            if opened:
+                end(opened.pop())
+            return pairs[i % len(pairs)]
+
+        results['assignment_create'] = benchmarks.measure(
+            lambda computer_id, employee_id: opened.append(assign(computer_id, employee_id)),
+            iterations, before_assign,
+        )
+        for assignment in opened:
+            end(assignment)
+        results['assignment_end'] = benchmarks.measure(
+            end, iterations, lambda i: (assign(*pairs[i % len(pairs)]),)
+        )
+
+        holder = User.objects.filter(
+            employee_profile__computer_assignments__end_date__isnull=True, username__startswith='bench-user-'
+        ).order_by('pk').first()
+
+        def serialize():
+            computer = my_computer_queryset(holder).first()
+            set_repair_page(computer, list(repairs_page_queryset(computer, None)), None)
+            return UserComputerSerializer(computer).data
+
+        results['user_computer_serializer'] = benchmarks.measure(serialize, iterations)
+
+        # bulk_create skips create_employee_profile, which cannot build an Employee on its own
+        User.objects.bulk_create([User(username='bench-staff', is_staff=True, is_superuser=True)])
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(User.objects.get(username='bench-staff'))
+        for name, url in ADMIN_PAGES.items():
+            results[name] = benchmarks.measure(lambda url=url: self.get(client, url), iterations)
+
+        login_client = Client(HTTP_HOST='localhost')
+        credentials = {'username': holder.username, 'password': benchmarks.PASSWORD}
+        # the rate limiter would lock the benchmark user out after a few logins
+        with override_settings(LOGIN_RATE_LIMITS={}):
+            results['login'] = benchmarks.measure(
+                lambda: self.post(login_client, '/api/ITAMS/login/', credentials),
+                options['login_iterations'],
+            )
+        return results
+
+    def free_pairs(self, wanted):
+        '''Pairs of a computer in stock and an employee without a computer, returning issued computers if short'''
+        def pairs():
+            free_computers = Computer.objects.filter(
+                asset_tag__startswith='BENCH-', status='Inventory'
+            ).order_by('pk').values_list('pk', flat=True)
+            free_employees = Employee.objects.filter(user__username__startswith='bench-user-').exclude(
+                computer_assignments__end_date__isnull=True
+            ).order_by('pk').values_list('pk', flat=True)
+            return list(zip(free_computers, free_employees))[:wanted]
+
+        found = pairs()
+        if len(found) < wanted:
+            # with fewer employees than issued computers everyone holds one, so free a few holders
+            issued = Computer.objects.filter(asset_tag__startswith='BENCH-', status='Issued').order_by('pk')
+            bulk_return(list(issued.values_list('pk', flat=True)[:wanted - len(found)]))
+            found = pairs()
+        if not found:
+            raise CommandError('The fleet has no computers to assign')
+        return found
+
+    def get(self, client, url):
+        response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f"GET {url} returned {response.status_code}")
+
+    def post(self, client, url, data):
+        response = client.post(url, data, content_type='application/json')
+        if response.status_code != 200:
+            raise CommandError(f"POST {url} returned {response.status_code}")
+
+    def compare(self, baseline, results, threshold, out):
+        regressions = 0
+        write = out.write
+        write(f"{'benchmark':<28} {'p50 ms':>9} {'was':>9} {'ratio':>6} {'queries':>8} {'was':>5}")
+        for name, row in results.items():
+            old = baseline.get(name)
+            if old is None:
+                write(f"{name:<28} {row['p50_ms']:>9.2f} {'-':>9}")
+                continue
+            ratio = row['p50_ms'] / old['p50_ms'] if old['p50_ms'] else 1
+            slower = ratio > threshold or row.get('queries', 0) > old.get('queries', 0)
+            regressions += slower
+            write(
+                f"{name:<28} {row['p50_ms']:>9.2f} {old['p50_ms']:>9.2f} {ratio:>6.2f} "
+                f"{row.get('queries', '-'):>8} {old.get('queries', '-'):>5}{'  REGRESSION' if slower else ''}"
+            )
+        return regressions
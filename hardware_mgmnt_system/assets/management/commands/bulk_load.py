@@ -0,0 +1,53 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError
+
+from assets import bulkload
+
+
+class Command(BaseCommand):
+    help = (
+        'Load a large fixture-style JSON file (an array or JSON Lines of {"model", "pk", "fields"}) or a CSV '
+        'of one model with bulk inserts, skipping the per-row signals, then rebuild computer status, '
+        'rollups, search documents and summaries once. A failed load resumes from its checkpoint with --resume.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'json'], help='defaults to the file extension')
+        parser.add_argument('--model', help='the model a CSV holds, e.g. assets.computerrepairhistory')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='records per transaction')
+        parser.add_argument('--checkpoint', help='defaults to <path>.checkpoint')
+        parser.add_argument('--resume', action='store_true', help='continue after the records the checkpoint covers')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'json')
+        checkpoint = options['checkpoint'] or f"{path}.checkpoint"
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        if os.path.exists(checkpoint) and not options['resume']:
+            raise CommandError(f"{checkpoint} exists from an earlier load: pass --resume, or delete it to start over")
+
+        try:
+            with open(path, newline='', encoding='utf-8') as stream:
+                records = bulkload.read_records(stream, fmt, options['model'])
+                result = bulkload.load(records, checkpoint, options['chunk_size'], options['resume'])
+        except (OSError, ValueError) as exc:
+            raise CommandError(exc)
+        except DatabaseError as exc:
+            state = bulkload.read_checkpoint(checkpoint)
+            done = state['records'] if state else 0
+            raise CommandError(f"{exc}\n{done} record(s) are loaded; fix the data and run again with --resume")
+
+        for error in result['errors']:
+            self.stderr.write(f"record {error['record']}: {'; '.join(error['errors'])}")
+        if result['error_count'] > len(result['errors']):
+            self.stderr.write(f"... and {result['error_count'] - len(result['errors'])} more invalid record(s)")
+
+        created = ', '.join(f"{count} {label}" for label, count in result['created'].items()) or 'nothing'
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {created} from {result['records']} record(s) in {result['seconds']}s "
+            f"({result['records_per_second']} records/s, {result['queries']} queries)"
+        ))
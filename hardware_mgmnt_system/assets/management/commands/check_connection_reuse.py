@@ -0,0 +1,72 @@
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import Client, RequestFactory
+
+
+class Command(BaseCommand):
+    help = (
+        'Send requests through the WSGI handler, the same request cycle a server runs, and report '
+        'how many database connections were opened. With persistent connections (CONN_MAX_AGE > 0) '
+        'or a pool the connection is reused across requests. An in-memory SQLite database is never '
+        'closed, so run this against a file database or MySQL.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--url', default='/api/ITAMS/my_computer/')
+        parser.add_argument('--username', help='user to sign in as (default: the first active user)')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True).order_by('pk')
+        if options['username']:
+            users = users.filter(username=options['username'])
+        user = users.first()
+        if user is None:
+            raise CommandError('No matching active user to sign in as')
+
+        client = Client()
+        client.force_login(user)
+        cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        factory = RequestFactory(HTTP_HOST='localhost', HTTP_COOKIE=cookie)
+        handler = WSGIHandler()
+
+        opened = Counter()
+
+        def count(sender, connection, **kwargs):
+            opened[connection.alias] += 1
+
+        statuses = Counter()
+        connection_created.connect(count)
+        started = time.perf_counter()
+        try:
+            for _ in range(options['requests']):
+                statuses[self.serve(handler, factory.get(options['url']).environ)] += 1
+        finally:
+            connection_created.disconnect(count)
+        elapsed = time.perf_counter() - started
+
+        for alias in connections:
+            settings_dict = connections[alias].settings_dict
+            self.stdout.write(
+                f"{alias}: {opened[alias]} connection(s) opened over {options['requests']} requests "
+                f"(CONN_MAX_AGE={settings_dict['CONN_MAX_AGE']}, pool={'pool' in settings_dict.get('OPTIONS', {})})"
+            )
+        self.stdout.write(
+            f"responses: {dict(statuses)}, {elapsed / max(options['requests'], 1) * 1000:.2f} ms per request"
+        )
+
+    def serve(self, handler, environ):
+        status = []
+        response = handler(environ, lambda code, headers: status.append(code))
+        # closing the response sends request_finished, which closes obsolete connections
+        for _ in response:
+            pass
+        response.close()
+        return int(status[0].split()[0])
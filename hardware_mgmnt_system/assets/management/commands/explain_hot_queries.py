@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+
+from assets.models import Computer, ComputerAssignment, ComputerRepairHistory, Employee
+
+
+class Command(BaseCommand):
+    help = (
+        'Print the database plan (EXPLAIN) for the hot query shapes. '
+        'Run it before and after applying the index migration to compare.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sql', action='store_true', help='also print the SQL of every query')
+
+    def handle(self, *args, **options):
+        computer = Computer.objects.order_by('pk').first()
+        employee = Employee.objects.order_by('pk').first()
+        computer_id = computer.pk if computer else 0
+        user_id = employee.user_id if employee else 0
+        prefix = computer.asset_tag.rsplit('-', 1)[0] if computer else 'DELL-SALES-AND-MARKETING'
+
+        queries = [
+            ('open assignment of a computer', ComputerAssignment.objects.filter(
+                computer_id=computer_id, end_date__isnull=True
+            ).order_by('-start_date')[:1]),
+            ('open assignment of a user', ComputerAssignment.objects.filter(
+                employee__user_id=user_id, end_date__isnull=True
+            ).values('computer_id')[:1]),
+            ('asset tag prefix', Computer.objects.filter(asset_tag__startswith=f"{prefix}-").values('asset_tag')),
+            ('repair history of a computer', ComputerRepairHistory.objects.filter(
+                computer_id=computer_id
+            ).order_by('-date_of_repair', '-id')[:20]),
+        ]
+
+        for name, queryset in queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            if options['sql']:
+                self.stdout.write(str(queryset.query))
+            self.stdout.write(queryset.explain())
+            self.stdout.write('')
@@ -0,0 +1,39 @@
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from assets.exports import export_rows, stream_csv, write_xlsx
+
+
+class Command(BaseCommand):
+    help = 'Export computers, assignments and repairs as CSV or XLSX without loading the fleet into memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', help='file to write; CSV goes to stdout when omitted')
+        parser.add_argument('--format', choices=['csv', 'xlsx'], default='csv')
+        parser.add_argument('--start', type=date.fromisoformat, help='YYYY-MM-DD')
+        parser.add_argument('--end', type=date.fromisoformat, help='YYYY-MM-DD')
+        parser.add_argument('--department', help='department id or name')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        rows = export_rows(
+            start=options['start'], end=options['end'],
+            department=options['department'], chunk_size=options['chunk_size'],
+        )
+
+        if options['format'] == 'xlsx':
+            if not options['output']:
+                raise CommandError('--output is required for XLSX exports')
+            try:
+                write_xlsx(rows, options['output'])
+            except ImportError as exc:
+                raise CommandError(exc)
+            return
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as stream:
+                stream.writelines(stream_csv(rows))
+        else:
+            sys.stdout.writelines(stream_csv(rows))
@@ -0,0 +1,41 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from assets.services import IMPORT_FIELDS, import_computers, read_computer_rows
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk import computers and their ComputerInfo from a CSV or JSON file. '
+        f"CSV columns: {', '.join(IMPORT_FIELDS)}"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'json'], help='defaults to the file extension')
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('json' if path.lower().endswith('.json') else 'csv')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        try:
+            with open(path, newline='', encoding='utf-8') as stream:
+                result = import_computers(read_computer_rows(stream, fmt), chunk_size=options['chunk_size'])
+        except (OSError, json.JSONDecodeError) as exc:
+            raise CommandError(exc)
+
+        for error in result['errors']:
+            self.stderr.write(f"row {error['row']}: {'; '.join(error['errors'])}")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['created']} computer(s) in {result['seconds']}s "
+            f"({result['rows_per_second']} rows/s)"
+        ))
+        self.stdout.write(
+            f"{result['queries']} queries issued, {result['queries_one_by_one']} with one-by-one saves "
+            f"({result['queries_saved']} saved)"
+        )
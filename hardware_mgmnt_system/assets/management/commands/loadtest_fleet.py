@@ -0,0 +1,108 @@
+import time
+from urllib.parse import parse_qs, urlparse
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from assets import catalogue, summaries
+from assets.benchmarks import percentile
+from assets.models import Department, Computer, ComputerInfo
+from assets.views import ComputerListView
+
+SCENARIOS = [
+    ('first page', {}),
+    ('status', {'status': 'Inventory'}),
+    ('department + status', {'department': None, 'status': 'Inventory'}),
+    ('brand + memory', {'brand': 'Lenovo', 'memory_size': '16'}),
+    ('storage type', {'storage_type': 'HDD'}),
+    ('department + memory <16', {'department': None, 'memory_size__lt': '16'}),
+]
+BRANDS = ['Dell', 'HP', 'Lenovo', 'Apple']
+MEMORY = [8, 16, 32]
+
+
+class Command(BaseCommand):
+    help = (
+        'Load test /computers/ at several fleet sizes and print p50/p99 latency per filter, '
+        'both for the first page and for pages reached by following the cursor. '
+        'The synthetic fleet is created inside a transaction that is rolled back.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,100000')
+        parser.add_argument('--requests', type=int, default=100, help='requests per scenario')
+        parser.add_argument('--pages', type=int, default=20, help='pages walked for the deep-page run')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted(int(size) for size in options['sizes'].split(','))
+        except ValueError:
+            raise CommandError('--sizes must be a comma separated list of integers')
+
+        with transaction.atomic():
+            department = Department.objects.first() or Department.objects.create(name='Load Test')
+            User.objects.bulk_create([User(username='loadtest-staff', is_staff=True)])
+            self.user = User.objects.get(username='loadtest-staff')
+            self.view = ComputerListView.as_view()
+            self.factory = APIRequestFactory(HTTP_HOST='localhost')
+
+            created = 0
+            for size in sizes:
+                self.create_fleet(department, created, size)
+                created = size
+                self.stdout.write(f"\n{size} computers")
+                self.stdout.write(f"{'scenario':<24} {'p50 ms':>8} {'p99 ms':>8}")
+                for name, params in SCENARIOS:
+                    params = {key: value or str(department.pk) for key, value in params.items()}
+                    timings = [self.request(params)[0] for _ in range(options['requests'])]
+                    self.stdout.write(f"{name:<24} {percentile(timings, .5):>8.2f} {percentile(timings, .99):>8.2f}")
+
+                timings = self.walk_pages(options['pages'])
+                self.stdout.write(f"{'cursor walk':<24} {percentile(timings, .5):>8.2f} {percentile(timings, .99):>8.2f}")
+            transaction.set_rollback(True)
+
+    def create_fleet(self, department, start, end):
+        for offset in range(start, end, 5000):
+            stop = min(offset + 5000, end)
+            Computer.objects.bulk_create([
+                Computer(
+                    computer_name='Loadtest', asset_tag=f"LOADTEST-{i:07d}", department=department,
+                    status='Faulty' if i % 20 == 0 else 'Inventory'
+                ) for i in range(offset, stop)
+            ])
+            ids = list(Computer.objects.filter(
+                asset_tag__gte=f"LOADTEST-{offset:07d}", asset_tag__lt=f"LOADTEST-{stop:07d}"
+            ).values_list('id', flat=True))
+            infos = [
+                ComputerInfo(
+                    computer_id=computer_id, brand=BRANDS[i % len(BRANDS)], name='Model',
+                    screen_type='IPS', screen_aspect_ratio='16:9', memory_size=MEMORY[i % len(MEMORY)],
+                    storage_type='HDD' if i % 7 == 0 else 'SSD', storage_size='512 GB'
+                ) for i, computer_id in enumerate(ids)
+            ]
+            for info in infos:
+                catalogue.link(info)
+            ComputerInfo.objects.bulk_create(infos)
+            # the listing reads the summaries, which bulk inserts do not maintain
+            summaries.refresh(ids)
+
+    def request(self, params):
+        request = self.factory.get('/api/ITAMS/computers/', params)
+        force_authenticate(request, user=self.user)
+        started = time.perf_counter()
+        response = self.view(request)
+        response.render()
+        return (time.perf_counter() - started) * 1000, response
+
+    def walk_pages(self, pages):
+        timings = []
+        params = {'page_size': 100}
+        for _ in range(pages):
+            elapsed, response = self.request(params)
+            timings.append(elapsed)
+            if not response.data['next']:
+                break
+            params['cursor'] = parse_qs(urlparse(response.data['next']).query)['cursor'][0]
+        return timings
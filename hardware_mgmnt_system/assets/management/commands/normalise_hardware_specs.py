@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from assets import catalogue, search, summaries
+from assets.models import ComputerInfo, HardwareModel
+
+
+class Command(BaseCommand):
+    help = (
+        'Build the HardwareModel catalogue from the distinct ComputerInfo configurations, link every '
+        'ComputerInfo to its row, fill in storage_size_gb and use one spelling per brand and model. '
+        'Unused catalogue rows are removed. Safe to re-run.'
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            changed = catalogue.normalise()
+            unused, _ = HardwareModel.objects.filter(units__isnull=True).delete()
+        if changed:
+            # the search documents and summaries carry brand, model and storage size too
+            search.rebuild()
+            summaries.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"{HardwareModel.objects.count()} hardware model(s) for {ComputerInfo.objects.count()} computer(s); "
+            f"{changed} computer(s) updated, {unused} unused model(s) removed"
+        ))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from assets import summaries
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the ComputerSummary row of every computer behind /my_computer/ and the fleet listing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = summaries.rebuild(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} computer summary row(s)"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from assets import rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the repair cost rollups and per-computer totals from the full repair history'
+
+    def handle(self, *args, **options):
+        monthly, totals = rollups.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {monthly} department/component/month rollup(s) and {totals} computer total(s)"
+        ))
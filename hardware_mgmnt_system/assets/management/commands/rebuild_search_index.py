@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from assets import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild every computer search document and create the full-text index if it is missing.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        search.install_fulltext()
+        count = search.rebuild(options['batch_size'])
+        backend = 'full-text index' if search.fulltext_available() else 'icontains fallback'
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} search document(s), searching with the {backend}"))
@@ -0,0 +1,104 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+from django.db.models import Max, Min
+
+from assets.models import Computer
+from assets.services import computers_changed
+
+RETRIES = 3
+
+
+def close_connections():
+    # forked children must not share the parent's database connections
+    connections.close_all()
+
+
+def reconcile_range(bounds, dry_run=False):
+    '''Reconcile the computers with ids in [start, end); returns the changes found and how many were written'''
+    start, end = bounds
+    computers = Computer.objects.filter(pk__gte=start, pk__lt=end)
+    for attempt in range(RETRIES):
+        try:
+            changes = computers.state_changes()
+            if dry_run or not changes:
+                return changes, 0
+            # a user moving into this range may still be recorded on a computer outside it
+            new_users = {row[6] for row in changes if row[6] is not None}
+            changes += Computer.objects.filter(current_user__in=new_users).exclude(
+                pk__in=[row[0] for row in changes]
+            ).state_changes()
+            computer_ids = [row[0] for row in changes]
+            corrected = Computer.objects.filter(pk__in=computer_ids).reconcile_state()
+            computers_changed(computer_ids)
+            return changes, corrected
+        except OperationalError:
+            # another worker holds the SQLite write lock, or the connection dropped
+            if attempt == RETRIES - 1:
+                raise
+            connection.close()
+            time.sleep(attempt + 1)
+
+
+def reconcile_dry_range(bounds):
+    return reconcile_range(bounds, dry_run=True)
+
+
+def describe(status, employee_id):
+    return f"{status} (employee {employee_id})" if employee_id else f"{status} (no user)"
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute status and current_user of every computer from its open assignments with set-based '
+        'SQL, in id ranges spread over worker processes. Repairs computers left behind by writes that '
+        'skipped the signals; --dry-run prints what would change.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='worker processes to fork')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='computer ids per range')
+        parser.add_argument('--dry-run', action='store_true', help='print the differences without writing them')
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1 or options['chunk_size'] < 1:
+            raise CommandError('--processes and --chunk-size must be positive')
+
+        started = time.perf_counter()
+        bounds = Computer.objects.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            self.stdout.write('No computers to reconcile')
+            return
+        size = options['chunk_size']
+        ranges = [(start, start + size) for start in range(bounds['low'], bounds['high'] + 1, size)]
+        work = reconcile_dry_range if options['dry_run'] else reconcile_range
+
+        if options['processes'] == 1 or len(ranges) == 1:
+            results = map(work, ranges)
+            self.report(results, options, started, len(ranges))
+            return
+
+        # fork, so the children inherit the configured Django instead of importing it again
+        context = multiprocessing.get_context('fork')
+        connections.close_all()
+        with context.Pool(min(options['processes'], len(ranges)), initializer=close_connections) as pool:
+            self.report(pool.imap_unordered(work, ranges), options, started, len(ranges))
+
+    def report(self, results, options, started, range_count):
+        found = corrected = 0
+        for changes, written in results:
+            found += len(changes)
+            corrected += written
+            if options['dry_run'] or options['verbosity'] > 1:
+                for _, asset_tag, _, status, user, new_status, new_user in changes:
+                    self.stdout.write(f"{asset_tag}: {describe(status, user)} -> {describe(new_status, new_user)}")
+
+        elapsed = time.perf_counter() - started
+        summary = (
+            f"{found} computer(s) out of sync, {'none' if options['dry_run'] else corrected} corrected, "
+            f"in {elapsed:.3f}s ({range_count} id range(s) of {options['chunk_size']}, "
+            f"{options['processes']} process(es))"
+        )
+        self.stdout.write(self.style.SUCCESS(summary) if not found or corrected else summary)
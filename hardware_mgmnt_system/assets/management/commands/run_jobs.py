@@ -0,0 +1,60 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from assets import jobs
+
+
+def run_worker(options, stop):
+    # forked children must not share the parent's database connections
+    connections.close_all()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    jobs.work(batch=options['batch'], sleep=options['sleep'], burst=options['burst'], stop=stop)
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued background jobs. Several workers, in this process or in others, can share the '
+        'queue; each claims due jobs with SELECT ... FOR UPDATE SKIP LOCKED where the database has it. '
+        'Failed jobs are retried with exponential backoff (JOB_QUEUE settings).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='worker processes to fork')
+        parser.add_argument('--batch', type=int, default=100, help='jobs claimed at a time')
+        parser.add_argument('--sleep', type=float, default=1.0, help='seconds to wait when the queue is empty')
+        parser.add_argument('--burst', action='store_true', help='exit once no job is due')
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1 or options['batch'] < 1:
+            raise CommandError('--processes and --batch must be positive')
+
+        if options['processes'] == 1:
+            stop = threading.Event()
+            signal.signal(signal.SIGTERM, lambda *args: stop.set())
+            try:
+                succeeded = jobs.work(options['batch'], options['sleep'], options['burst'], stop)
+            except KeyboardInterrupt:
+                return
+            self.stdout.write(f"{succeeded} job(s) done")
+            return
+
+        # fork, so the children inherit the configured Django instead of importing it again
+        context = multiprocessing.get_context('fork')
+        stop = context.Event()
+        connections.close_all()
+        workers = [context.Process(target=run_worker, args=(options, stop)) for _ in range(options['processes'])]
+        for worker in workers:
+            worker.start()
+        signal.signal(signal.SIGTERM, lambda *args: stop.set())
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            stop.set()
+            for worker in workers:
+                worker.join()
+        self.stdout.write(f"{len(workers)} worker(s) stopped")
@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.db.models.functions import Greatest
+
+from assets.models import AssetTagSequence, Computer
+
+BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed the per-prefix asset tag counters from the tags already in use. '
+        'Counters are only ever moved forward, so this is safe to re-run.'
+    )
+
+    def handle(self, *args, **options):
+        highest = {}
+        for tag in Computer.objects.values_list('asset_tag', flat=True).iterator(chunk_size=2000):
+            match = AssetTagSequence.TAG_PATTERN.match(tag or '')
+            if match:
+                number = int(match['number'])
+                highest[match['prefix']] = max(highest.get(match['prefix'], 0), number)
+
+        current = dict(AssetTagSequence.objects.values_list('prefix', 'last_value'))
+        behind = {prefix: number for prefix, number in highest.items() if number > current.get(prefix, 0)}
+        prefixes = list(behind)
+        for start in range(0, len(prefixes), BATCH_SIZE):
+            batch = {prefix: behind[prefix] for prefix in prefixes[start:start + BATCH_SIZE]}
+            with transaction.atomic():
+                # rows created meanwhile by an allocation are kept, and moved forward below
+                AssetTagSequence.objects.bulk_create(
+                    [AssetTagSequence(prefix=prefix, last_value=number) for prefix, number in batch.items()],
+                    ignore_conflicts=True,
+                )
+                # GREATEST, so a counter advanced by a concurrent allocation is never moved back
+                AssetTagSequence.objects.filter(prefix__in=batch).update(last_value=Greatest(F('last_value'), Case(
+                    *[When(prefix=prefix, then=Value(number)) for prefix, number in batch.items()],
+                    output_field=PositiveIntegerField(),
+                )))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(behind)} of {len(highest)} asset tag prefix counter(s)"
+        ))
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from assets import history
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the state of every computer into a FleetSnapshot. Run it periodically (e.g. nightly): '
+        'fleet point-in-time queries start from the latest snapshot and replay only the transitions after it. '
+        'The first run also records the computers that predate the transition log.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep', type=int, help='delete all but this many of the newest snapshots afterwards')
+
+    def handle(self, *args, **options):
+        snapshot = history.take_snapshot()
+        self.stdout.write(self.style.SUCCESS(f"Snapshot of {snapshot.computer_count} computer(s) taken at {snapshot.taken_at}"))
+        if options['keep']:
+            pruned = history.prune_snapshots(options['keep'])
+            self.stdout.write(f"Deleted {pruned} old snapshot(s)")
@@ -0,0 +1,238 @@
+'''
+Per-request instrumentation, exposed in the Prometheus text format at /metrics.
+
+RequestMetricsMiddleware times every request. A sampled share of them
+(REQUEST_METRICS['SAMPLE_RATE']) also collects the number and duration of SQL
+queries, response cache hits and misses, and how deeply Computer.save() calls nest
+through the signals. Queries are counted by a wrapper installed on each new database
+connection that does nothing unless the current request is sampled, so unsampled
+requests cost two clock reads and a dictionary update.
+
+The numbers live in the worker process; with several workers every scrape reports
+the worker that served it, so scrape each worker or run the metrics on one.
+'''
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+DEFAULT_SETTINGS = {'SAMPLE_RATE': 1.0, 'SERVER_TIMING': False}
+DURATION_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+DEPTH_BUCKETS = (0, 1, 2, 3, 5)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+def metrics_settings():
+    return {**DEFAULT_SETTINGS, **getattr(settings, 'REQUEST_METRICS', {})}
+
+
+class Collector:
+    '''What one sampled request did'''
+    __slots__ = ('queries', 'db_seconds', 'cache_hits', 'cache_misses', 'saves', 'depth', 'max_depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.cache_hits = self.cache_misses = 0
+        self.saves = self.depth = self.max_depth = 0
+
+
+class Registry:
+    '''Counters and histograms keyed by label values, guarded by one lock'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [buckets, [0] * len(buckets), 0, 0.0]
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    histogram[1][index] += 1
+            histogram[2] += 1
+            histogram[3] += value
+
+
+registry = Registry()
+
+# name: (type, label names, help)
+METRICS = {
+    'itams_requests_total': ('counter', ('view', 'method', 'status'), 'Requests by view, method and status code.'),
+    'itams_request_duration_seconds': ('histogram', ('view',), 'Request latency by view.'),
+    'itams_sampled_requests_total': ('counter', ('view',), 'Requests whose queries, cache and saves were collected.'),
+    'itams_db_queries': ('histogram', ('view',), 'SQL queries per sampled request.'),
+    'itams_db_duration_seconds_total': ('counter', ('view',), 'Time spent in SQL queries by sampled requests.'),
+    'itams_cache_requests_total': ('counter', ('view', 'result'), 'my_computer response cache lookups by sampled requests.'),
+    'itams_computer_saves_total': ('counter', ('view',), 'Computer.save() calls made by sampled requests.'),
+    'itams_computer_save_depth': ('histogram', ('view',), 'Deepest nesting of Computer.save() per sampled request.'),
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def render():
+    '''The registry in the Prometheus text exposition format'''
+    with registry.lock:
+        counters = dict(registry.counters)
+        histograms = {key: (buckets, list(counts), count, total)
+                      for key, (buckets, counts, count, total) in registry.histograms.items()}
+
+    lines = []
+    for name, (kind, names, description) in METRICS.items():
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+        if kind == 'counter':
+            for (series, labels), value in sorted(counters.items()):
+                if series == name:
+                    lines.append(f"{name}{{{_labels(names, labels)}}} {value:g}")
+            continue
+        for (series, labels), (buckets, counts, count, total) in sorted(histograms.items()):
+            if series != name:
+                continue
+            label_text = _labels(names, labels)
+            for bound, bucket_count in zip(buckets, counts):
+                lines.append(f'{name}_bucket{{{label_text},le="{bound:g}"}} {bucket_count}')
+            lines.append(f'{name}_bucket{{{label_text},le="+Inf"}} {count}')
+            lines.append(f"{name}_sum{{{label_text}}} {total:g}")
+            lines.append(f"{name}_count{{{label_text}}} {count}")
+    return '\n'.join(lines) + '\n'
+
+
+def _record_query(execute, sql, params, many, context):
+    collector = _current.get()
+    if collector is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        collector.queries += 1
+        collector.db_seconds += time.perf_counter() - started
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        # first, so temporary wrappers added with connection.execute_wrapper() stay on top
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+connection_created.connect(install_query_wrapper)
+
+
+def record_cache(outcome):
+    collector = _current.get()
+    if collector is not None:
+        if outcome == 'hit':
+            collector.cache_hits += 1
+        else:
+            collector.cache_misses += 1
+
+
+@contextmanager
+def computer_save():
+    '''Wrap Computer.save() to count it and the depth of saves nested inside it'''
+    collector = _current.get()
+    if collector is None:
+        yield
+        return
+    collector.saves += 1
+    collector.depth += 1
+    collector.max_depth = max(collector.max_depth, collector.depth)
+    try:
+        yield
+    finally:
+        collector.depth -= 1
+
+
+class RequestMetricsMiddleware:
+    '''Time each request and collect query, cache and save counts for a sample of them'''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        collector, token, started = self.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, collector, started)
+
+    async def __acall__(self, request):
+        collector, token, started = self.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, collector, started)
+
+    def start(self):
+        options = metrics_settings()
+        sampled = options['SAMPLE_RATE'] >= 1 or random.random() < options['SAMPLE_RATE']
+        collector = Collector() if sampled else None
+        return collector, _current.set(collector), time.perf_counter()
+
+    def finish(self, request, response, collector, started):
+        elapsed = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        view = (match.view_name or match._func_path) if match else 'unresolved'
+
+        registry.inc('itams_requests_total', (view, request.method, response.status_code))
+        registry.observe('itams_request_duration_seconds', (view,), elapsed, DURATION_BUCKETS)
+        if collector is None:
+            return response
+
+        registry.inc('itams_sampled_requests_total', (view,))
+        registry.observe('itams_db_queries', (view,), collector.queries, QUERY_BUCKETS)
+        registry.inc('itams_db_duration_seconds_total', (view,), collector.db_seconds)
+        if collector.cache_hits:
+            registry.inc('itams_cache_requests_total', (view, 'hit'), collector.cache_hits)
+        if collector.cache_misses:
+            registry.inc('itams_cache_requests_total', (view, 'miss'), collector.cache_misses)
+        if collector.saves:
+            registry.inc('itams_computer_saves_total', (view,), collector.saves)
+        registry.observe('itams_computer_save_depth', (view,), collector.max_depth, DEPTH_BUCKETS)
+
+        if metrics_settings()['SERVER_TIMING']:
+            timings = [
+                f'db;dur={collector.db_seconds * 1000:.2f};desc="{collector.queries} queries"',
+                f'app;dur={elapsed * 1000:.2f}',
+            ]
+            if collector.cache_hits or collector.cache_misses:
+                timings.append(f'cache;desc="{collector.cache_hits} hit, {collector.cache_misses} miss"')
+            if collector.saves:
+                timings.append(f'saves;desc="{collector.saves} Computer.save, depth {collector.max_depth}"')
+            response.headers['Server-Timing'] = ', '.join(timings)
+        return response
@@ -1,9 +1,13 @@
-from django.db import models
+import re
+
+from django.db import models, transaction, IntegrityError
 from django.contrib.auth.models import User
 from django.utils.text import slugify
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 
+from . import metrics
+
 # Create your models here.
 class Department(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -37,6 +41,133 @@ class Employee(models.Model):
     def __str__(self):
         return self.user.get_username()
 
+def asset_tag_prefix(computer_name, department_name):
+    return f"{slugify(computer_name).upper()}-{slugify(department_name).upper()}"
+
+
+class AssetTagSequence(models.Model):
+    '''Last number handed out for each name-department asset tag prefix'''
+    TAG_PATTERN = re.compile(r'^(?P<prefix>.+)-(?P<number>\d+)$')
+
+    prefix = models.CharField(max_length=100, unique=True)
+    last_value = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.prefix} ({self.last_value})"
+
+    @classmethod
+    def highest_used(cls, prefixes):
+        '''Highest numeric suffix already used by existing tags for each prefix'''
+        numbers = dict.fromkeys(prefixes, 0)
+        if not numbers:
+            return numbers
+        lookup = models.Q()
+        for prefix in numbers:
+            lookup |= models.Q(asset_tag__startswith=f"{prefix}-")
+        for tag in Computer.objects.filter(lookup).values_list('asset_tag', flat=True).iterator():
+            match = cls.TAG_PATTERN.match(tag)
+            if match and match['prefix'] in numbers:
+                numbers[match['prefix']] = max(numbers[match['prefix']], int(match['number']))
+        return numbers
+
+    @classmethod
+    def allocate_many(cls, counts):
+        '''
+        Reserve counts[prefix] consecutive numbers for every prefix and return the first number of each range.
+        All counters move with a single UPDATE whose row locks are held until the values are read back,
+        so concurrent callers never receive overlapping ranges.
+        '''
+        counts = {prefix: count for prefix, count in counts.items() if count > 0}
+        if not counts:
+            return {}
+
+        with transaction.atomic():
+            cls.objects.filter(prefix__in=counts).update(last_value=models.F('last_value') + models.Case(
+                *[models.When(prefix=prefix, then=models.Value(count)) for prefix, count in counts.items()],
+                default=models.Value(0),
+                output_field=models.PositiveIntegerField(),
+            ))
+            last_values = dict(cls.objects.filter(prefix__in=counts).values_list('prefix', 'last_value'))
+
+            missing = counts.keys() - last_values.keys()
+            # first use of a prefix: start after whatever tags already exist for it
+            for prefix, highest in cls.highest_used(missing).items():
+                try:
+                    with transaction.atomic():
+                        cls.objects.create(prefix=prefix, last_value=highest + counts[prefix])
+                    last_values[prefix] = highest + counts[prefix]
+                except IntegrityError:
+                    # another transaction created the counter first
+                    cls.objects.filter(prefix=prefix).update(last_value=models.F('last_value') + counts[prefix])
+                    last_values[prefix] = cls.objects.values_list('last_value', flat=True).get(prefix=prefix)
+
+        return {prefix: last_values[prefix] - count + 1 for prefix, count in counts.items()}
+
+    @classmethod
+    def allocate(cls, prefix, count=1):
+        return cls.allocate_many({prefix: count})[prefix]
+
+
+class ComputerQuerySet(models.QuerySet):
+    @staticmethod
+    def _derived_state():
+        open_assignments = ComputerAssignment.objects.filter(
+            computer=models.OuterRef('pk'), end_date__isnull=True
+        ).order_by('-start_date')
+        new_user = models.Case(
+            models.When(status='Faulty', then=models.Value(None)),
+            default=models.Subquery(open_assignments.values('employee')[:1]),
+            output_field=models.IntegerField(),
+        )
+        new_status = models.Case(
+            models.When(status='Faulty', then=models.Value('Faulty')),
+            models.When(models.Exists(open_assignments), then=models.Value('Issued')),
+            default=models.Value('Inventory'),
+        )
+        return new_status, new_user
+
+    def state_changes(self):
+        """
+        (pk, asset_tag, department_id, status, current_user_id, new_status, new_user)
+        of every computer whose stored state differs from its open assignments, in one SELECT
+        """
+        new_status, new_user = self._derived_state()
+        rows = self.annotate(new_status=new_status, new_user=new_user).values_list(
+            'pk', 'asset_tag', 'department_id', 'status', 'current_user_id', 'new_status', 'new_user'
+        )
+        return [row for row in rows if row[3:5] != row[5:7]]
+
+    def reconcile_state(self, occurred_at=None):
+        """
+        Recompute status and current_user from the open assignments.
+        Faulty computers keep their status and lose their user, the rest are Issued to the
+        employee on the latest open assignment or returned to Inventory.
+        One SELECT works out the new state; only computers whose state changes are
+        updated, and each of them gets a ComputerTransition.
+        """
+        changed = self.state_changes()
+        if not changed:
+            return 0
+
+        new_status, new_user = self._derived_state()
+        occurred_at = occurred_at or timezone.now()
+        releasing = [row[0] for row in changed if row[4] is not None and row[4] != row[6]]
+        with transaction.atomic(savepoint=False):
+            if releasing and any(row[6] is not None and row[6] != row[4] for row in changed):
+                # a user moves between these computers: free them first, so no two hold one user mid-UPDATE
+                self.model.objects.filter(pk__in=releasing).update(current_user=None)
+            self.model.objects.filter(pk__in=[row[0] for row in changed]).update(
+                current_user=new_user, status=new_status
+            )
+            ComputerTransition.objects.bulk_create([
+                ComputerTransition(
+                    computer_id=pk, asset_tag=asset_tag, department_id=department_id, occurred_at=occurred_at,
+                    from_status=status, status=next_status, employee_id=next_user,
+                ) for pk, asset_tag, department_id, status, _, next_status, next_user in changed
+            ])
+        return len(changed)
+
+
 class Computer(models.Model):
     STATUS_CHOICES = [
         ('Issued', 'In Use'),
@@ -47,7 +178,19 @@ class Computer(models.Model):
     asset_tag = models.CharField(max_length=100, unique=True, editable=False,)
     current_user = models.OneToOneField(Employee, on_delete=models.SET_NULL, null=True, blank=True, related_name="computer")
     department = models.ForeignKey(Department, on_delete=models.PROTECT, related_name="computers")
-    status = models.CharField(max_length=15, choices=STATUS_CHOICES, blank=False, default='Inventory')
+    status = models.CharField(max_length=15, choices=STATUS_CHOICES, blank=False, default='Inventory', db_index=True)
+
+    objects = ComputerQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember the logged state, so saving only adds a transition when it changed
+        instance.logged_state = instance.history_state()
+        return instance
+
+    def history_state(self):
+        return tuple(self.__dict__.get(name) for name in ('status', 'current_user_id', 'department_id'))
 
     def clean(self):
         """Prevent assignment if faulty"""
@@ -62,54 +205,76 @@ class Computer(models.Model):
 
     def generate_asset_tag(self):
         if self.computer_name and self.department:
-            name_slug = slugify(self.computer_name).upper()
-            dept_slug = slugify(self.department.name).upper()
-
-            base_tag = f"{name_slug}-{dept_slug}"
-            max_num = Computer.objects.filter(
-                asset_tag__startswith=base_tag
-            ).aggregate(models.Max('asset_tag'))['asset_tag__max']
-
-            if max_num:
-                try:
-                    last_num = int(max_num.split('-')[-1])
-                    next_num = last_num + 1
-                except (ValueError, IndexError):
-                    next_num = 1
-            else:
-                next_num = 1
-            
+            base_tag = asset_tag_prefix(self.computer_name, self.department.name)
+            next_num = AssetTagSequence.allocate(base_tag)
             return f"{base_tag}-{next_num:02d}"
         return ""
     
+    def resolve_state(self):
+        """Work out status and current_user from the open assignment before writing"""
+        if self.status == 'Faulty':
+            self.current_user = None
+            return
+
+        employee_id = None
+        if not self._state.adding:
+            employee_id = ComputerAssignment.objects.filter(
+                computer=self, end_date__isnull=True
+            ).order_by('-start_date').values_list('employee_id', flat=True).first()
+
+        self.current_user_id = employee_id
+        self.status = 'Issued' if employee_id else 'Inventory'
+
     def save(self, *args, **kwargs):
         if not self.asset_tag:
             self.asset_tag = self.generate_asset_tag()
 
-        super().save(*args, **kwargs)
+        self.resolve_state()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'status', 'current_user'}
 
-        if self.status == 'Faulty':
-            self.current_user = None
-            super().save(update_fields=['current_user'])
-            return
-        
-        latest_assignment = ComputerAssignment.objects.filter(
-            computer=self, end_date__isnull=True
-        ).order_by('-start_date').first()
-
-        if latest_assignment:
-            self.current_user = latest_assignment.employee
-            self.status = 'Issued'
-        else:
-            self.current_user = None
-            self.status = 'Inventory'
-        
-        super().save(update_fields=['current_user', 'status'])
+        previous = getattr(self, 'logged_state', None)
+        with metrics.computer_save(), transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if self.history_state() != previous:
+                ComputerTransition.objects.create(
+                    computer_id=self.pk, asset_tag=self.asset_tag, department_id=self.department_id,
+                    from_status=previous[0] if previous else '', status=self.status,
+                    employee_id=self.current_user_id,
+                )
+        self.logged_state = self.history_state()
 
     def __str__(self):
         return self.asset_tag
 
 
+class HardwareModel(models.Model):
+    '''
+    Catalogue of the distinct hardware configurations in the fleet: brand, model and specs,
+    with storage in whole GB so it can be compared. ComputerInfo rows point at theirs;
+    assets.catalogue finds or creates them and keeps them cached in each process.
+    '''
+    brand = models.CharField(max_length=100)
+    name = models.CharField(max_length=100)
+    screen_type = models.CharField(max_length=12)
+    screen_aspect_ratio = models.CharField(max_length=10)
+    memory_size = models.PositiveIntegerField(help_text="RAM in GB", db_index=True)
+    storage_type = models.CharField(max_length=50)
+    storage_size_gb = models.PositiveIntegerField(null=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['brand', 'name', 'screen_type', 'screen_aspect_ratio', 'memory_size', 'storage_type',
+                        'storage_size_gb'],
+                name='unique_hardware_model',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.brand} {self.name} ({self.memory_size} GB, {self.storage_size_gb} GB {self.storage_type})"
+
+
 class ComputerInfo(models.Model):
     ASPECT_CHOICES = [
         ('16:9', '16:9'),
@@ -152,13 +317,18 @@ class ComputerInfo(models.Model):
         ('2 TB', '2 TB'),
     ]
     computer = models.OneToOneField(Computer, on_delete=models.CASCADE, primary_key=True, related_name="info")
-    brand = models.CharField(max_length=100)
+    brand = models.CharField(max_length=100, db_index=True)
     name = models.CharField(max_length=100)
     screen_type = models.CharField(max_length=12, choices=SCREEN_CHOICES)
     screen_aspect_ratio = models.CharField(max_length=10, choices=ASPECT_CHOICES)
-    memory_size = models.PositiveIntegerField(help_text="RAM in GB", choices=MEMORY_CHOICES)
-    storage_type = models.CharField(max_length=50, choices=STORAGE_TYPE_CHOICES)
+    memory_size = models.PositiveIntegerField(help_text="RAM in GB", choices=MEMORY_CHOICES, db_index=True)
+    storage_type = models.CharField(max_length=50, choices=STORAGE_TYPE_CHOICES, db_index=True)
     storage_size = models.CharField(max_length=50, choices=STORAGE_SIZE_CHOICES)
+    # derived from the fields above by assets.catalogue when the row is saved or normalised
+    hardware_model = models.ForeignKey(
+        HardwareModel, on_delete=models.PROTECT, null=True, blank=True, editable=False, related_name="units"
+    )
+    storage_size_gb = models.PositiveIntegerField(null=True, blank=True, editable=False, db_index=True)
 
     def __str__(self):
         return f"{self.brand} {self.name} ({self.computer.asset_tag})"
@@ -171,6 +341,20 @@ class ComputerAssignment(models.Model):
 
     class Meta:
         ordering = ['-start_date']
+        indexes = [
+            # open assignment of a computer / of an employee
+            models.Index(fields=['computer', 'end_date', '-start_date'], name='assignment_computer_end_idx'),
+            models.Index(fields=['employee', 'end_date', '-start_date'], name='assignment_employee_end_idx'),
+        ]
+        constraints = [
+            # the expression is NULL for ended assignments, so only open ones collide;
+            # unlike a conditional constraint this is also enforced on MySQL
+            models.UniqueConstraint(
+                models.Case(models.When(end_date__isnull=True, then=models.F('computer'))),
+                name='one_open_assignment_per_computer',
+                violation_error_message='This computer already has an open assignment.',
+            ),
+        ]
     
     def __str__(self):
         end = self.end_date or "present"
@@ -191,11 +375,209 @@ class ComputerRepairHistory(models.Model):
 
     class Meta:
         ordering = ["-date_of_repair"]
+        indexes = [
+            models.Index(fields=['computer', '-date_of_repair', '-id'], name='repair_computer_date_idx'),
+        ]
 
     def __str__(self):
         return f"{self.computer.asset_tag} reapir on {self.date_of_repair}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remember what the rollups counted, so an edit can be applied as a delta
+        instance.rollup_snapshot = instance.rollup_values()
+        return instance
+
+    def rollup_values(self):
+        return (self.computer_id, self.repaired_component, self.date_of_repair, self.repair_cost)
     
     def save(self, *args, **kwargs):
         if not self.date_of_repair:
             self.date_of_repair = timezone.now().date()
-        super().save(*args, **kwargs)
\ No newline at end of file
+        super().save(*args, **kwargs)
+
+
+class RepairCostRollup(models.Model):
+    '''Repair spend per department, component and month, kept up to date by the repair signals'''
+    department = models.ForeignKey(Department, on_delete=models.CASCADE, related_name="repair_rollups")
+    repaired_component = models.CharField(max_length=100, choices=ComputerRepairHistory.COMPONENT_CHOICES)
+    month = models.DateField(help_text="First day of the month")
+    total_cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    repair_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-month']
+        constraints = [
+            models.UniqueConstraint(fields=['department', 'repaired_component', 'month'], name='unique_repair_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.department_id} {self.repaired_component} {self.month:%Y-%m}: {self.total_cost}"
+
+
+class ComputerRepairTotal(models.Model):
+    '''Lifetime repair totals of a computer, kept up to date by the repair signals'''
+    computer = models.OneToOneField(Computer, on_delete=models.CASCADE, primary_key=True, related_name="repair_total")
+    total_cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    repair_count = models.PositiveIntegerField(default=0)
+    last_repair_date = models.DateField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.computer_id}: {self.total_cost}"
+
+class ComputerSearchDocument(models.Model):
+    '''
+    Denormalised text of a computer for full-text search: tag, name, department, brand and
+    model, current user and repair comments. Rebuilt from the signals after each commit;
+    the full-text index itself is created by assets.search after migrate.
+    '''
+    computer = models.OneToOneField(Computer, on_delete=models.CASCADE, primary_key=True, related_name="search_document")
+    asset_tag = models.CharField(max_length=100, db_index=True)
+    body = models.TextField()
+
+    def __str__(self):
+        return self.asset_tag
+
+
+class ComputerSummary(models.Model):
+    '''
+    One flat row per computer for the dashboards: state, department, current user and
+    assignment start, specs and repair totals. Rebuilt from the signals after each commit,
+    so /my_computer/ and the fleet listing read a single table.
+    '''
+    computer = models.OneToOneField(Computer, on_delete=models.CASCADE, primary_key=True, related_name="summary")
+    asset_tag = models.CharField(max_length=100)
+    computer_name = models.CharField(max_length=100, null=True)
+    status = models.CharField(max_length=15, db_index=True)
+    department_id = models.IntegerField(db_index=True)
+    department_name = models.CharField(max_length=100, db_index=True)
+    # the open assignment, newest first as in UserComputerSerializer
+    user_id = models.IntegerField(null=True, db_index=True)
+    username = models.CharField(max_length=150, null=True)
+    assigned_since = models.DateTimeField(null=True)
+    # ComputerInfo, when the computer has one
+    brand = models.CharField(max_length=100, null=True, db_index=True)
+    model_name = models.CharField(max_length=100, null=True)
+    screen_type = models.CharField(max_length=12, null=True)
+    screen_aspect_ratio = models.CharField(max_length=10, null=True)
+    memory_size = models.PositiveIntegerField(null=True, db_index=True)
+    storage_type = models.CharField(max_length=50, null=True, db_index=True)
+    storage_size = models.CharField(max_length=50, null=True)
+    storage_size_gb = models.PositiveIntegerField(null=True, db_index=True)
+    repair_count = models.PositiveIntegerField(default=0)
+    total_repair_cost = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    last_repair_date = models.DateField(null=True)
+
+    class Meta:
+        verbose_name_plural = 'computer summaries'
+        indexes = [
+            # spec queries within a department, e.g. everything under 8 GB of RAM in Sales
+            models.Index(fields=['department_id', 'memory_size'], name='summary_department_memory_idx'),
+        ]
+
+    def __str__(self):
+        return self.asset_tag
+
+
+class ComputerTransition(models.Model):
+    '''
+    Append-only log of computer state changes, written in the same transaction as the change.
+    Each row holds the whole state after the change, so the state at any moment is the
+    latest row at or before it. The references are not constrained, so the log outlives
+    deleted computers and employees. recorded_at is when the row was written, which is
+    later than occurred_at for back-dated assignments and returns.
+    '''
+    DELETED = 'Deleted'
+
+    computer = models.ForeignKey(Computer, on_delete=models.DO_NOTHING, db_constraint=False, related_name="transitions")
+    asset_tag = models.CharField(max_length=100)
+    occurred_at = models.DateTimeField(default=timezone.now)
+    from_status = models.CharField(max_length=15, blank=True)
+    status = models.CharField(max_length=15)
+    employee = models.ForeignKey(Employee, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name="+")
+    department = models.ForeignKey(Department, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    recorded_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        indexes = [
+            # point-in-time lookups by tag, and the deltas after a snapshot
+            models.Index(fields=['asset_tag', 'occurred_at'], name='transition_tag_time_idx'),
+            models.Index(fields=['occurred_at'], name='transition_time_idx'),
+            # back-dated rows written after a snapshot
+            models.Index(fields=['recorded_at'], name='transition_recorded_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("Transitions are append-only")
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        raise ValidationError("Transitions are append-only")
+
+    def __str__(self):
+        return f"{self.asset_tag}: {self.from_status or '-'} -> {self.status} ({self.occurred_at})"
+
+
+class FleetSnapshot(models.Model):
+    '''Copy of every computer's state, taken periodically so point-in-time queries only replay recent transitions'''
+    taken_at = models.DateTimeField(unique=True)
+    computer_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.taken_at} ({self.computer_count} computers)"
+
+
+class ComputerSnapshot(models.Model):
+    snapshot = models.ForeignKey(FleetSnapshot, on_delete=models.CASCADE, related_name="computers")
+    computer = models.ForeignKey(Computer, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+    asset_tag = models.CharField(max_length=100)
+    status = models.CharField(max_length=15)
+    employee = models.ForeignKey(Employee, on_delete=models.DO_NOTHING, db_constraint=False, null=True, related_name="+")
+    department = models.ForeignKey(Department, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+")
+
+    class Meta:
+        constraints = [
+            # also the index for finding a tag in the latest snapshots
+            models.UniqueConstraint(fields=['asset_tag', 'snapshot'], name='unique_computer_snapshot'),
+        ]
+
+
+class Job(models.Model):
+    '''A side effect run after commit by the run_jobs worker, see assets/jobs.py'''
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    task = models.CharField(max_length=100)
+    key = models.CharField(max_length=200)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    claimed_by = models.CharField(max_length=100, blank=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # what the workers poll for, and the depth and latency stats
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+            models.Index(fields=['status', 'finished_at'], name='job_status_finished_idx'),
+        ]
+        constraints = [
+            # one queued job per key, so repeated changes to a computer run its side effects once;
+            # like one_open_assignment_per_computer this is also enforced on MySQL
+            models.UniqueConstraint(
+                models.Case(models.When(status='queued', then=models.F('key'))),
+                name='one_queued_job_per_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.key} ({self.status})"
@@ -0,0 +1,95 @@
+'''
+Sliding window rate limiting on top of the cache.
+
+Attempts are counted per fixed window with cache.add and cache.incr, which are atomic
+on the shared cache backends (memcached, redis, database and locmem). The sliding
+count is the current window's count plus the previous window's, weighted by how much
+of the previous window still falls inside the sliding window.
+'''
+import hashlib
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.throttling import BaseThrottle
+
+DEFAULT_LOGIN_RATE_LIMITS = {
+    # scope: (attempts, window in seconds)
+    'ip': (30, 60),
+    'username': (5, 300),
+}
+
+
+def login_limits():
+    return getattr(settings, 'LOGIN_RATE_LIMITS', DEFAULT_LOGIN_RATE_LIMITS)
+
+
+def _key(scope, ident, window_number):
+    # hashed so any username is a valid cache key
+    digest = hashlib.sha1(str(ident).encode()).hexdigest()
+    return f"ratelimit:{scope}:{digest}:{window_number}"
+
+
+def _increment(key, window):
+    cache.add(key, 0, window * 2)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # evicted between add and incr
+        cache.set(key, 1, window * 2)
+        return 1
+
+
+def hit(scope, ident, limit, window, now=None):
+    '''
+    Count one attempt and return 0 if it is allowed, otherwise the seconds
+    until the next attempt would be.
+    '''
+    now = time.time() if now is None else now
+    number = int(now // window)
+    count = _increment(_key(scope, ident, number), window)
+    previous = cache.get(_key(scope, ident, number - 1), 0)
+
+    elapsed = now - number * window
+    if previous * (window - elapsed) / window + count <= limit:
+        return 0
+
+    # the next attempt adds one more to this window, so wait for the previous
+    # window's weight to drop far enough, or for this window to become the previous one
+    if previous and count < limit:
+        wait = window - window * (limit - count - 1) / previous - elapsed
+    else:
+        wait = window - elapsed + window * (1 - (limit - 1) / count)
+    return max(1, math.ceil(wait))
+
+
+def reset(scope, ident, window, now=None):
+    now = time.time() if now is None else now
+    number = int(now // window)
+    cache.delete_many([_key(scope, ident, number), _key(scope, ident, number - 1)])
+
+
+def reset_username(username):
+    limits = login_limits()
+    if 'username' in limits:
+        reset('username', str(username).lower(), limits['username'][1])
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', 'unknown')
+
+
+class LoginRateThrottle(BaseThrottle):
+    '''Limit login attempts per client IP and per username'''
+
+    def allow_request(self, request, view):
+        idents = {'ip': client_ip(request), 'username': str(request.data.get('username') or '').lower()}
+        self.retry_after = 0
+        for scope, (limit, window) in login_limits().items():
+            if idents.get(scope):
+                self.retry_after = max(self.retry_after, hit(scope, idents[scope], limit, window))
+        return not self.retry_after
+
+    def wait(self):
+        return self.retry_after
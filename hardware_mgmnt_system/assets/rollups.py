@@ -0,0 +1,154 @@
+'''
+Incrementally maintained repair cost rollups.
+
+Every repair save or delete is applied as a delta to the department x component x month
+row and to the computer's lifetime totals. Spend is attributed to the computer's current
+department, so when a computer moves its spend moves with it; rebuild() recomputes
+everything from ComputerRepairHistory.
+'''
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest, TruncMonth
+
+from .models import Computer, ComputerRepairHistory, RepairCostRollup, ComputerRepairTotal
+
+
+def _bump(model, lookup, cost, count, initial=None, **extra):
+    changes = {'total_cost': F('total_cost') + cost, 'repair_count': F('repair_count') + count}
+    if model.objects.filter(**lookup).update(**changes, **extra):
+        return
+    if count < 0:
+        # nothing was counted here to take it from; rebuild_repair_rollups repairs such drift
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, total_cost=cost, repair_count=count, **(initial or {}))
+    except IntegrityError:
+        # created concurrently, apply the delta to that row
+        if not model.objects.filter(**lookup).update(**changes, **extra):
+            raise
+
+
+def _department_id(repair, computer_id):
+    if computer_id == repair.computer_id and ComputerRepairHistory.computer.is_cached(repair):
+        return repair.computer.department_id
+    return Computer.objects.filter(pk=computer_id).values_list('department_id', flat=True).first()
+
+
+def apply(repair, values, sign, totals=True):
+    '''Add (sign=1) or remove (sign=-1) one repair's rollup values'''
+    computer_id, component, repaired_on, cost = values
+    cost = (cost or 0) * sign
+    department_id = _department_id(repair, computer_id)
+
+    if department_id:
+        _bump(RepairCostRollup, {
+            'department_id': department_id,
+            'repaired_component': component,
+            'month': repaired_on.replace(day=1),
+        }, cost, sign)
+
+    if not totals:
+        return
+    if sign > 0:
+        _bump(
+            ComputerRepairTotal, {'computer_id': computer_id}, cost, sign,
+            initial={'last_repair_date': repaired_on},
+            last_repair_date=Greatest(Coalesce('last_repair_date', Value(repaired_on)), Value(repaired_on)),
+        )
+    else:
+        _bump(ComputerRepairTotal, {'computer_id': computer_id}, cost, sign)
+        ComputerRepairTotal.objects.filter(computer_id=computer_id, last_repair_date=repaired_on).update(
+            last_repair_date=Subquery(ComputerRepairHistory.objects.filter(
+                computer_id=computer_id
+            ).order_by().values('computer').annotate(last=Max('date_of_repair')).values('last'))
+        )
+
+
+def repair_saved(repair, created):
+    previous = getattr(repair, 'rollup_snapshot', None)
+    if not created and previous is None:
+        # saved without being loaded first, so what was counted before is unknown:
+        # recount this computer's totals and its department's monthly rollups
+        rebuild_computer_totals([repair.computer_id])
+        department_id = _department_id(repair, repair.computer_id)
+        if department_id:
+            rebuild_department_rollups([department_id])
+    else:
+        if previous is not None:
+            apply(repair, previous, -1)
+        apply(repair, repair.rollup_values(), 1)
+    repair.rollup_snapshot = repair.rollup_values()
+
+
+def repair_deleted(repair, origin=None):
+    # when the computer itself is deleted its totals row goes with it
+    totals = not isinstance(origin, Computer)
+    apply(repair, getattr(repair, 'rollup_snapshot', None) or repair.rollup_values(), -1, totals=totals)
+
+
+def computer_moved(computer_id, from_department_id, to_department_id):
+    '''Refile a computer's repair spend from the department it left under the one it joined'''
+    buckets = ComputerRepairHistory.objects.filter(computer_id=computer_id).order_by().annotate(
+        month=TruncMonth('date_of_repair')
+    ).values('repaired_component', 'month').annotate(total=Sum('repair_cost'), count=Count('id'))
+    for bucket in buckets:
+        for department_id, sign in ((from_department_id, -1), (to_department_id, 1)):
+            _bump(RepairCostRollup, {
+                'department_id': department_id,
+                'repaired_component': bucket['repaired_component'],
+                'month': bucket['month'],
+            }, bucket['total'] * sign, bucket['count'] * sign)
+
+
+def rebuild_computer_totals(computer_ids):
+    rows = ComputerRepairHistory.objects.filter(computer_id__in=computer_ids).order_by().values(
+        'computer_id'
+    ).annotate(total=Sum('repair_cost'), count=Count('id'), last=Max('date_of_repair'))
+    with transaction.atomic():
+        ComputerRepairTotal.objects.filter(computer_id__in=computer_ids).delete()
+        ComputerRepairTotal.objects.bulk_create([
+            ComputerRepairTotal(
+                computer_id=row['computer_id'], total_cost=row['total'],
+                repair_count=row['count'], last_repair_date=row['last']
+            ) for row in rows
+        ])
+
+
+def _monthly_rollups(repairs):
+    monthly = repairs.order_by().annotate(month=TruncMonth('date_of_repair')).values(
+        'computer__department_id', 'repaired_component', 'month'
+    ).annotate(total=Sum('repair_cost'), count=Count('id'))
+    for row in monthly.iterator():
+        yield RepairCostRollup(
+            department_id=row['computer__department_id'], repaired_component=row['repaired_component'],
+            month=row['month'], total_cost=row['total'], repair_count=row['count']
+        )
+
+
+def rebuild_department_rollups(department_ids):
+    rows = list(_monthly_rollups(ComputerRepairHistory.objects.filter(computer__department_id__in=department_ids)))
+    with transaction.atomic():
+        RepairCostRollup.objects.filter(department_id__in=department_ids).delete()
+        RepairCostRollup.objects.bulk_create(rows)
+
+
+def rebuild(batch_size=1000):
+    '''Recompute every rollup from the repair history'''
+    repairs = ComputerRepairHistory.objects.order_by()
+    totals = repairs.values('computer_id').annotate(
+        total=Sum('repair_cost'), count=Count('id'), last=Max('date_of_repair')
+    )
+
+    with transaction.atomic():
+        RepairCostRollup.objects.all().delete()
+        ComputerRepairTotal.objects.all().delete()
+        RepairCostRollup.objects.bulk_create(_monthly_rollups(repairs), batch_size=batch_size)
+        ComputerRepairTotal.objects.bulk_create([
+            ComputerRepairTotal(
+                computer_id=row['computer_id'], total_cost=row['total'],
+                repair_count=row['count'], last_repair_date=row['last']
+            ) for row in totals.iterator()
+        ], batch_size=batch_size)
+
+    return RepairCostRollup.objects.count(), ComputerRepairTotal.objects.count()
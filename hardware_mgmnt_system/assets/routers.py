@@ -0,0 +1,52 @@
+'''
+Read replica routing.
+
+Views that can live with replication lag opt in with ReplicaReadMixin; the reads they
+make for this app's models go to the 'replica' database when one is configured.
+Sessions and users are always read from 'default' so a fresh login is never missed,
+and every write goes to 'default'. A response cached while the replica lags stays
+stale until the computer changes again or the cache entry expires.
+'''
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+REPLICA = 'replica'
+REPLICA_APPS = {'assets'}
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+@contextmanager
+def replica_reads():
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get() and model._meta.app_label in REPLICA_APPS and REPLICA in settings.DATABASES:
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        # objects read from the replica must still be saved to the primary
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
+
+
+class ReplicaReadMixin:
+    '''Serve this view's reads from the read replica, if one is configured'''
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
@@ -0,0 +1,193 @@
+'''
+Full-text search over computers and their repair notes.
+
+Each computer has a ComputerSearchDocument. The signals queue changed computers and the
+documents are rebuilt, set-based, once the transaction commits, or by the job worker
+when JOB_QUEUE is enabled. After migrate a FULLTEXT
+index is added on MySQL, or an FTS5 table kept in sync by triggers on SQLite. Other
+backends, and SQLite builds without FTS5, fall back to icontains.
+'''
+import re
+import threading
+from collections import defaultdict
+
+from django.db import DatabaseError, connection, connections, transaction
+
+from . import jobs
+from .models import Computer, ComputerRepairHistory, ComputerSearchDocument
+
+TABLE = ComputerSearchDocument._meta.db_table
+FTS_TABLE = f"{TABLE}_fts"
+MYSQL_INDEX = f"{TABLE}_ft"
+MAX_TERMS = 10
+
+_pending = threading.local()
+_fulltext = {}
+
+
+def build_documents(computer_ids):
+    comments = defaultdict(list)
+    for computer_id, comment in ComputerRepairHistory.objects.filter(
+        computer_id__in=computer_ids
+    ).exclude(comments='').order_by('computer_id', 'date_of_repair', 'id').values_list('computer_id', 'comments'):
+        comments[computer_id].append(comment)
+
+    rows = Computer.objects.filter(pk__in=computer_ids).values_list(
+        'pk', 'asset_tag', 'computer_name', 'department__name', 'info__brand', 'info__name',
+        'current_user__user__username',
+    )
+    return [
+        ComputerSearchDocument(
+            computer_id=pk, asset_tag=tag,
+            body='\n'.join(value for value in (tag, *fields, *comments[pk]) if value),
+        ) for pk, tag, *fields in rows
+    ]
+
+
+def refresh(computer_ids, batch_size=500):
+    '''Rebuild the documents of the given computers; deleted computers lose theirs'''
+    computer_ids = sorted(set(computer_ids))
+    for start in range(0, len(computer_ids), batch_size):
+        batch = computer_ids[start:start + batch_size]
+        documents = build_documents(batch)
+        with transaction.atomic():
+            ComputerSearchDocument.objects.filter(computer_id__in=batch).delete()
+            ComputerSearchDocument.objects.bulk_create(documents)
+
+
+def _flush():
+    computer_ids = getattr(_pending, 'computer_ids', None)
+    if computer_ids:
+        _pending.computer_ids = set()
+        refresh(computer_ids)
+
+
+def refresh_on_commit(computer_ids):
+    '''
+    Queue computers whose documents are out of date. Everything queued in a transaction
+    is rebuilt together when it commits; ids left over from a rollback are simply
+    rebuilt with the next commit.
+    '''
+    if jobs.enabled():
+        jobs.enqueue_many('search.refresh', {
+            f"search.refresh:{computer_id}": {'computer_id': computer_id} for computer_id in computer_ids
+        })
+        return
+    if not hasattr(_pending, 'computer_ids'):
+        _pending.computer_ids = set()
+    _pending.computer_ids.update(computer_ids)
+    transaction.on_commit(_flush)
+
+
+@jobs.task('search.refresh', batch=True)
+def refresh_job(payloads):
+    refresh([payload['computer_id'] for payload in payloads])
+
+
+def rebuild(batch_size=500):
+    ids = Computer.objects.order_by('pk').values_list('pk', flat=True)
+    ComputerSearchDocument.objects.exclude(computer_id__in=ids).delete()
+    refresh(list(ids), batch_size)
+    return ComputerSearchDocument.objects.count()
+
+
+def install_fulltext(using='default', **kwargs):
+    '''post_migrate handler: create the full-text index if the backend has one'''
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            cursor.execute(
+                'SELECT 1 FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() '
+                'AND TABLE_NAME = %s AND INDEX_NAME = %s', [TABLE, MYSQL_INDEX]
+            )
+            if not cursor.fetchone():
+                cursor.execute(f'ALTER TABLE {TABLE} ADD FULLTEXT INDEX {MYSQL_INDEX} (asset_tag, body)')
+        elif connection.vendor == 'sqlite':
+            try:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                    f"asset_tag, body, content='{TABLE}', content_rowid='computer_id')"
+                )
+            except DatabaseError:
+                # SQLite built without FTS5
+                return
+            old = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, asset_tag, body) VALUES ('delete', old.computer_id, old.asset_tag, old.body);"
+            new = f"INSERT INTO {FTS_TABLE}(rowid, asset_tag, body) VALUES (new.computer_id, new.asset_tag, new.body);"
+            for name, event, action in (('ai', 'INSERT', new), ('ad', 'DELETE', old), ('au', 'UPDATE', old + ' ' + new)):
+                cursor.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_{name} AFTER {event} ON {TABLE} BEGIN {action} END"
+                )
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    _fulltext.clear()
+
+
+def fulltext_available():
+    key = (connection.alias, connection.settings_dict['NAME'])
+    if key not in _fulltext:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'mysql':
+                cursor.execute(
+                    'SELECT 1 FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() '
+                    'AND TABLE_NAME = %s AND INDEX_NAME = %s', [TABLE, MYSQL_INDEX]
+                )
+                _fulltext[key] = cursor.fetchone() is not None
+            elif connection.vendor == 'sqlite':
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+                _fulltext[key] = cursor.fetchone() is not None
+            else:
+                _fulltext[key] = False
+    return _fulltext[key]
+
+
+def containing(terms):
+    '''Documents containing every term anywhere, case-insensitively; no index needed'''
+    documents = ComputerSearchDocument.objects.all()
+    for term in terms:
+        documents = documents.filter(body__icontains=term)
+    return documents
+
+
+def _ranked_ids(terms, limit):
+    '''(computer_id, score) of the documents containing every term as a word prefix, best first'''
+    with connection.cursor() as cursor:
+        if connection.vendor == 'mysql':
+            against = ' '.join(f'+{term}*' for term in terms)
+            cursor.execute(
+                f'SELECT computer_id, MATCH(asset_tag, body) AGAINST (%s IN BOOLEAN MODE) AS score FROM {TABLE} '
+                f'WHERE MATCH(asset_tag, body) AGAINST (%s IN BOOLEAN MODE) ORDER BY score DESC LIMIT %s',
+                [against, against, limit]
+            )
+            return cursor.fetchall()
+        # bm25 is lower for better matches; tag hits weigh twice as much as the rest
+        match = ' '.join(f'"{term}"*' for term in terms)
+        cursor.execute(
+            f'SELECT rowid, -bm25({FTS_TABLE}, 2.0, 1.0) AS score FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s ORDER BY score DESC LIMIT %s', [match, limit]
+        )
+        return cursor.fetchall()
+
+
+def search(query, limit=20):
+    '''
+    Return [(computer_id, score, match)] for a free-text query, best first.
+    Asset tags starting with the query come first (match='tag'), then full-text hits (match='text').
+    '''
+    terms = re.findall(r'\w+', query.lower())[:MAX_TERMS]
+    if not terms:
+        return []
+
+    prefix = query.strip().upper()
+    tag_hits = ComputerSearchDocument.objects.filter(
+        asset_tag__gte=prefix, asset_tag__lt=prefix + '\uffff'
+    ).order_by('asset_tag').values_list('computer_id', flat=True)[:limit]
+    results = [(computer_id, None, 'tag') for computer_id in tag_hits]
+    seen = {computer_id for computer_id, _, _ in results}
+
+    if fulltext_available():
+        text_hits = _ranked_ids(terms, limit)
+    else:
+        documents = containing(terms).order_by('asset_tag')
+        text_hits = [(computer_id, None) for computer_id in documents.values_list('computer_id', flat=True)[:limit]]
+
+    results += [(computer_id, score, 'text') for computer_id, score in text_hits if computer_id not in seen]
+    return results[:limit]
@@ -1,6 +1,8 @@
+from decimal import Decimal
+
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import ComputerRepairHistory, Computer, ComputerAssignment
+from .models import ComputerRepairHistory, Computer, ComputerAssignment, ComputerInfo, ComputerRepairTotal, ComputerSummary
 
 class ComputerRepairHistorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -9,28 +11,75 @@ class ComputerRepairHistorySerializer(serializers.ModelSerializer):
         read_only_fields = ['date_of_repair']
 
 class UserComputerSerializer(serializers.ModelSerializer):
+    '''
+    Uses the open_assignments and repair_page attributes prepared by
+    UserComputerView when they are present and falls back to querying otherwise.
+    '''
     current_assignment = serializers.SerializerMethodField()
     total_repair_cost = serializers.SerializerMethodField()
-    repair_history = ComputerRepairHistorySerializer(source='repairs', many=True, read_only=True)
+    repair_history = serializers.SerializerMethodField()
+    repairs_next_cursor = serializers.SerializerMethodField()
 
     class Meta:
         model = Computer
         fields = [
-            'computer_name', 'asset_tag', 'status', 'department', 'current_assignment', 'repair_history', 'total_repair_cost'
+            'computer_name', 'asset_tag', 'status', 'department', 'current_assignment', 'repair_history',
+            'repairs_next_cursor', 'total_repair_cost'
         ]
 
     def get_current_assignment(self, obj):
-        assignment = ComputerAssignment.objects.filter(
-            computer=obj, end_date__isnull=True
-        ).first()
+        if hasattr(obj, 'open_assignments'):
+            assignment = obj.open_assignments[0] if obj.open_assignments else None
+        else:
+            assignment = ComputerAssignment.objects.filter(
+                computer=obj, end_date__isnull=True
+            ).select_related('employee__user').first()
 
         return {
             'start_Date': assignment.start_date.isoformat() if assignment else None,
             'employee': str(assignment.employee) if assignment else None
         } if assignment else None
     
+    def get_repair_history(self, obj):
+        repairs = getattr(obj, 'repair_page', None)
+        if repairs is None:
+            repairs = obj.repairs.all()
+        return ComputerRepairHistorySerializer(repairs, many=True).data
+
+    def get_repairs_next_cursor(self, obj):
+        return getattr(obj, 'repairs_next_cursor', None)
+
     def get_total_repair_cost(self, obj):
-        return sum(repair.repair_cost or 0 for repair in obj.repairs.all())
+        try:
+            return obj.repair_total.total_cost
+        except ComputerRepairTotal.DoesNotExist:
+            return Decimal('0')
+
+class UserComputerSummarySerializer(serializers.ModelSerializer):
+    '''UserComputerSerializer's output from a ComputerSummary row and the repair_page set on it'''
+    department = serializers.IntegerField(source='department_id')
+    current_assignment = serializers.SerializerMethodField()
+    total_repair_cost = serializers.SerializerMethodField()
+    repair_history = serializers.SerializerMethodField()
+    repairs_next_cursor = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ComputerSummary
+        fields = UserComputerSerializer.Meta.fields
+
+    def get_current_assignment(self, obj):
+        if obj.assigned_since is None:
+            return None
+        return {'start_Date': obj.assigned_since.isoformat(), 'employee': obj.username}
+
+    def get_repair_history(self, obj):
+        return ComputerRepairHistorySerializer(obj.repair_page, many=True).data
+
+    def get_repairs_next_cursor(self, obj):
+        return getattr(obj, 'repairs_next_cursor', None)
+
+    def get_total_repair_cost(self, obj):
+        return obj.total_repair_cost
 
 class ComputerAssignmentSerializer(serializers.ModelSerializer):
     class Meta:
@@ -40,4 +89,55 @@ class ComputerAssignmentSerializer(serializers.ModelSerializer):
     def validate_computer(self, value):
         if value.status == 'faulty':
             raise serializers.ValidationError("Faulty computers cannot be assigned")
-        return value
\ No newline at end of file
+        return value
+
+class ComputerInfoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ComputerInfo
+        fields = ['brand', 'name', 'screen_type', 'screen_aspect_ratio', 'memory_size', 'storage_type', 'storage_size']
+
+class ComputerListSerializer(serializers.ModelSerializer):
+    department = serializers.CharField(source='department.name', read_only=True)
+    current_user = serializers.CharField(source='current_user.user.username', read_only=True, default=None)
+    info = ComputerInfoSerializer(read_only=True)
+
+    class Meta:
+        model = Computer
+        fields = ['id', 'computer_name', 'asset_tag', 'status', 'department', 'current_user', 'info']
+
+class ComputerSummaryListSerializer(serializers.ModelSerializer):
+    '''ComputerListSerializer's output from a ComputerSummary row'''
+    id = serializers.IntegerField(source='computer_id')
+    department = serializers.CharField(source='department_name')
+    current_user = serializers.SerializerMethodField()
+    info = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ComputerSummary
+        fields = ComputerListSerializer.Meta.fields
+
+    def get_current_user(self, obj):
+        # faulty computers keep their open assignment but have no current user
+        return None if obj.status == 'Faulty' else obj.username
+
+    def get_info(self, obj):
+        if obj.brand is None:
+            return None
+        return {
+            'brand': obj.brand, 'name': obj.model_name, 'screen_type': obj.screen_type,
+            'screen_aspect_ratio': obj.screen_aspect_ratio, 'memory_size': obj.memory_size,
+            'storage_type': obj.storage_type, 'storage_size': obj.storage_size,
+        }
+
+
+class AssignmentPairSerializer(serializers.Serializer):
+    computer = serializers.IntegerField()
+    employee = serializers.IntegerField()
+
+class BulkAssignSerializer(serializers.Serializer):
+    assignments = AssignmentPairSerializer(many=True, allow_empty=False)
+    start_date = serializers.DateTimeField(required=False)
+
+class BulkReturnSerializer(serializers.Serializer):
+    computers = serializers.ListField(child=serializers.IntegerField(), allow_empty=False)
+    end_date = serializers.DateTimeField(required=False)
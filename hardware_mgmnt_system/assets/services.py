@@ -0,0 +1,314 @@
+import csv
+import time
+from collections import Counter
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+from django.db.models import Case, IntegerField, Value, When
+from django.utils import timezone
+
+from . import caching, catalogue, search, summaries
+from .models import (
+    AssetTagSequence, Computer, ComputerAssignment, ComputerInfo, ComputerTransition, Department, Employee,
+    asset_tag_prefix,
+)
+
+INFO_FIELDS = ['brand', 'name', 'screen_type', 'screen_aspect_ratio', 'memory_size', 'storage_type', 'storage_size']
+IMPORT_FIELDS = ['computer_name', 'department', 'status'] + ['info_' + field for field in INFO_FIELDS]
+
+
+class QueryCounter:
+    '''Count the statements sent to the database without keeping them in memory'''
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def flatten_row(row):
+    '''Accept ComputerInfo values either nested under "info" or as info_* keys'''
+    row = dict(row)
+    info = row.pop('info', None) or {}
+    row.update({'info_' + key: value for key, value in info.items()})
+    return row
+
+
+def read_computer_rows(stream, fmt='csv'):
+    '''Yield import rows from a CSV or JSON text stream'''
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    elif fmt == 'json':
+        # imported here, as bulkload builds on this module
+        from .bulkload import iter_json_records
+        for row in iter_json_records(stream):
+            yield flatten_row(row)
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _build_computer(row, departments):
+    department_key = str(row.get('department') or '').strip()
+    department = departments.get(department_key) or departments.get(department_key.lower())
+    if department is None:
+        raise ValidationError(f"Unknown department '{department_key}'")
+
+    status = row.get('status') or 'Inventory'
+    if status not in ('Inventory', 'Faulty'):
+        # imported computers have no assignments yet, so they can only be in stock or faulty
+        raise ValidationError(f"Imported computers must be 'Inventory' or 'Faulty', not '{status}'")
+
+    computer = Computer(computer_name=row.get('computer_name'), department=department, status=status)
+    # department was resolved from the database already, so skip the per-row FK lookup
+    computer.clean_fields(exclude=['asset_tag', 'department', 'current_user'])
+    info = ComputerInfo(**{field: row.get('info_' + field) for field in INFO_FIELDS})
+    info.clean_fields(exclude=['computer'])
+    catalogue.link(info)
+    return computer, info
+
+
+def _one_by_one_cost(computer, info):
+    '''
+    Queries a Computer.save() plus its ComputerInfo insert costs, tag allocation and
+    signals included, measured on copies of an import row inside a savepoint that is
+    rolled back. The second copy is counted, as the first may also create its prefix's
+    tag counter.
+    '''
+    counter = QueryCounter()
+    with transaction.atomic():
+        for wrapper in (nullcontext(), connection.execute_wrapper(counter)):
+            with wrapper:
+                sample = Computer(computer_name=computer.computer_name, department=computer.department, status=computer.status)
+                sample.save()
+                ComputerInfo(computer=sample, **{field: getattr(info, field) for field in INFO_FIELDS}).save()
+        transaction.set_rollback(True)
+    return counter.count
+
+
+def import_computers(rows, chunk_size=500):
+    '''
+    Create computers and their ComputerInfo in bulk.
+    Asset tag ranges are reserved for every name-department prefix in one allocation per chunk,
+    and each chunk is written with bulk_create inside its own transaction.
+    '''
+    departments = {}
+    for department in Department.objects.all():
+        departments[str(department.pk)] = department
+        departments[department.name.lower()] = department
+
+    counter = QueryCounter()
+    created = 0
+    errors = []
+    per_row = sampling = None
+    started = time.perf_counter()
+
+    with connection.execute_wrapper(counter):
+        for chunk in _chunks(enumerate(rows, start=1), chunk_size):
+            pending = []
+            for line, row in chunk:
+                try:
+                    pending.append(_build_computer(row, departments))
+                except (ValidationError, TypeError, ValueError) as exc:
+                    messages = exc.messages if isinstance(exc, ValidationError) else [str(exc)]
+                    errors.append({'row': line, 'errors': messages})
+            if not pending:
+                continue
+            if per_row is None:
+                before = counter.count
+                per_row = _one_by_one_cost(*pending[0])
+                sampling = counter.count - before
+
+            prefixes = [asset_tag_prefix(c.computer_name, c.department.name) for c, _ in pending]
+            next_numbers = AssetTagSequence.allocate_many(Counter(prefixes))
+            for (computer, _), prefix in zip(pending, prefixes):
+                computer.asset_tag = f"{prefix}-{next_numbers[prefix]:02d}"
+                next_numbers[prefix] += 1
+
+            with transaction.atomic():
+                Computer.objects.bulk_create([c for c, _ in pending], batch_size=chunk_size)
+                # not every backend returns primary keys from bulk_create, so look them up by tag
+                ids = dict(Computer.objects.filter(
+                    asset_tag__in=[c.asset_tag for c, _ in pending]
+                ).values_list('asset_tag', 'id'))
+                for computer, info in pending:
+                    info.computer_id = ids[computer.asset_tag]
+                ComputerInfo.objects.bulk_create([info for _, info in pending], batch_size=chunk_size)
+                ComputerTransition.objects.bulk_create([
+                    ComputerTransition(
+                        computer_id=ids[computer.asset_tag], asset_tag=computer.asset_tag,
+                        department_id=computer.department_id, status=computer.status,
+                    ) for computer, _ in pending
+                ], batch_size=chunk_size)
+                search.refresh_on_commit(ids.values())
+                summaries.refresh_on_commit(ids.values())
+
+            created += len(pending)
+
+    elapsed = time.perf_counter() - started
+    # the sample is not part of the import
+    queries = counter.count - (sampling or 0)
+    one_by_one = (per_row or 0) * created
+    return {
+        'created': created,
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(created / elapsed, 1) if elapsed else None,
+        'queries': queries,
+        'queries_one_by_one': one_by_one,
+        'queries_saved': max(one_by_one - queries, 0),
+    }
+
+
+def computers_changed(computer_ids, user_ids=()):
+    '''Bookkeeping for bulk writes that bypass the per-row signals'''
+    search.refresh_on_commit(computer_ids)
+    summaries.refresh_on_commit(computer_ids)
+    caching.invalidate_on_commit(computer_ids, user_ids)
+
+
+def bulk_assign(pairs, start_date=None):
+    '''
+    Assign computers to employees from a list of (computer_id, employee_id) pairs.
+    The whole batch is validated with a handful of set-based queries and written with
+    one bulk INSERT plus one UPDATE ... CASE on the computers and one bulk INSERT of their transitions;
+    nothing is written if any pair is invalid.
+    '''
+    pairs = [(int(computer_id), int(employee_id)) for computer_id, employee_id in pairs]
+    computer_ids = [computer_id for computer_id, _ in pairs]
+    employee_ids = [employee_id for _, employee_id in pairs]
+
+    computers = {
+        pk: (status, asset_tag, department_id)
+        for pk, status, asset_tag, department_id in Computer.objects.filter(pk__in=computer_ids).values_list(
+            'pk', 'status', 'asset_tag', 'department_id'
+        )
+    }
+    users = dict(Employee.objects.filter(pk__in=employee_ids).values_list('pk', 'user_id'))
+    busy_computers = set(ComputerAssignment.objects.filter(
+        computer_id__in=computer_ids, end_date__isnull=True
+    ).order_by().values_list('computer_id', flat=True))
+    busy_employees = set(ComputerAssignment.objects.filter(
+        employee_id__in=employee_ids, end_date__isnull=True
+    ).order_by().values_list('employee_id', flat=True))
+
+    errors = []
+    computer_counts, employee_counts = Counter(computer_ids), Counter(employee_ids)
+    for index, (computer_id, employee_id) in enumerate(pairs):
+        if computer_id not in computers:
+            errors.append(f"Row {index}: computer {computer_id} does not exist")
+        elif computers[computer_id][0] == 'Faulty':
+            errors.append(f"Row {index}: computer {computer_id} is faulty and cannot be assigned")
+        elif computer_id in busy_computers:
+            errors.append(f"Row {index}: computer {computer_id} is already assigned")
+        elif computer_counts[computer_id] > 1:
+            errors.append(f"Row {index}: computer {computer_id} appears more than once")
+
+        if employee_id not in users:
+            errors.append(f"Row {index}: employee {employee_id} does not exist")
+        elif employee_id in busy_employees:
+            errors.append(f"Row {index}: employee {employee_id} already has a computer")
+        elif employee_counts[employee_id] > 1:
+            errors.append(f"Row {index}: employee {employee_id} appears more than once")
+    if errors:
+        raise ValidationError(errors)
+    if not pairs:
+        return 0
+
+    start_date = start_date or timezone.now()
+    with transaction.atomic():
+        ComputerAssignment.objects.bulk_create([
+            ComputerAssignment(computer_id=computer_id, employee_id=employee_id, start_date=start_date)
+            for computer_id, employee_id in pairs
+        ])
+        Computer.objects.filter(pk__in=computer_ids).update(
+            status='Issued',
+            current_user=Case(
+                *[When(pk=computer_id, then=Value(employee_id)) for computer_id, employee_id in pairs],
+                output_field=IntegerField(),
+            ),
+        )
+        ComputerTransition.objects.bulk_create([
+            ComputerTransition(
+                computer_id=computer_id, asset_tag=computers[computer_id][1], department_id=computers[computer_id][2],
+                occurred_at=start_date, from_status=computers[computer_id][0], status='Issued', employee_id=employee_id,
+            ) for computer_id, employee_id in pairs
+        ])
+    computers_changed(computer_ids, users.values())
+    return len(pairs)
+
+
+def bulk_return(computer_ids, end_date=None):
+    '''
+    End the open assignments of the given computers with one UPDATE and return them
+    to inventory, logging a transition for each computer whose state changes
+    '''
+    computer_ids = [int(computer_id) for computer_id in computer_ids]
+    open_assignments = ComputerAssignment.objects.filter(
+        computer_id__in=computer_ids, end_date__isnull=True
+    ).order_by()
+
+    with transaction.atomic():
+        holders = list(open_assignments.values_list('computer_id', 'employee__user_id'))
+        end_date = end_date or timezone.now()
+        ended = open_assignments.update(end_date=end_date)
+        # faulty computers keep their status, everything else goes back to inventory
+        Computer.objects.filter(pk__in=computer_ids).reconcile_state(occurred_at=end_date)
+    computers_changed(computer_ids, {user_id for _, user_id in holders})
+    return ended
+
+
+_offboarding_suspended = ContextVar('offboarding_suspended', default=False)
+
+
+def offboarding_suspended():
+    return _offboarding_suspended.get()
+
+
+def offboard_employees(employee_ids, end_date=None):
+    '''
+    End every open assignment of the given employees with one UPDATE and
+    reconcile the affected computers with another.
+    '''
+    open_assignments = ComputerAssignment.objects.filter(
+        employee_id__in=employee_ids, end_date__isnull=True
+    ).order_by()
+
+    with transaction.atomic():
+        holders = list(open_assignments.values_list('computer_id', 'employee__user_id'))
+        if not holders:
+            return 0
+        end_date = end_date or timezone.now()
+        ended = open_assignments.update(end_date=end_date)
+        computer_ids = [computer_id for computer_id, _ in holders]
+        Computer.objects.filter(pk__in=computer_ids).reconcile_state(occurred_at=end_date)
+    computers_changed(computer_ids, {user_id for _, user_id in holders})
+    return ended
+
+
+def offboard_users(user_ids, end_date=None):
+    return offboard_employees(Employee.objects.filter(user_id__in=user_ids).values('pk'), end_date)
+
+
+def delete_users(queryset):
+    '''Offboard and delete a batch of users with a fixed number of queries, however many there are'''
+    with transaction.atomic():
+        offboard_employees(Employee.objects.filter(user__in=queryset).values('pk'))
+        token = _offboarding_suspended.set(True)
+        try:
+            return queryset.delete()
+        finally:
+            _offboarding_suspended.reset(token)
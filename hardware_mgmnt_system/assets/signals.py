@@ -1,8 +1,12 @@
-from django.db.models.signals import post_save, post_delete
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
 from django.dispatch import receiver
-from django.utils import timezone
 from django.contrib.auth.models import User
-from .models import Employee, ComputerAssignment, ComputerRepairHistory
+from . import caching, catalogue, history, rollups, search, services, summaries
+from .models import (
+    Department, Role, Employee, Computer, ComputerInfo, ComputerAssignment, ComputerRepairHistory, HardwareModel,
+)
 
 
 @receiver(post_save, sender=User)
@@ -10,34 +14,114 @@ def create_employee_profile(sender, instance, created, **kwargs):
     if created and not hasattr(instance, 'employee_profile'):
         Employee.objects.create(user=instance)
 
-@receiver(post_delete, sender=User)
-def update_computer_status_on_user_delete(sender, instance, **kwargs):
+@receiver(pre_delete, sender=Employee)
+def end_assignments_on_employee_delete(sender, instance, **kwargs):
     '''
-    When a user is deleted, end their sctive assingments and update computers
+    Before an employee (or their user) is deleted, end their active assignments
+    and update the computers while the rows still exist
     '''
-    assignments = ComputerAssignment.objects.filter(
-        employee__user=instance,
-        end_date__isnull=True
-    )
+    if not services.offboarding_suspended():
+        services.offboard_employees([instance.pk])
 
-    for assignment in assignments:
-        assignment.end_date = timezone.now().date()
-        assignment.save()
+def deleted_with_employee(origin):
+    '''True when an assignment is being cascade-deleted along with its employee or user'''
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return model in (User, Employee)
+
+def invalidate_assignment_cache(assignment):
+    '''Drop the cached my_computer pointer of the assigned user and the computer's responses'''
+    if ComputerAssignment.employee.is_cached(assignment):
+        user_id = assignment.employee.user_id
+    else:
+        user_id = Employee.objects.filter(pk=assignment.employee_id).values_list('user_id', flat=True).first()
+    caching.invalidate_on_commit([assignment.computer_id], [user_id])
 
 @receiver(post_save, sender=ComputerAssignment)
 def update_computer_on_assignment_change(sender, instance, **kwargs):
     '''When assignment changes, update the computer status'''
-    if instance.computer:
-        instance.computer.save()
+    if instance.computer_id:
+        Computer.objects.filter(pk=instance.computer_id).reconcile_state()
+    invalidate_assignment_cache(instance)
 
 @receiver(post_delete, sender=ComputerAssignment)
-def update_computer_on_assignment_delete(sender, instance, **kwargs):
+def update_computer_on_assignment_delete(sender, instance, origin=None, **kwargs):
     '''When assignment deleted, refresh computer status'''
-    if instance.computer:
-        instance.computer.save()
+    if deleted_with_employee(origin):
+        # the computers were already reconciled when the employee was offboarded
+        return
+    if instance.computer_id:
+        Computer.objects.filter(pk=instance.computer_id).reconcile_state()
+    invalidate_assignment_cache(instance)
 
 @receiver(post_save, sender=ComputerRepairHistory)
-def log_repair_on_assignment(sender, instance, **kwargs):
+def log_repair_on_assignment(sender, instance, created, **kwargs):
     '''Log repair activity'''
-    if instance.computer:
-        instance.computer.save()
\ No newline at end of file
+    if instance.computer_id:
+        Computer.objects.filter(pk=instance.computer_id).reconcile_state()
+        rollups.repair_saved(instance, created)
+        caching.invalidate_on_commit([instance.computer_id])
+
+@receiver(post_delete, sender=ComputerRepairHistory)
+def update_rollups_on_repair_delete(sender, instance, origin=None, **kwargs):
+    rollups.repair_deleted(instance, origin)
+    caching.invalidate_on_commit([instance.computer_id])
+
+@receiver(post_save, sender=Computer)
+def invalidate_cache_on_computer_change(sender, instance, **kwargs):
+    caching.invalidate_on_commit([instance.pk])
+
+@receiver(post_save, sender=Computer)
+def move_rollups_with_computer(sender, instance, created, **kwargs):
+    '''Repair spend is filed under the computer's department, so it follows a move'''
+    # Computer.save() updates logged_state after the signals, so it still holds the department loaded
+    previous = getattr(instance, 'logged_state', None)
+    if not created and previous and previous[2] and previous[2] != instance.department_id:
+        rollups.computer_moved(instance.pk, previous[2], instance.department_id)
+
+@receiver(post_delete, sender=Computer)
+def log_computer_deletion(sender, instance, **kwargs):
+    history.record_deletion(instance)
+
+@receiver(pre_save, sender=ComputerInfo)
+def link_hardware_model(sender, instance, raw=False, update_fields=None, **kwargs):
+    if not raw and update_fields is None:
+        catalogue.link(instance)
+
+@receiver([post_save, post_delete], sender=HardwareModel)
+def reload_catalogue(sender, created=False, **kwargs):
+    # new rows are cached by catalogue.resolve; edits and deletes reload it after the commit,
+    # so other transactions never load an uncommitted row into the cache
+    if not created:
+        transaction.on_commit(catalogue.clear)
+
+@receiver([post_save, post_delete], sender=Department)
+@receiver([post_save, post_delete], sender=Role)
+def invalidate_admin_choices(sender, **kwargs):
+    caching.invalidate_choices()
+
+@receiver([post_save, post_delete], sender=Computer)
+@receiver([post_save, post_delete], sender=ComputerInfo)
+@receiver([post_save, post_delete], sender=ComputerAssignment)
+@receiver([post_save, post_delete], sender=ComputerRepairHistory)
+def refresh_read_models(sender, instance, **kwargs):
+    computer_ids = [instance.pk if sender is Computer else instance.computer_id]
+    search.refresh_on_commit(computer_ids)
+    summaries.refresh_on_commit(computer_ids)
+
+@receiver(post_save, sender=Department)
+def refresh_department_read_models(sender, instance, created, **kwargs):
+    if not created:
+        computer_ids = list(instance.computers.values_list('pk', flat=True))
+        search.refresh_on_commit(computer_ids)
+        summaries.refresh_on_commit(computer_ids)
+
+@receiver(post_save, sender=User)
+def refresh_user_read_models(sender, instance, created, update_fields=None, **kwargs):
+    # logins save last_login only; the username is what the documents and summaries contain
+    if created or (update_fields is not None and 'username' not in update_fields):
+        return
+    computer_ids = list(Computer.objects.filter(
+        assignments__employee__user=instance, assignments__end_date__isnull=True
+    ).values_list('pk', flat=True))
+    search.refresh_on_commit(computer_ids)
+    summaries.refresh_on_commit(computer_ids)
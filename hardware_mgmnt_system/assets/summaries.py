@@ -0,0 +1,101 @@
+'''
+The ComputerSummary read model behind /my_computer/ and the fleet listing.
+
+Each computer has one flat row, built with a single joined SELECT. The signals queue
+the computers a change touches and their rows are rebuilt, set-based, once the
+transaction commits, like the search documents. Unlike those, they are never handed to
+the job queue, because the dashboards read them straight after a write. The
+rebuild_computer_summaries command fills the table after migrating and repairs drift.
+'''
+import threading
+from decimal import Decimal
+
+from django.db import models, transaction
+
+from . import caching
+from .models import Computer, ComputerAssignment, ComputerSummary
+
+_pending = threading.local()
+
+COLUMNS = {
+    'computer_id': 'pk',
+    'asset_tag': 'asset_tag',
+    'computer_name': 'computer_name',
+    'status': 'status',
+    'department_id': 'department_id',
+    'department_name': 'department__name',
+    'user_id': 'open_user_id',
+    'username': 'open_username',
+    'assigned_since': 'open_since',
+    'brand': 'info__brand',
+    'model_name': 'info__name',
+    'screen_type': 'info__screen_type',
+    'screen_aspect_ratio': 'info__screen_aspect_ratio',
+    'memory_size': 'info__memory_size',
+    'storage_type': 'info__storage_type',
+    'storage_size': 'info__storage_size',
+    'storage_size_gb': 'info__storage_size_gb',
+    'repair_count': 'repair_total__repair_count',
+    'total_repair_cost': 'repair_total__total_cost',
+    'last_repair_date': 'repair_total__last_repair_date',
+}
+
+
+def build_summaries(computer_ids):
+    open_assignment = ComputerAssignment.objects.filter(
+        computer=models.OuterRef('pk'), end_date__isnull=True
+    ).order_by('-start_date')
+    rows = Computer.objects.filter(pk__in=computer_ids).annotate(
+        open_user_id=models.Subquery(open_assignment.values('employee__user_id')[:1]),
+        open_username=models.Subquery(open_assignment.values('employee__user__username')[:1]),
+        open_since=models.Subquery(open_assignment.values('start_date')[:1]),
+    ).values_list(*COLUMNS.values())
+
+    summaries = []
+    for row in rows:
+        summary = ComputerSummary(**dict(zip(COLUMNS, row)))
+        # computers without repairs have no ComputerRepairTotal row
+        summary.repair_count = summary.repair_count or 0
+        summary.total_repair_cost = summary.total_repair_cost or Decimal('0')
+        summaries.append(summary)
+    return summaries
+
+
+def refresh(computer_ids, batch_size=500):
+    '''Rebuild the summaries of the given computers; deleted computers lose theirs'''
+    computer_ids = sorted(set(computer_ids))
+    for start in range(0, len(computer_ids), batch_size):
+        batch = computer_ids[start:start + batch_size]
+        summaries = build_summaries(batch)
+        with transaction.atomic():
+            ComputerSummary.objects.filter(computer_id__in=batch).delete()
+            ComputerSummary.objects.bulk_create(summaries)
+
+
+def _flush():
+    computer_ids = getattr(_pending, 'computer_ids', None)
+    if computer_ids:
+        _pending.computer_ids = set()
+        refresh(computer_ids)
+        # a response cached between the commit and this refresh was built from the old rows
+        for computer_id in computer_ids:
+            caching.invalidate_computer(computer_id)
+
+
+def refresh_on_commit(computer_ids):
+    '''
+    Queue computers whose summaries are out of date. Everything queued in a transaction
+    is rebuilt together when it commits; ids left over from a rollback are simply
+    rebuilt with the next commit.
+    '''
+    if not hasattr(_pending, 'computer_ids'):
+        _pending.computer_ids = set()
+    _pending.computer_ids.update(computer_ids)
+    transaction.on_commit(_flush)
+
+
+def rebuild(batch_size=500):
+    ids = Computer.objects.order_by('pk').values_list('pk', flat=True)
+    ComputerSummary.objects.exclude(computer_id__in=ids).delete()
+    refresh(list(ids), batch_size)
+    return ComputerSummary.objects.count()
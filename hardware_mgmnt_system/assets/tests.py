@@ -1,3 +1,1419 @@
-from django.test import TestCase
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection, transaction, IntegrityError
+from django.db.models.signals import post_save
+from django.http import HttpResponse
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from hardware_mgmnt_system import settings_production
+from . import benchmarks, bulkload, caching, catalogue, history, jobs, metrics, ratelimit, rollups, search, summaries
+from .admin import ComputerAdmin, ComputerAssignmentInline
+from .exports import export_rows, stream_csv
+from .routers import ReplicaRouter, replica_reads
+from .serializers import ComputerListSerializer, ComputerSummaryListSerializer, UserComputerSerializer
+from .services import bulk_assign, bulk_return, delete_users, import_computers
+from .models import (
+    AssetTagSequence, Department, Role, Employee, Computer, ComputerInfo, ComputerAssignment, ComputerRepairHistory,
+    RepairCostRollup, ComputerRepairTotal, ComputerSearchDocument, ComputerSummary, ComputerTransition, FleetSnapshot,
+    HardwareModel, Job,
+)
+from .signals import create_employee_profile
+from .views import my_computer_queryset, repairs_page_queryset, set_repair_page
+
+
+def create_employee(username, department, role):
+    '''create_employee_profile cannot build an Employee without a department, so mute it'''
+    post_save.disconnect(create_employee_profile, sender=User)
+    try:
+        user = User.objects.create_user(username=username, password='password')
+    finally:
+        post_save.connect(create_employee_profile, sender=User)
+    return Employee.objects.create(user=user, department=department, role=role, gender='F')
+
+
+class AssetsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.department = Department.objects.create(name='Sales and Marketing')
+        cls.role = Role.objects.create(department=cls.department, name='Account Manager')
+        cls.employee = create_employee('jdoe', cls.department, cls.role)
+        cls.computer = Computer.objects.create(computer_name='Dell', department=cls.department)
+
+    def setUp(self):
+        cache.clear()
+        # catalogue rows cached by an earlier test were rolled back with it
+        catalogue.clear()
+
+
+class ComputerWriteQueryCountTests(AssetsTestCase):
+    '''Pin the number of queries each write path costs'''
+
+    def test_new_computer_gets_tag_and_inventory_status(self):
+        # tag allocation (BEGIN, UPDATE, SELECT, COMMIT) + INSERT + transition INSERT
+        with self.assertNumQueries(6):
+            computer = Computer.objects.create(computer_name='Dell', department=self.department)
+        self.assertEqual(computer.asset_tag, 'DELL-SALES-AND-MARKETING-02')
+        self.assertEqual(computer.status, 'Inventory')
+
+    def test_admin_save(self):
+        model_admin = ComputerAdmin(Computer, admin.site)
+        request = RequestFactory().post('/')
+        self.computer.computer_name = 'Dell Latitude'
+
+        # open assignment lookup + UPDATE
+        with self.assertNumQueries(2):
+            model_admin.save_model(request, self.computer, form=None, change=True)
+
+    def test_faulty_save_skips_assignment_lookup(self):
+        self.computer.status = 'Faulty'
+        # UPDATE + transition INSERT
+        with self.assertNumQueries(2):
+            self.computer.save()
+        self.assertIsNone(self.computer.current_user)
+
+    def test_assignment_create(self):
+        # INSERT, reconcile SELECT, UPDATE of the changed computer, transition INSERT
+        with self.assertNumQueries(4):
+            ComputerAssignment.objects.create(
+                computer=self.computer, employee=self.employee, start_date=timezone.now()
+            )
+
+        self.computer.refresh_from_db()
+        self.assertEqual(self.computer.status, 'Issued')
+        self.assertEqual(self.computer.current_user, self.employee)
+
+    def test_assignment_end(self):
+        assignment = ComputerAssignment.objects.create(
+            computer=self.computer, employee=self.employee, start_date=timezone.now()
+        )
+        assignment.end_date = timezone.now()
+        with self.assertNumQueries(4):
+            assignment.save()
+
+        self.computer.refresh_from_db()
+        self.assertEqual(self.computer.status, 'Inventory')
+        self.assertIsNone(self.computer.current_user)
+
+    def test_assignment_delete(self):
+        assignment = ComputerAssignment.objects.create(
+            computer=self.computer, employee=self.employee, start_date=timezone.now()
+        )
+        with self.assertNumQueries(4):
+            assignment.delete()
+
+        self.computer.refresh_from_db()
+        self.assertEqual(self.computer.status, 'Inventory')
+
+    def test_repair_add(self):
+        ComputerRepairHistory.objects.create(computer=self.computer, repaired_component='RAM', repair_cost='50.00')
+
+        # INSERT, reconcile SELECT (the state does not change), monthly rollup UPDATE, computer total UPDATE
+        with self.assertNumQueries(4):
+            ComputerRepairHistory.objects.create(
+                computer=self.computer, repaired_component='RAM', repair_cost='50.00'
+            )
+
+    def test_faulty_computer_drops_user_on_reconcile(self):
+        ComputerAssignment.objects.create(
+            computer=self.computer, employee=self.employee, start_date=timezone.now()
+        )
+        Computer.objects.filter(pk=self.computer.pk).update(status='Faulty')
+
+        Computer.objects.filter(pk=self.computer.pk).reconcile_state()
+        self.computer.refresh_from_db()
+        self.assertEqual(self.computer.status, 'Faulty')
+        self.assertIsNone(self.computer.current_user)
+
+
+class AssetTagSequenceTests(AssetsTestCase):
+    def test_numbers_roll_past_99(self):
+        AssetTagSequence.objects.filter(prefix='DELL-SALES-AND-MARKETING').update(last_value=99)
+        tags = [Computer.objects.create(computer_name='Dell', department=self.department).asset_tag for _ in range(2)]
+        self.assertEqual(tags, ['DELL-SALES-AND-MARKETING-100', 'DELL-SALES-AND-MARKETING-101'])
+        self.assertEqual(AssetTagSequence.highest_used(['DELL-SALES-AND-MARKETING'])['DELL-SALES-AND-MARKETING'], 101)
+
+    def test_allocations_do_not_overlap(self):
+        first = AssetTagSequence.allocate_many({'HP-IT': 5, 'DELL-IT': 2})
+        second = AssetTagSequence.allocate_many({'HP-IT': 3})
+        self.assertEqual((first, second), ({'HP-IT': 1, 'DELL-IT': 1}, {'HP-IT': 6}))
+        self.assertEqual(AssetTagSequence.objects.get(prefix='HP-IT').last_value, 8)
+
+    def test_seed_command_only_moves_counters_forward(self):
+        Computer.objects.bulk_create([
+            Computer(computer_name='HP', asset_tag='HP-SALES-AND-MARKETING-42', department=self.department),
+            Computer(computer_name='HP', asset_tag='HP-IT-07', department=self.department),
+        ])
+        AssetTagSequence.objects.create(prefix='HP-IT', last_value=50)
+
+        out = io.StringIO()
+        call_command('seed_asset_tag_sequences', stdout=out)
+        self.assertIn('Seeded 1 of 3', out.getvalue())
+        self.assertEqual(
+            dict(AssetTagSequence.objects.filter(prefix__startswith='HP-').values_list('prefix', 'last_value')),
+            {'HP-SALES-AND-MARKETING': 42, 'HP-IT': 50},
+        )
+
+
+class ComputerImportTests(AssetsTestCase):
+    def write_file(self, content):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'computers.json')
+        with open(path, 'w') as stream:
+            stream.write(content)
+        return path
+
+    def test_json_rows_are_imported(self):
+        rows = [{'computer_name': 'HP', 'department': 'Sales and Marketing', 'info': {
+            'brand': 'HP', 'name': 'EliteBook', 'screen_type': 'IPS', 'screen_aspect_ratio': '16:9',
+            'memory_size': 8, 'storage_type': 'SSD', 'storage_size': '256 GB',
+        }}] * 3
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_computers', self.write_file(json.dumps(rows)), stdout=out)
+        self.assertIn('Imported 3 computer(s)', out.getvalue())
+        self.assertEqual(ComputerInfo.objects.filter(storage_size_gb=256).count(), 3)
+
+    def test_one_by_one_cost_is_measured(self):
+        row = {'computer_name': 'HP', 'department': 'Sales and Marketing', 'info_brand': 'HP', 'info_name': 'EliteBook',
+               'info_screen_type': 'IPS', 'info_screen_aspect_ratio': '16:9', 'info_memory_size': 8,
+               'info_storage_type': 'SSD', 'info_storage_size': '256 GB'}
+        result = import_computers([row] * 3)
+        # the measured sample is rolled back and not counted as part of the import
+        self.assertEqual(Computer.objects.filter(computer_name='HP').count(), 3)
+        self.assertEqual(result['queries_one_by_one'] % 3, 0)
+        self.assertGreater(result['queries_one_by_one'], result['queries'])
+        self.assertEqual(result['queries_saved'], result['queries_one_by_one'] - result['queries'])
+
+    def test_malformed_json_is_a_command_error(self):
+        with self.assertRaises(CommandError):
+            call_command('import_computers', self.write_file('[{"computer_name": "HP",'), stdout=io.StringIO())
+
+
+class UserComputerViewTests(AssetsTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            ComputerAssignment.objects.create(
+                computer=self.computer, employee=self.employee, start_date=timezone.now()
+            )
+        self.client.force_login(self.employee.user)
+
+    def add_repairs(self, count):
+        ComputerRepairHistory.objects.bulk_create([
+            ComputerRepairHistory(
+                computer=self.computer, repaired_component='RAM', repair_cost='10.00',
+                date_of_repair=timezone.now().date() - timedelta(days=i)
+            ) for i in range(count)
+        ])
+        # bulk_create skips the signals that maintain the rollups, the summary and the cached responses
+        rollups.rebuild_computer_totals([self.computer.pk])
+        summaries.refresh([self.computer.pk])
+        cache.clear()
+
+    def get_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_repairs(self):
+        self.add_repairs(2)
+        _, few = self.get_queries('/api/ITAMS/my_computer/')
+        self.add_repairs(20)
+        response, many = self.get_queries('/api/ITAMS/my_computer/')
+
+        self.assertEqual(few, many)
+        self.assertEqual(len(response.data['repair_history']), 22)
+        self.assertEqual(response.data['total_repair_cost'], 220)
+        self.assertEqual(response.data['current_assignment']['employee'], 'jdoe')
+
+    def test_repairs_limit_pages_with_cursor(self):
+        self.add_repairs(5)
+        first = self.client.get('/api/ITAMS/my_computer/', {'repairs_limit': 3}).data
+        self.assertEqual(len(first['repair_history']), 3)
+        self.assertEqual(first['total_repair_cost'], 50)
+
+        second = self.client.get('/api/ITAMS/my_computer/', {
+            'repairs_limit': 3, 'repairs_cursor': first['repairs_next_cursor']
+        }).data
+        self.assertEqual(len(second['repair_history']), 2)
+        self.assertIsNone(second['repairs_next_cursor'])
+
+    def test_no_assignment_returns_404(self):
+        ComputerAssignment.objects.update(end_date=timezone.now())
+        self.assertEqual(self.client.get('/api/ITAMS/my_computer/').status_code, 404)
+
+
+class UserComputerCacheTests(AssetsTestCase):
+    def setUp(self):
+        super().setUp()
+        ComputerAssignment.objects.create(
+            computer=self.computer, employee=self.employee, start_date=timezone.now()
+        )
+        self.client.force_login(self.employee.user)
+
+    def test_cached_response_and_etag(self):
+        first = self.client.get('/api/ITAMS/my_computer/')
+        etag = first['ETag']
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.client.get('/api/ITAMS/my_computer/')
+        self.assertEqual(second.data, first.data)
+        self.assertFalse([q for q in queries if 'assets_' in q['sql']])
+
+        not_modified = self.client.get('/api/ITAMS/my_computer/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(caching.stats()['hits'], 2)
+        self.assertEqual(caching.stats()['misses'], 1)
+
+    def test_repair_invalidates_response(self):
+        etag = self.client.get('/api/ITAMS/my_computer/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            ComputerRepairHistory.objects.create(computer=self.computer, repaired_component='RAM', repair_cost='5.00')
+
+        response = self.client.get('/api/ITAMS/my_computer/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['repair_history']), 1)
+
+    def test_ended_assignment_invalidates_user(self):
+        self.client.get('/api/ITAMS/my_computer/')
+        assignment = ComputerAssignment.objects.get(computer=self.computer)
+        with self.captureOnCommitCallbacks(execute=True):
+            assignment.end_date = timezone.now()
+            assignment.save()
+            # a read before the commit caches the old state again; the invalidation must come after it
+            caching.set_computer_id(self.employee.user.pk, self.computer.pk)
+
+        self.assertIsNone(caching.get_computer_id(self.employee.user.pk))
+        self.assertEqual(self.client.get('/api/ITAMS/my_computer/').status_code, 404)
+
+    def test_stale_pointer_is_not_followed(self):
+        bob = create_employee('bob', self.department, self.role)
+        spare = Computer.objects.create(computer_name='HP', department=self.department)
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_return([self.computer.pk])
+            bulk_assign([(self.computer.pk, bob.pk), (spare.pk, self.employee.pk)])
+        # e.g. set from a lagging replica after the invalidation
+        caching.set_computer_id(self.employee.user.pk, self.computer.pk)
+
+        response = self.client.get('/api/ITAMS/my_computer/')
+        self.assertEqual((response.status_code, response.data['asset_tag']), (200, spare.asset_tag))
+        self.assertIsNone(caching.get_computer_id(self.employee.user.pk))
+        self.assertEqual(self.client.get('/api/ITAMS/my_computer/').data['asset_tag'], spare.asset_tag)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_return([spare.pk])
+        caching.set_computer_id(self.employee.user.pk, self.computer.pk)
+        self.assertEqual(self.client.get('/api/ITAMS/my_computer/').status_code, 404)
+        self.assertIsNone(caching.get_computer_id(self.employee.user.pk))
+
+
+class ComputerListViewTests(AssetsTestCase):
+    def setUp(self):
+        super().setUp()
+        staff = User.objects.get(username='jdoe')
+        staff.is_staff = True
+        staff.save()
+        self.client.force_login(staff)
+        with self.captureOnCommitCallbacks(execute=True):
+            ComputerAssignment.objects.create(
+                computer=self.computer, employee=self.employee, start_date=timezone.now()
+            )
+            for _ in range(3):
+                computer = Computer.objects.create(computer_name='HP', department=self.department)
+                ComputerInfo.objects.create(
+                    computer=computer, brand='HP', name='EliteBook', screen_type='IPS',
+                    screen_aspect_ratio='16:9', memory_size=16, storage_type='SSD', storage_size='512 GB'
+                )
+
+    def test_rows_do_not_add_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/ITAMS/computers/')
+        results = response.data['results']
+        self.assertEqual(len(results), 4)
+        self.assertEqual(results[0]['current_user'], 'jdoe')
+        self.assertIsNone(results[0]['info'])
+        self.assertEqual(results[1]['info']['brand'], 'HP')
+        # session, user and the summary page
+        self.assertEqual(len(queries), 3)
+
+    def test_filters_and_cursor(self):
+        response = self.client.get('/api/ITAMS/computers/', {
+            'brand': 'HP', 'memory_size': 16, 'status': 'Inventory', 'department': 'Sales and Marketing', 'page_size': 2
+        })
+        self.assertEqual(len(response.data['results']), 2)
+        next_page = self.client.get(response.data['next'])
+        self.assertEqual(len(next_page.data['results']), 1)
+
+    def test_invalid_status(self):
+        self.assertEqual(self.client.get('/api/ITAMS/computers/', {'status': 'Lost'}).status_code, 400)
+
+
+class OpenAssignmentConstraintTests(AssetsTestCase):
+    def test_second_open_assignment_is_rejected(self):
+        ComputerAssignment.objects.create(computer=self.computer, employee=self.employee, start_date=timezone.now())
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ComputerAssignment.objects.create(computer=self.computer, employee=self.employee, start_date=timezone.now())
+
+    def test_ended_assignments_do_not_collide(self):
+        for _ in range(2):
+            ComputerAssignment.objects.create(
+                computer=self.computer, employee=self.employee, start_date=timezone.now(), end_date=timezone.now()
+            )
+        ComputerAssignment.objects.create(computer=self.computer, employee=self.employee, start_date=timezone.now())
+        self.assertEqual(ComputerAssignment.objects.filter(computer=self.computer).count(), 3)
+
+
+class FleetExportTests(AssetsTestCase):
+    def add_repairs(self, count):
+        for offset in range(0, count, 10000):
+            ComputerRepairHistory.objects.bulk_create([
+                ComputerRepairHistory(
+                    computer=self.computer, repaired_component='Storage', repair_cost='99.99',
+                    date_of_repair=date(2024, 1, 1) + timedelta(days=i % 365), comments='replaced disk'
+                ) for i in range(offset, min(offset + 10000, count))
+            ])
+
+    def export_peak_memory(self):
+        tracemalloc.start()
+        try:
+            lines = sum(1 for _ in stream_csv(export_rows(chunk_size=2000)))
+            return lines, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    def test_peak_memory_stays_bounded(self):
+        self.add_repairs(20000)
+        _, small_peak = self.export_peak_memory()
+        self.add_repairs(180000)
+        lines, peak = self.export_peak_memory()
+
+        # header + computer + 200k repairs
+        self.assertEqual(lines, 200002)
+        self.assertLess(peak, 10 * 1024 * 1024)
+        self.assertLess(peak, small_peak * 2)
+
+    def test_rows_are_fetched_in_keyset_batches(self):
+        self.add_repairs(5)
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(export_rows(chunk_size=2))
+        self.assertEqual([row[0] for row in rows[2:]], ['repair'] * 5)
+        repair_queries = [q['sql'] for q in queries if 'FROM "assets_computerrepairhistory"' in q['sql']]
+        # a LIMIT per batch, so the driver never holds more than chunk_size rows
+        self.assertEqual(len(repair_queries), 3)
+        self.assertTrue(all('LIMIT 2' in sql for sql in repair_queries))
+
+    def test_endpoint_filters_by_date_range(self):
+        self.add_repairs(400)
+        staff = User.objects.get(username='jdoe')
+        staff.is_staff = True
+        staff.save()
+        self.client.force_login(staff)
+
+        response = self.client.get('/api/ITAMS/export/', {'start': '2024-01-01', 'end': '2024-01-31'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[0], 'record_type')
+        self.assertEqual(len([line for line in lines if line.startswith('repair,')]), 62)
+
+
+class RepairRollupTests(AssetsTestCase):
+    def add_repair(self, component, cost, repaired_on):
+        return ComputerRepairHistory.objects.create(
+            computer=self.computer, repaired_component=component, repair_cost=cost, date_of_repair=repaired_on
+        )
+
+    def assertRollupsMatchRebuild(self):
+        incremental = list(RepairCostRollup.objects.order_by('pk').values_list(
+            'department', 'repaired_component', 'month', 'total_cost', 'repair_count'
+        ))
+        totals = list(ComputerRepairTotal.objects.values_list('computer', 'total_cost', 'repair_count', 'last_repair_date'))
+        rollups.rebuild()
+        rebuilt = list(RepairCostRollup.objects.order_by('pk').values_list(
+            'department', 'repaired_component', 'month', 'total_cost', 'repair_count'
+        ))
+        self.assertEqual(
+            sorted(row for row in incremental if row[4]),
+            sorted(rebuilt),
+        )
+        self.assertEqual(totals, list(ComputerRepairTotal.objects.values_list(
+            'computer', 'total_cost', 'repair_count', 'last_repair_date'
+        )))
+
+    def test_incremental_rollups_match_rebuild(self):
+        self.add_repair('RAM', '40.00', date(2024, 1, 5))
+        self.add_repair('RAM', '60.00', date(2024, 1, 20))
+        latest = self.add_repair('Display', '120.00', date(2024, 3, 1))
+
+        edited = ComputerRepairHistory.objects.get(date_of_repair=date(2024, 1, 20))
+        edited.repaired_component = 'Storage'
+        edited.date_of_repair = date(2024, 2, 2)
+        edited.save()
+        ComputerRepairHistory.objects.get(pk=latest.pk).delete()
+
+        total = ComputerRepairTotal.objects.get(computer=self.computer)
+        self.assertEqual(total.total_cost, Decimal('100.00'))
+        self.assertEqual(total.last_repair_date, date(2024, 2, 2))
+        self.assertRollupsMatchRebuild()
+
+    def test_save_without_loading_recounts(self):
+        repair = self.add_repair('RAM', '40.00', date(2024, 1, 5))
+        self.add_repair('RAM', '10.00', date(2024, 1, 9))
+        ComputerRepairHistory(
+            pk=repair.pk, computer=self.computer, repaired_component='Display', repair_cost='25.00',
+            date_of_repair=date(2024, 2, 1),
+        ).save()
+        self.assertEqual(
+            sorted(RepairCostRollup.objects.filter(repair_count__gt=0).values_list('repaired_component', 'total_cost')),
+            [('Display', Decimal('25.00')), ('RAM', Decimal('10.00'))],
+        )
+        self.assertRollupsMatchRebuild()
+
+    def test_spend_follows_a_computer_between_departments(self):
+        repair = self.add_repair('RAM', '10.00', date(2024, 1, 5))
+        it = Department.objects.create(name='IT')
+        computer = Computer.objects.get(pk=self.computer.pk)
+        computer.department = it
+        computer.save()
+
+        edited = ComputerRepairHistory.objects.get(pk=repair.pk)
+        edited.repair_cost = Decimal('20.00')
+        edited.save()
+        self.assertEqual(
+            list(RepairCostRollup.objects.filter(repair_count__gt=0).values_list('department', 'total_cost')),
+            [(it.pk, Decimal('20.00'))],
+        )
+        self.assertRollupsMatchRebuild()
+
+        ComputerRepairHistory.objects.get(pk=repair.pk).delete()
+        self.assertFalse(RepairCostRollup.objects.filter(repair_count__gt=0).exists())
+        self.assertFalse(RepairCostRollup.objects.filter(total_cost__lt=0).exists())
+
+    def test_analytics_endpoint(self):
+        self.add_repair('RAM', '40.00', date(2024, 1, 5))
+        self.add_repair('MB', '60.00', date(2024, 2, 5))
+        staff = User.objects.get(username='jdoe')
+        staff.is_staff = True
+        staff.save()
+        self.client.force_login(staff)
+
+        response = self.client.get('/api/ITAMS/analytics/repair_costs/', {'group_by': 'department', 'year': 2024})
+        self.assertEqual(response.data, [
+            {'department': 'Sales and Marketing', 'total_cost': Decimal('100.00'), 'repair_count': 2}
+        ])
+
+
+class BulkAssignmentTests(AssetsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.employees = [self.employee] + [
+            create_employee(f'user{i}', self.department, self.role) for i in range(3)
+        ]
+        self.computers = [self.computer] + [
+            Computer.objects.create(computer_name='Dell', department=self.department) for _ in range(3)
+        ]
+
+    def test_bulk_assign_and_return(self):
+        pairs = [(c.pk, e.pk) for c, e in zip(self.computers, self.employees)]
+        # 4 validation reads, INSERT, UPDATE ... CASE, transitions INSERT and the atomic block's SAVEPOINT/RELEASE
+        with self.assertNumQueries(9):
+            self.assertEqual(bulk_assign(pairs), 4)
+        self.assertEqual(
+            list(Computer.objects.order_by('pk').values_list('status', 'current_user')),
+            [('Issued', e.pk) for e in self.employees],
+        )
+
+        # holders, assignments UPDATE, reconcile SELECT/UPDATE, transitions INSERT and SAVEPOINT/RELEASE
+        with self.assertNumQueries(7):
+            self.assertEqual(bulk_return([c.pk for c in self.computers]), 4)
+        self.assertEqual(set(Computer.objects.values_list('status', 'current_user')), {('Inventory', None)})
+        self.assertFalse(ComputerAssignment.objects.filter(end_date__isnull=True).exists())
+
+    def test_invalid_batch_writes_nothing(self):
+        Computer.objects.filter(pk=self.computers[1].pk).update(status='Faulty')
+        pairs = [
+            (self.computers[0].pk, self.employees[0].pk),
+            (self.computers[1].pk, self.employees[1].pk),
+            (self.computers[2].pk, self.employees[0].pk),
+        ]
+        with self.assertRaises(DjangoValidationError) as raised:
+            bulk_assign(pairs)
+        self.assertEqual(len(raised.exception.messages), 3)
+        self.assertFalse(ComputerAssignment.objects.exists())
+
+
+class OffboardingTests(AssetsTestCase):
+    def create_holder(self, username, closed_assignments):
+        employee = create_employee(username, self.department, self.role)
+        computer = Computer.objects.create(computer_name='Dell', department=self.department)
+        ComputerAssignment.objects.bulk_create([
+            ComputerAssignment(computer=computer, employee=employee, start_date=timezone.now(), end_date=timezone.now())
+            for _ in range(closed_assignments)
+        ])
+        ComputerAssignment.objects.create(computer=computer, employee=employee, start_date=timezone.now())
+        return employee.user, computer
+
+    def delete_queries(self, user):
+        with CaptureQueriesContext(connection) as queries:
+            user.delete()
+        return len(queries)
+
+    def test_user_delete_cost_does_not_grow_with_assignments(self):
+        few_user, few_computer = self.create_holder('few', 1)
+        many_user, many_computer = self.create_holder('many', 20)
+
+        self.assertEqual(self.delete_queries(few_user), self.delete_queries(many_user))
+        for computer in (few_computer, many_computer):
+            computer.refresh_from_db()
+            self.assertEqual(computer.status, 'Inventory')
+            self.assertIsNone(computer.current_user)
+
+    def test_batch_delete(self):
+        holders = [self.create_holder(f'batch{i}', 2) for i in range(5)]
+        delete_users(User.objects.filter(username__startswith='batch'))
+
+        self.assertFalse(User.objects.filter(username__startswith='batch').exists())
+        self.assertEqual(
+            set(Computer.objects.filter(pk__in=[c.pk for _, c in holders]).values_list('status', flat=True)),
+            {'Inventory'},
+        )
+
+
+class AdminChangelistQueryTests(AssetsTestCase):
+    changelists = ['computer', 'computerrepairhistory', 'employee', 'role']
+
+    def setUp(self):
+        super().setUp()
+        admin_user = self.employee.user
+        admin_user.is_staff = admin_user.is_superuser = True
+        admin_user.save()
+        self.client.force_login(admin_user)
+
+    def add_rows(self, start, count):
+        for i in range(start, start + count):
+            employee = create_employee(f'staff{i}', self.department, self.role)
+            Role.objects.create(department=self.department, name=f'Role {i}')
+            computer = Computer.objects.create(computer_name='Dell', department=self.department)
+            ComputerAssignment.objects.create(computer=computer, employee=employee, start_date=timezone.now())
+            ComputerRepairHistory.objects.create(computer=computer, repaired_component='RAM', repair_cost='10.00')
+
+    def changelist_queries(self):
+        counts = {}
+        for model in self.changelists:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(f'/admin/assets/{model}/')
+            self.assertEqual(response.status_code, 200)
+            counts[model] = len(queries)
+        return counts
+
+    def test_query_count_per_page_is_constant(self):
+        self.add_rows(0, 2)
+        self.changelist_queries()  # warm the cached filter choices
+        few = self.changelist_queries()
+        self.add_rows(2, 10)
+        self.changelist_queries()  # new roles invalidated the cached choices
+        self.assertEqual(self.changelist_queries(), few)
+
+    def test_filter_choices_are_cached(self):
+        self.changelist_queries()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/admin/assets/employee/')
+        self.assertFalse([q for q in queries if 'FROM "assets_department"' in q['sql'] and 'ORDER BY' in q['sql']])
+
+
+class ComputerChangePageTests(AssetsTestCase):
+    def setUp(self):
+        super().setUp()
+        admin_user = self.employee.user
+        admin_user.is_staff = admin_user.is_superuser = True
+        admin_user.save()
+        self.client.force_login(admin_user)
+        self.history_employee = create_employee('history', self.department, self.role)
+
+    def add_history(self, count):
+        employee = self.history_employee
+        now = timezone.now()
+        ComputerAssignment.objects.bulk_create([
+            ComputerAssignment(computer=self.computer, employee=employee,
+                               start_date=now - timedelta(days=i + 1), end_date=now - timedelta(days=i))
+            for i in range(count)
+        ])
+        ComputerRepairHistory.objects.bulk_create([
+            ComputerRepairHistory(computer=self.computer, repaired_component='RAM', repair_cost='10.00',
+                                  date_of_repair=date.today() - timedelta(days=i))
+            for i in range(count)
+        ])
+
+    def change_page(self, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/admin/assets/computer/{self.computer.pk}/change/{query}')
+        self.assertEqual(response.status_code, 200)
+        return response, queries
+
+    def test_computer_is_loaded_once(self):
+        self.add_history(5)
+        response, queries = self.change_page()
+        computer_reads = [q for q in queries if q['sql'].startswith('SELECT') and 'FROM "assets_computer" ' in q['sql']]
+        self.assertEqual(len(computer_reads), 1)
+
+    def test_long_history_is_truncated(self):
+        limit = ComputerAdmin.inlines[1].max_rows
+        self.add_history(limit)
+        _, bounded = self.change_page()
+        self.add_history(limit * 2)
+        response, queries = self.change_page()
+        self.assertEqual(len(queries), len(bounded))
+        self.assertEqual(response.context['inline_admin_formsets'][1].formset.total_form_count(), limit)
+        self.assertContains(response, 'all_assignments=1')
+        self.assertContains(response, 'all_repairs=1')
+
+        response, _ = self.change_page('?all_assignments=1')
+        self.assertEqual(response.context['inline_admin_formsets'][1].formset.total_form_count(), limit * 3)
+
+
+@override_settings(
+    LOGIN_RATE_LIMITS={'ip': (10, 60), 'username': (3, 300)},
+    PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+)
+class LoginRateLimitTests(AssetsTestCase):
+    def login(self, username, password='wrong', ip='10.0.0.1'):
+        return self.client.post('/api/ITAMS/login/', {'username': username, 'password': password}, REMOTE_ADDR=ip)
+
+    def test_username_limit_returns_429_with_retry_after(self):
+        for _ in range(3):
+            self.assertEqual(self.login('jdoe').status_code, 401)
+        response = self.login('jdoe')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        # other users behind the same address are not affected
+        self.assertEqual(self.login('asmith').status_code, 401)
+
+    def test_ip_limit(self):
+        statuses = [self.login(f'user{i}').status_code for i in range(11)]
+        self.assertEqual(statuses, [401] * 10 + [429])
+        self.assertEqual(self.login('user99', ip='10.0.0.2').status_code, 401)
+
+    def test_successful_login_resets_username_attempts(self):
+        user = self.employee.user
+        user.set_password('secret')
+        user.save()
+        self.login('jdoe')
+        self.login('jdoe')
+        self.assertEqual(self.login('jdoe', 'secret').status_code, 200)
+        self.assertEqual(self.login('jdoe').status_code, 401)
+
+    def test_window_slides(self):
+        start = 1_000_000 * 60
+        for second in range(5):
+            self.assertEqual(ratelimit.hit('test', 'a', 5, 60, now=start + second), 0)
+        self.assertEqual(ratelimit.hit('test', 'a', 5, 60, now=start + 30), 50)
+
+        # half of the previous window's six attempts still count 30s into the next one
+        self.assertEqual(ratelimit.hit('test', 'a', 5, 60, now=start + 90), 0)
+        self.assertEqual(ratelimit.hit('test', 'a', 5, 60, now=start + 91), 0)
+        retry_after = ratelimit.hit('test', 'a', 5, 60, now=start + 92)
+        self.assertEqual(retry_after, 18)
+        self.assertEqual(ratelimit.hit('test', 'a', 5, 60, now=start + 92 + retry_after), 0)
+
+    def test_parallel_attempts_never_exceed_the_limit(self):
+        limit, attempts, threads = 50, 40, 10
+        results = []
+        barrier = threading.Barrier(threads)
+
+        def worker():
+            barrier.wait()
+            outcomes = [ratelimit.hit('parallel', '10.0.0.1', limit, 60) for _ in range(attempts)]
+            results.extend(outcomes)
+
+        started = time.perf_counter()
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        per_second = len(results) / (time.perf_counter() - started)
+
+        self.assertEqual(len(results), threads * attempts)
+        self.assertEqual(results.count(0), limit)
+        self.assertGreater(per_second, 1000)
+
+
+class ConnectionReuseTests(TransactionTestCase):
+    def test_connection_is_reused_across_requests(self):
+        department = Department.objects.create(name='Sales and Marketing')
+        role = Role.objects.create(department=department, name='Account Manager')
+        create_employee('jdoe', department, role)
+
+        connection.settings_dict['CONN_MAX_AGE'] = 60
+        try:
+            out = io.StringIO()
+            call_command('check_connection_reuse', requests=10, username='jdoe', stdout=out)
+        finally:
+            connection.settings_dict['CONN_MAX_AGE'] = 0
+        opened = int(re.search(r'default: (\d+) connection', out.getvalue()).group(1))
+        self.assertLessEqual(opened, 1)
+
+    def test_production_profile(self):
+        with mock.patch.dict(os.environ, {'DB_ENGINE': 'mysql', 'DB_POOL_MAX_SIZE': '20'}):
+            config = settings_production.database()
+        self.assertEqual(config['CONN_MAX_AGE'], 60)
+        self.assertTrue(config['CONN_HEALTH_CHECKS'])
+        self.assertNotIn('pool', config['OPTIONS'])
+
+        env = {'DB_ENGINE': 'postgresql', 'DB_POOL_MAX_SIZE': '20', 'DB_HOST': 'primary', 'DB_REPLICA_HOST': 'replica'}
+        with mock.patch.dict(os.environ, env):
+            config = settings_production.database()
+            replica = settings_production.database('DB_REPLICA_')
+        self.assertEqual(config['CONN_MAX_AGE'], 0)
+        self.assertEqual(config['OPTIONS']['pool']['max_size'], 20)
+        self.assertEqual((config['HOST'], replica['HOST']), ('primary', 'replica'))
+
+
+class ReplicaRouterTests(SimpleTestCase):
+    @mock.patch.dict(settings.DATABASES, {'replica': {}})
+    def test_reads_go_to_the_replica_only_inside_opted_in_views(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Computer))
+        with replica_reads():
+            self.assertEqual(router.db_for_read(Computer), 'replica')
+            self.assertIsNone(router.db_for_read(User))
+            self.assertEqual(router.db_for_write(Computer), 'default')
+
+
+class AsyncDashboardTests(AssetsTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            ComputerAssignment.objects.create(computer=self.computer, employee=self.employee, start_date=timezone.now())
+            for i in range(5):
+                ComputerRepairHistory.objects.create(
+                    computer=self.computer, repaired_component='RAM', repair_cost='10.00',
+                    date_of_repair=date.today() - timedelta(days=i)
+                )
+        self.client.force_login(self.employee.user)
+        self.async_client.force_login(self.employee.user)
+
+    async def test_my_computer_matches_the_sync_view(self):
+        sync_response = await sync_to_async(self.client.get)('/api/ITAMS/my_computer/', {'repairs_limit': 2})
+        cache.clear()
+        response = await self.async_client.get('/api/ITAMS/async/my_computer/', {'repairs_limit': 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), sync_response.json())
+        self.assertEqual(response['ETag'], sync_response['ETag'])
+
+        cached = await self.async_client.get(
+            '/api/ITAMS/async/my_computer/', {'repairs_limit': 2}, headers={'If-None-Match': response['ETag']}
+        )
+        self.assertEqual(cached.status_code, 304)
+
+    async def test_stale_pointer_is_not_followed(self):
+        bob = await sync_to_async(create_employee)('bob', self.department, self.role)
+
+        def reassign():
+            with self.captureOnCommitCallbacks(execute=True):
+                bulk_return([self.computer.pk])
+                bulk_assign([(self.computer.pk, bob.pk)])
+        await sync_to_async(reassign)()
+        await caching.aset_computer_id(self.employee.user_id, self.computer.pk)
+
+        response = await self.async_client.get('/api/ITAMS/async/my_computer/')
+        self.assertEqual(response.status_code, 404)
+        self.assertIsNone(await caching.aget_computer_id(self.employee.user_id))
+
+    async def test_repairs_are_paged(self):
+        first = (await self.async_client.get('/api/ITAMS/async/my_computer/repairs/', {'repairs_limit': 3})).json()
+        self.assertEqual(len(first['results']), 3)
+        rest = (await self.async_client.get('/api/ITAMS/async/my_computer/repairs/', {
+            'repairs_limit': 3, 'repairs_cursor': first['next_cursor']
+        })).json()
+        self.assertEqual(len(rest['results']), 2)
+        self.assertIsNone(rest['next_cursor'])
+
+        response = await self.async_client.get('/api/ITAMS/async/my_computer/repairs/', {'repairs_limit': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_computer_list_is_staff_only_and_paged(self):
+        response = await self.async_client.get('/api/ITAMS/async/computers/')
+        self.assertEqual(response.status_code, 403)
+
+        await User.objects.filter(pk=self.employee.user_id).aupdate(is_staff=True)
+        computer = await Computer.objects.acreate(computer_name='HP', department=self.department)
+        await sync_to_async(summaries.refresh)([computer.pk])
+        first = (await self.async_client.get('/api/ITAMS/async/computers/', {'page_size': 1})).json()
+        self.assertEqual(first['results'][0]['current_user'], 'jdoe')
+        second = (await self.async_client.get(first['next'])).json()
+        self.assertEqual(second['results'][0]['computer_name'], 'HP')
+        self.assertIsNone(second['next'])
+
+
+class SearchTests(AssetsTestCase):
+    def setUp(self):
+        super().setUp()
+        staff = self.employee.user
+        staff.is_staff = staff.is_superuser = True
+        staff.save()
+        self.client.force_login(staff)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.laptop = Computer.objects.create(computer_name='HP', department=self.department)
+            ComputerInfo.objects.create(
+                computer=self.laptop, brand='HP', name='EliteBook', screen_type='IPS',
+                screen_aspect_ratio='16:9', memory_size=16, storage_type='SSD', storage_size='512 GB'
+            )
+            ComputerAssignment.objects.create(computer=self.laptop, employee=self.employee, start_date=timezone.now())
+            self.repair = ComputerRepairHistory.objects.create(
+                computer=self.laptop, repaired_component='MB', repair_cost='45.00',
+                comments='Replaced swollen battery'
+            )
+
+    def search(self, query):
+        response = self.client.get('/api/ITAMS/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [(row['asset_tag'], row['match']) for row in response.data['results']]
+
+    def test_document_follows_signals(self):
+        self.assertTrue(search.fulltext_available())
+        body = ComputerSearchDocument.objects.get(computer=self.laptop).body
+        for text in ('HP-SALES-AND-MARKETING-01', 'EliteBook', 'jdoe', 'Sales and Marketing', 'swollen battery'):
+            self.assertIn(text, body)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.repair.delete()
+        self.assertEqual(self.search('swollen'), [])
+
+    def test_ranked_words_and_tag_prefix(self):
+        self.assertEqual(self.search('swoll'), [(self.laptop.asset_tag, 'text')])
+        self.assertEqual(self.search('elitebook jdoe'), [(self.laptop.asset_tag, 'text')])
+        self.assertEqual(self.search('hp-sales'), [(self.laptop.asset_tag, 'tag')])
+        self.assertEqual(self.client.get('/api/ITAMS/search/').status_code, 400)
+
+    def test_bulk_writes_refresh_documents(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_return([self.laptop.pk])
+        self.assertNotIn('jdoe', ComputerSearchDocument.objects.get(computer=self.laptop).body)
+
+    def test_admin_search_uses_the_index(self):
+        response = self.client.get('/admin/assets/computerrepairhistory/', {'q': 'swollen'})
+        self.assertContains(response, '1 result')
+        response = self.client.get('/admin/assets/computerrepairhistory/', {'q': 'nothing-like-this'})
+        self.assertNotContains(response, 'HP-SALES-AND-MARKETING-01')
+
+    def test_admin_search_finds_every_substring_match(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for computer, comments in ((self.computer, 'wellness check'), (self.laptop, 'swelled screen')):
+                ComputerRepairHistory.objects.create(
+                    computer=computer, repaired_component='RAM', repair_cost='15.00', comments=comments
+                )
+        url = '/admin/assets/computerrepairhistory/'
+        # "well" starts a word in one comment and sits inside one in the other
+        self.assertContains(self.client.get(url, {'q': 'well'}), '2 results')
+        self.assertContains(self.client.get(url, {'q': 'ollen'}), '1 result')
+        with override_settings(JOB_QUEUE={'ENABLED': True}), mock.patch.object(search, 'containing') as containing:
+            self.assertContains(self.client.get(url, {'q': 'well'}), '2 results')
+        containing.assert_not_called()
+
+
+class HistoryTests(AssetsTestCase):
+    def setUp(self):
+        super().setUp()
+        staff = self.employee.user
+        staff.is_staff = staff.is_superuser = True
+        staff.save()
+        self.client.force_login(staff)
+        self.spare = Computer.objects.create(computer_name='HP', department=self.department)
+        self.start = timezone.now()
+        self.assigned = self.start + timedelta(days=1)
+        self.returned = self.start + timedelta(days=2)
+        bulk_assign([(self.computer.pk, self.employee.pk)], start_date=self.assigned)
+        bulk_return([self.computer.pk], end_date=self.returned)
+
+    def as_of(self, tag, moment):
+        return self.client.get(f'/api/ITAMS/computers/{tag}/as_of/{moment.isoformat()}/'.replace('+', '%2B'))
+
+    def test_computer_as_of(self):
+        tag = self.computer.asset_tag
+        response = self.as_of(tag, self.assigned + timedelta(hours=1))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            (response.data['status'], response.data['current_user'], response.data['since']),
+            ('Issued', 'jdoe', self.assigned),
+        )
+        self.assertEqual(self.as_of(tag, self.returned).data['status'], 'Inventory')
+        self.assertEqual(self.as_of(tag, self.start - timedelta(days=1)).status_code, 404)
+        # a bare date means the end of that day
+        self.assertEqual(self.client.get(f'/api/ITAMS/computers/{tag}/as_of/2999-01-01/').data['status'], 'Inventory')
+        self.assertEqual(self.client.get(f'/api/ITAMS/computers/{tag}/as_of/yesterday/').status_code, 400)
+
+    def test_transitions_are_append_only(self):
+        transition = ComputerTransition.objects.filter(computer=self.computer).first()
+        with self.assertRaises(DjangoValidationError):
+            transition.save()
+        with self.assertRaises(DjangoValidationError):
+            transition.delete()
+
+    def test_fleet_from_snapshot_matches_replay(self):
+        moments = [self.start - timedelta(days=1), self.assigned, self.returned + timedelta(days=1)]
+        replayed = [history.fleet_as_of(moment)[0] for moment in moments]
+
+        snapshot = history.take_snapshot()
+        self.assertEqual(snapshot.computer_count, 2)
+        # a snapshot taken later is not used for earlier moments
+        self.assertEqual([history.fleet_as_of(moment)[0] for moment in moments], replayed)
+        self.assertEqual(replayed[1][0]['status'], 'Issued')
+
+        # latest snapshot, its rows, the transitions after it and the department names
+        # (nobody holds a computer by then, so there are no usernames to look up)
+        with self.assertNumQueries(4):
+            computers, used = history.fleet_as_of(self.returned + timedelta(days=1))
+        self.assertEqual((computers, used), (replayed[2], snapshot))
+
+    def test_back_dated_writes_after_a_snapshot(self):
+        ComputerTransition.objects.filter(computer=self.spare).update(occurred_at=self.start - timedelta(days=1))
+        snapshot = history.take_snapshot()
+        # recorded after the snapshot, dated before it and its overlap window
+        bulk_assign([(self.spare.pk, self.employee.pk)], start_date=snapshot.taken_at - timedelta(hours=1))
+
+        moment = snapshot.taken_at + timedelta(minutes=1)
+        fleet = {row['asset_tag']: row for row in history.fleet_as_of(moment)[0]}
+        single = history.computer_as_of(self.spare.asset_tag, moment)
+        self.assertEqual((single['status'], single['current_user']), ('Issued', 'jdoe'))
+        self.assertEqual(fleet[self.spare.asset_tag]['status'], single['status'])
+        self.assertEqual(fleet[self.spare.asset_tag]['current_user'], single['current_user'])
+        self.assertEqual(fleet[self.computer.asset_tag]['status'], 'Inventory')
+
+    def test_deleted_computers_leave_the_fleet(self):
+        history.take_snapshot()
+        before = timezone.now()
+        self.spare.delete()
+        after = self.returned + timedelta(days=1)
+
+        response = self.client.get(f'/api/ITAMS/fleet/as_of/{after.date().isoformat()}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(response.data['by_status'], {'Inventory': 1})
+        self.assertEqual(len(history.fleet_as_of(before)[0]), 2)
+        self.assertIsNone(history.computer_as_of(self.spare.asset_tag, after))
+
+        response = self.client.get(
+            f'/api/ITAMS/fleet/as_of/{after.date().isoformat()}/', {'status': 'Issued', 'department': self.department.pk}
+        )
+        self.assertEqual(response.data['computers'], [])
+
+    def test_snapshot_command_prunes(self):
+        out = io.StringIO()
+        for _ in range(3):
+            call_command('snapshot_fleet', keep=2, stdout=out)
+        self.assertEqual(FleetSnapshot.objects.count(), 2)
+        self.assertIn('Snapshot of 2 computer(s)', out.getvalue())
+
+
+class BenchmarkSuiteTests(TestCase):
+    def fleet(self, seed):
+        with transaction.atomic():
+            benchmarks.generate_fleet(employees=12, computers=8, seed=seed)
+            rows = (
+                list(Computer.objects.order_by('asset_tag').values_list('asset_tag', 'department__name', 'status', 'info__brand')),
+                list(ComputerRepairHistory.objects.order_by('computer__asset_tag', 'date_of_repair', 'repair_cost').values_list(
+                    'computer__asset_tag', 'date_of_repair', 'repair_cost'
+                )),
+            )
+            transaction.set_rollback(True)
+        return rows
+
+    def test_fleet_is_seeded(self):
+        self.assertEqual(self.fleet(1), self.fleet(1))
+        self.assertNotEqual(self.fleet(1), self.fleet(2))
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], ALLOWED_HOSTS=['localhost'])
+    def test_report_and_comparison(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'baseline.json')
+        options = {'employees': 12, 'computers': 8, 'iterations': 2, 'login_iterations': 1, 'stdout': io.StringIO()}
+        call_command('benchmark_suite', output=path, **options)
+        with open(path) as baseline:
+            report = json.load(baseline)
+        self.assertEqual(report['meta']['fleet']['computers'], 8)
+        self.assertEqual(report['results']['computer_save']['queries'], 2)
+        self.assertIn('p99_ms', report['results']['login'])
+        self.assertFalse(Computer.objects.exists())
+
+        for row in report['results'].values():
+            row['queries'] -= 1
+        with open(path, 'w') as baseline:
+            json.dump(report, baseline)
+        with self.assertRaisesMessage(CommandError, 'regression(s)'):
+            call_command('benchmark_suite', compare=path, threshold=1000, stderr=io.StringIO(), **options)
+
+    @override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'], ALLOWED_HOSTS=['localhost'])
+    def test_default_ratio_runs(self):
+        # the defaults have half as many employees as computers, fewer than are issued
+        out = io.StringIO()
+        call_command('benchmark_suite', employees=10, computers=20, iterations=2, login_iterations=1, stdout=out)
+        self.assertIn('assignment_create', json.loads(out.getvalue())['results'])
+
+
+class RequestMetricsTests(AssetsTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.registry.reset()
+        ComputerAssignment.objects.create(computer=self.computer, employee=self.employee, start_date=timezone.now())
+        self.client.force_login(self.employee.user)
+
+    def scrape(self):
+        staff = create_employee('scraper', self.department, self.role).user
+        staff.is_staff = True
+        staff.save()
+        client = self.client_class()
+        client.force_login(staff)
+        response = client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    @override_settings(REQUEST_METRICS={'SAMPLE_RATE': 1, 'SERVER_TIMING': True})
+    def test_sampled_request(self):
+        response = self.client.get('/api/ITAMS/my_computer/')
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", app;dur=[\d.]+, cache;desc="0 hit, 1 miss"$')
+
+        body = self.scrape()
+        self.assertIn('itams_requests_total{view="my-computer",method="GET",status="200"} 1', body)
+        self.assertIn('itams_cache_requests_total{view="my-computer",result="miss"} 1', body)
+        self.assertRegex(body, r'itams_db_queries_sum\{view="my-computer"\} [1-9]')
+
+    @override_settings(REQUEST_METRICS={'SAMPLE_RATE': 0, 'SERVER_TIMING': True})
+    def test_unsampled_requests_are_only_timed(self):
+        response = self.client.get('/api/ITAMS/my_computer/')
+        self.assertNotIn('Server-Timing', response)
+        body = self.scrape()
+        self.assertIn('itams_request_duration_seconds_count{view="my-computer"} 1', body)
+        self.assertNotIn('itams_sampled_requests_total{view="my-computer"}', body)
+
+    def test_computer_save_depth(self):
+        def view(request):
+            self.computer.computer_name = 'Dell Latitude'
+            self.computer.save()
+            return HttpResponse()
+
+        metrics.RequestMetricsMiddleware(view)(RequestFactory().post('/'))
+        body = metrics.render()
+        self.assertIn('itams_computer_saves_total{view="unresolved"} 1', body)
+        self.assertIn('itams_computer_save_depth_bucket{view="unresolved",le="0"} 0', body)
+        self.assertIn('itams_computer_save_depth_bucket{view="unresolved",le="1"} 1', body)
+
+    @override_settings(METRICS_TOKEN='s3cret')
+    def test_scraper_token(self):
+        client = self.client_class()
+        self.assertEqual(client.get('/metrics').status_code, 403)
+        self.assertEqual(client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = client.get('/metrics', HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+
+@override_settings(JOB_QUEUE={'ENABLED': True, 'MAX_ATTEMPTS': 2, 'RETRY_BACKOFF': 10})
+class JobQueueTests(AssetsTestCase):
+    def test_jobs_are_written_on_commit_once_per_key(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.enqueue('search.refresh', 'search.refresh:1', computer_id=1)
+            jobs.enqueue('search.refresh', 'search.refresh:1', computer_id=1)
+            jobs.enqueue('search.refresh', 'search.refresh:2', computer_id=2)
+            self.assertFalse(Job.objects.exists())
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.enqueue('search.refresh', 'search.refresh:2', computer_id=2)
+        self.assertEqual(sorted(Job.objects.values_list('key', flat=True)), ['search.refresh:1', 'search.refresh:2'])
+
+    def test_search_documents_are_built_by_the_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            laptop = Computer.objects.create(computer_name='HP', department=self.department)
+            ComputerRepairHistory.objects.create(
+                computer=laptop, repaired_component='RAM', repair_cost='10.00', comments='cracked hinge'
+            )
+        self.assertFalse(ComputerSearchDocument.objects.filter(computer=laptop).exists())
+        self.assertEqual(Job.objects.get().payload, {'computer_id': laptop.pk})
+
+        self.assertEqual(jobs.work(burst=True), 1)
+        self.assertIn('cracked hinge', ComputerSearchDocument.objects.get(computer=laptop).body)
+        self.assertEqual(Job.objects.get().status, Job.DONE)
+
+    def test_failures_back_off_then_fail(self):
+        calls = []
+        jobs.task('test.flaky')(lambda **payload: calls.append(payload) or 1 / 0)
+        self.addCleanup(jobs._tasks.pop, 'test.flaky')
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.enqueue('test.flaky', 'flaky', n=1)
+
+        started = timezone.now()
+        jobs.work(burst=True)
+        job = Job.objects.get(key='flaky')
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 1))
+        self.assertIn('ZeroDivisionError', job.last_error)
+        self.assertGreaterEqual(job.run_after, started + timedelta(seconds=10))
+        # not due yet
+        jobs.work(burst=True)
+        self.assertEqual(len(calls), 1)
+
+        Job.objects.filter(key='flaky').update(run_after=started)
+        jobs.work(burst=True)
+        self.assertEqual(Job.objects.get(key='flaky').status, Job.FAILED)
+        self.assertEqual(calls, [{'n': 1}, {'n': 1}])
+
+    def test_stats_view(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.enqueue('search.refresh', 'search.refresh:1', computer_id=self.computer.pk)
+            jobs.enqueue('search.refresh', 'search.refresh:2', computer_id=self.computer.pk)
+        jobs.run_claimed(jobs.claim('test', 1))
+
+        staff = self.employee.user
+        staff.is_staff = True
+        staff.save()
+        self.client.force_login(staff)
+        data = self.client.get('/api/ITAMS/jobs/stats/').data
+        self.assertEqual(data['depth'], {'queued': 1, 'running': 0, 'done': 1, 'failed': 0})
+        self.assertEqual(data['queued'][0]['task'], 'search.refresh')
+        self.assertEqual(data['done_in_window'], 1)
+        self.assertIsNotNone(data['latency_seconds']['p95'])
+
+
+class ComputerSummaryTests(AssetsTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assignment = ComputerAssignment.objects.create(
+                computer=self.computer, employee=self.employee, start_date=timezone.now()
+            )
+            ComputerInfo.objects.create(
+                computer=self.computer, brand='Dell', name='Latitude', screen_type='IPS',
+                screen_aspect_ratio='16:9', memory_size=16, storage_type='SSD', storage_size='512 GB'
+            )
+            ComputerRepairHistory.objects.create(computer=self.computer, repaired_component='RAM', repair_cost='50.00')
+
+    def test_rows_follow_writes(self):
+        summary = ComputerSummary.objects.get(pk=self.computer.pk)
+        self.assertEqual(
+            (summary.status, summary.username, summary.user_id, summary.department_name, summary.brand),
+            ('Issued', 'jdoe', self.employee.user_id, 'Sales and Marketing', 'Dell'),
+        )
+        self.assertEqual((summary.repair_count, summary.total_repair_cost), (1, Decimal('50.00')))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.department.name = 'Sales'
+            self.department.save()
+            self.assignment.end_date = timezone.now()
+            self.assignment.save()
+        summary = ComputerSummary.objects.get(pk=self.computer.pk)
+        self.assertEqual((summary.status, summary.user_id, summary.department_name), ('Inventory', None, 'Sales'))
+
+    def test_views_match_the_computer_serializers(self):
+        self.client.force_login(self.employee.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/ITAMS/my_computer/')
+        self.assertFalse([q for q in queries if 'FROM "assets_computer" ' in q['sql']])
+
+        computer = my_computer_queryset(self.employee.user).first()
+        set_repair_page(computer, list(repairs_page_queryset(computer, None)), None)
+        self.assertEqual(response.json(), json.loads(JSONRenderer().render(UserComputerSerializer(computer).data)))
+
+        listed = ComputerSummaryListSerializer(ComputerSummary.objects.get(pk=self.computer.pk)).data
+        self.assertEqual(listed, ComputerListSerializer(Computer.objects.get(pk=self.computer.pk)).data)
+
+    def test_rebuild_command(self):
+        ComputerSummary.objects.all().delete()
+        call_command('rebuild_computer_summaries', stdout=io.StringIO())
+        self.assertEqual(ComputerSummary.objects.get().username, 'jdoe')
+
+
+class BulkLoadTests(AssetsTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'repairs.json')
+
+    def repair(self, pk, computer=None):
+        return {'model': 'assets.computerrepairhistory', 'pk': pk, 'fields': {
+            'computer': computer or self.computer.pk, 'repaired_component': 'RAM', 'repair_cost': '10.00',
+            'date_of_repair': f'2024-01-{pk % 28 + 1:02d}', 'comments': 'Legacy log',
+        }}
+
+    def write(self, records):
+        with open(self.path, 'w') as output:
+            json.dump(records, output)
+
+    def test_json_records_stream_across_buffers(self):
+        records = [self.repair(pk) for pk in range(1, 6)]
+        stream = io.StringIO(json.dumps(records, indent=2))
+        self.assertEqual(list(bulkload.iter_json_records(stream, buffer_size=7)), records)
+        lines = io.StringIO('\n'.join(json.dumps(record) for record in records))
+        self.assertEqual(list(bulkload.iter_json_records(lines, buffer_size=7)), records)
+
+    def test_load_skips_signals_and_rebuilds_once(self):
+        self.write([self.repair(pk) for pk in range(1, 31)] + [{'model': 'assets.computerrepairhistory', 'fields': {
+            'computer': self.computer.pk, 'repaired_component': 'RAM', 'repair_cost': 'lots',
+        }}])
+        with mock.patch.object(rollups, 'repair_saved') as repair_saved:
+            stderr = io.StringIO()
+            call_command('bulk_load', self.path, chunk_size=7, stdout=io.StringIO(), stderr=stderr)
+        repair_saved.assert_not_called()
+        self.assertIn('record 31', stderr.getvalue())
+
+        totals = ComputerRepairTotal.objects.get(pk=self.computer.pk)
+        self.assertEqual((totals.repair_count, totals.total_cost), (30, Decimal('300.00')))
+        self.assertEqual(ComputerSummary.objects.get(pk=self.computer.pk).repair_count, 30)
+        self.assertIn('Legacy log', ComputerSearchDocument.objects.get(pk=self.computer.pk).body)
+        self.assertFalse(os.path.exists(f"{self.path}.checkpoint"))
+
+    def test_failed_load_resumes_from_checkpoint(self):
+        blocker = ComputerRepairHistory.objects.create(
+            computer=self.computer, repaired_component='RAM', repair_cost='1.00', date_of_repair=date(2023, 1, 1)
+        )
+        self.write([self.repair(pk) for pk in range(blocker.pk + 1, blocker.pk + 20)] + [self.repair(blocker.pk)])
+        with self.assertRaisesMessage(CommandError, '15 record(s) are loaded'):
+            call_command('bulk_load', self.path, chunk_size=5, stdout=io.StringIO())
+        self.assertEqual(ComputerRepairHistory.objects.count(), 16)
+        with self.assertRaisesMessage(CommandError, '--resume'):
+            call_command('bulk_load', self.path, chunk_size=5, stdout=io.StringIO())
+
+        blocker.delete()
+        call_command('bulk_load', self.path, chunk_size=5, resume=True, stdout=io.StringIO())
+        self.assertEqual(ComputerRepairHistory.objects.count(), 20)
+        self.assertEqual(ComputerRepairTotal.objects.get(pk=self.computer.pk).repair_count, 20)
+
+    def test_csv_of_one_model(self):
+        path = os.path.join(os.path.dirname(self.path), 'computers.csv')
+        with open(path, 'w', newline='') as output:
+            output.write('pk,computer_name,asset_tag,department,status,current_user\n')
+            output.write(f'9001,Legacy,LEGACY-SALES-AND-MARKETING-07,{self.department.pk},Inventory,\n')
+        call_command('bulk_load', path, model='assets.computer', stdout=io.StringIO())
+
+        computer = Computer.objects.create(computer_name='Legacy', department=self.department)
+        self.assertEqual(computer.asset_tag, 'LEGACY-SALES-AND-MARKETING-08')
+        self.assertEqual(ComputerTransition.objects.filter(computer_id=9001).count(), 1)
+
+    def test_loaded_departments_and_roles_reach_the_cached_choices(self):
+        caching.department_choices()
+        caching.role_choices()
+        self.write([
+            {'model': 'assets.department', 'pk': 900, 'fields': {'name': 'Legal'}},
+            {'model': 'assets.role', 'pk': 900, 'fields': {'department': 900, 'name': 'Counsel'}},
+        ])
+        call_command('bulk_load', self.path, stdout=io.StringIO())
+        self.assertIn((900, 'Legal'), caching.department_choices())
+        self.assertIn((900, 'Legal - Counsel'), caching.role_choices())
+
+
+class ReconcileComputersTests(AssetsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = Computer.objects.create(computer_name='HP', department=self.department)
+        ComputerAssignment.objects.create(computer=self.computer, employee=self.employee, start_date=timezone.now())
+        # drift, as left by writes that skip the signals
+        Computer.objects.filter(pk=self.computer.pk).update(status='Inventory', current_user=None)
+        Computer.objects.filter(pk=self.other.pk).update(status='Issued', current_user=self.employee)
+
+    def test_dry_run_prints_the_diff_only(self):
+        out = io.StringIO()
+        call_command('reconcile_computers', dry_run=True, chunk_size=1, stdout=out)
+        self.assertIn(f"{self.computer.asset_tag}: Inventory (no user) -> Issued (employee {self.employee.pk})", out.getvalue())
+        self.assertIn('2 computer(s) out of sync, none corrected', out.getvalue())
+        self.assertEqual(Computer.objects.get(pk=self.computer.pk).status, 'Inventory')
+
+    def test_corrects_the_fleet(self):
+        out = io.StringIO()
+        call_command('reconcile_computers', chunk_size=1, stdout=out)
+        self.assertIn('2 computer(s) out of sync, 2 corrected', out.getvalue())
+        self.assertEqual(
+            dict(Computer.objects.values_list('pk', 'status')),
+            {self.computer.pk: 'Issued', self.other.pk: 'Inventory'},
+        )
+        self.assertTrue(ComputerTransition.objects.filter(computer_id=self.other.pk, status='Inventory').exists())
+        self.assertEqual(Computer.objects.state_changes(), [])
+
+    def test_admin_inline_delete_ends_the_assignment(self):
+        Computer.objects.reconcile_state()
+        assignment = ComputerAssignment.objects.get(computer=self.computer)
+        request = RequestFactory().post('/')
+        request.user = self.employee.user
+        request.user.is_staff = request.user.is_superuser = True
+        FormSet = ComputerAssignmentInline(Computer, admin.site).get_formset(request, self.computer)
+        prefix = FormSet.get_default_prefix()
+        formset = FormSet({
+            f'{prefix}-TOTAL_FORMS': '1', f'{prefix}-INITIAL_FORMS': '1',
+            f'{prefix}-0-id': assignment.pk, f'{prefix}-0-computer': self.computer.pk, f'{prefix}-0-DELETE': 'on',
+        }, instance=self.computer, prefix=prefix)
+        self.assertTrue(formset.is_valid(), formset.errors)
+        formset.save()
+        self.assertIsNotNone(ComputerAssignment.objects.get(pk=assignment.pk).end_date)
+        self.assertEqual(Computer.objects.get(pk=self.computer.pk).status, 'Inventory')
+
+
+class HardwareCatalogueTests(AssetsTestCase):
+    def add_info(self, computer, brand='Dell', memory_size=16, storage_size='1 TB'):
+        return ComputerInfo.objects.create(
+            computer=computer, brand=brand, name='Latitude', screen_type='IPS', screen_aspect_ratio='16:9',
+            memory_size=memory_size, storage_type='SSD', storage_size=storage_size,
+        )
+
+    def test_storage_sizes_in_gb(self):
+        self.assertEqual(
+            [catalogue.storage_gb(size) for size in ('256 GB', '1 TB', '1.5tb', 'big')], [256, 1024, 1536, None]
+        )
+
+    def test_units_share_a_catalogue_row(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = self.add_info(self.computer)
+        other = Computer.objects.create(computer_name='Dell', department=self.department)
+        with self.assertNumQueries(1):
+            # spelled differently, and resolved from the in-process cache
+            second = self.add_info(other, brand=' dell ')
+        self.assertEqual(first.hardware_model_id, second.hardware_model_id)
+        self.assertEqual((second.brand, second.storage_size_gb), ('Dell', 1024))
+        self.assertEqual(HardwareModel.objects.count(), 1)
+
+    def test_normalise_command_links_existing_rows(self):
+        self.add_info(self.computer)
+        ComputerInfo.objects.update(hardware_model=None, storage_size_gb=None, brand='DELL')
+        HardwareModel.objects.all().delete()
+
+        out = io.StringIO()
+        call_command('normalise_hardware_specs', stdout=out)
+        self.assertIn('1 computer(s) updated', out.getvalue())
+        info = ComputerInfo.objects.select_related('hardware_model').get()
+        self.assertEqual((info.hardware_model.brand, info.brand, info.storage_size_gb), ('DELL', 'DELL', 1024))
+        self.assertEqual(ComputerSummary.objects.get().storage_size_gb, 1024)
+
+    def test_spec_ranges_in_the_fleet_listing(self):
+        staff = self.employee.user
+        staff.is_staff = True
+        staff.save()
+        self.client.force_login(staff)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_info(self.computer, memory_size=4, storage_size='256 GB')
+            for memory_size in (8, 32):
+                self.add_info(Computer.objects.create(computer_name='HP', department=self.department), memory_size=memory_size)
+
+        response = self.client.get('/api/ITAMS/computers/', {'department': 'Sales and Marketing', 'memory_size__lt': 8})
+        self.assertEqual([row['asset_tag'] for row in response.data['results']], [self.computer.asset_tag])
+        response = self.client.get('/api/ITAMS/computers/', {'storage_size_gb__gte': 512, 'memory_size__lte': 8})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(self.client.get('/api/ITAMS/computers/', {'memory_size__lt': 'few'}).status_code, 400)
@@ -1,8 +1,27 @@
 from django.urls import path
-from .views import LoginView, UserComputerView, LogoutView
+from . import async_views
+from .views import (
+    LoginView, UserComputerView, LogoutView, ComputerImportView, UserComputerCacheStatsView, ComputerListView,
+    FleetExportView, RepairCostAnalyticsView, SearchView, BulkAssignView, BulkReturnView, ComputerAsOfView,
+    FleetAsOfView, JobStatsView,
+)
 
 urlpatterns = [
     path('login/', LoginView.as_view(), name='api_login'),
     path('logout/', LogoutView.as_view(), name='logout'),
     path('my_computer/', UserComputerView.as_view(), name='my-computer'),
+    path('my_computer/cache_stats/', UserComputerCacheStatsView.as_view(), name='my-computer-cache-stats'),
+    path('computers/', ComputerListView.as_view(), name='computer-list'),
+    path('computers/import/', ComputerImportView.as_view(), name='computer-import'),
+    path('assignments/bulk/', BulkAssignView.as_view(), name='bulk-assign'),
+    path('assignments/bulk_return/', BulkReturnView.as_view(), name='bulk-return'),
+    path('export/', FleetExportView.as_view(), name='fleet-export'),
+    path('analytics/repair_costs/', RepairCostAnalyticsView.as_view(), name='repair-cost-analytics'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('jobs/stats/', JobStatsView.as_view(), name='job-stats'),
+    path('computers/<str:asset_tag>/as_of/<str:when>/', ComputerAsOfView.as_view(), name='computer-as-of'),
+    path('fleet/as_of/<str:when>/', FleetAsOfView.as_view(), name='fleet-as-of'),
+    path('async/my_computer/', async_views.my_computer, name='async-my-computer'),
+    path('async/my_computer/repairs/', async_views.my_repairs, name='async-my-repairs'),
+    path('async/computers/', async_views.computer_list, name='async-computer-list'),
 ]
\ No newline at end of file
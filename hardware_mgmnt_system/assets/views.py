@@ -2,67 +2,68 @@ from django.contrib.auth import authenticate, login, logout
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions, generics
-from .models import Computer, ComputerAssignment, ComputerRepairHistory
-from .serializers import UserComputerSerializer
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import CursorPagination
+from . import caching, history, jobs, metrics, search
+from .ratelimit import LoginRateThrottle, reset_username
+from .routers import ReplicaReadMixin
+from .models import Computer, ComputerAssignment, ComputerRepairHistory, ComputerSummary, RepairCostRollup
+from .serializers import (
+    UserComputerSerializer, UserComputerSummarySerializer, ComputerListSerializer, ComputerSummaryListSerializer,
+    BulkAssignSerializer, BulkReturnSerializer,
+)
+from .exports import export_rows, stream_csv
+from .services import bulk_assign, bulk_return, flatten_row, import_computers, read_computer_rows
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.db.models import Prefetch, Q, Sum
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_protect
 from django.utils.decorators import method_decorator
 from django.core.cache import cache
-import uuid
+from django.utils.http import parse_etags
+import hmac
+import io
+from collections import Counter
+from datetime import date
 
 # Create your views here.
 @method_decorator(csrf_protect, name='dispatch')
 class LoginView(APIView):
     permission_classes = [permissions.AllowAny]
+    throttle_classes = [LoginRateThrottle]
 
     def post(self, request):
-        # generate unique session ID for this login attempt
-        session_id = str(uuid.uuid4())
-        lock_key = f"login_lock:{request.META.get('REMOTE_ADDR', 'unknown')}"
+        username = request.data.get("username")
+        password = request.data.get("password")
 
-        # check if user is already logging in (30s lock)
-        if cache.get(lock_key):
+        if not username or not password:
             return Response(
-                {"Detail": "Login in progress. Please wait..."},
-                status=status.HTTP_429_TOO_MAY_REQUESTS
+                {"detail": "Username and password are required."},
+                status=status.HTTP_400_BAD_REQUEST,
             )
         
-        # set lock
-        cache.set(lock_key, session_id, 30)
-
-        try:
-            username = request.data.get("username")
-            password = request.data.get("password")
-
-            if not username or not password:
-                return Response(
-                    {"detail": "Username and password are required."},
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            
-            user = authenticate(request, username=username, password=password)
-            if user is None:
-                return Response(
-                    {"detail": "Invalid credentials"},
-                    status=status.HTTP_401_UNAUTHORIZED,
-                )
-            
-            # clear lock on success
-            cache.delete(lock_key)
-            
-            # create a session
-            login(request, user)
-
+        user = authenticate(request, username=username, password=password)
+        if user is None:
             return Response(
-                {
-                    "detail": "Logged in successfully.",
-                    "username": user.username,
-                }
+                {"detail": "Invalid credentials"},
+                status=status.HTTP_401_UNAUTHORIZED,
             )
-        except Exception:
-            cache.delete(lock_key)  # clear lock on error
-            raise
+        
+        # a successful login clears the failed attempts against this username
+        reset_username(username)
+        
+        # create a session
+        login(request, user)
+
+        return Response(
+            {
+                "detail": "Logged in successfully.",
+                "username": user.username,
+            }
+        )
 
 class LogoutView(APIView):
     permission_classes = [permissions.AllowAny]
@@ -74,20 +75,411 @@ class LogoutView(APIView):
             status=status.HTTP_200_OK
         )
 
-class UserComputerView(generics.RetrieveAPIView):
+def my_computer_queryset(user):
+    '''The computer open-assigned to user, with everything UserComputerSerializer reads except the repairs'''
+    open_assignments = ComputerAssignment.objects.filter(
+        end_date__isnull=True
+    ).select_related('employee__user').order_by('-start_date')
+
+    return Computer.objects.filter(
+        pk__in=ComputerAssignment.objects.filter(
+            employee__user=user, end_date__isnull=True
+        ).values('computer')
+    ).select_related('department', 'repair_total').prefetch_related(
+        Prefetch('assignments', queryset=open_assignments, to_attr='open_assignments')
+    )
+
+def repairs_limit(params, maximum):
+    limit = params.get('repairs_limit')
+    if limit is None:
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValidationError({"repairs_limit": "Must be a positive integer."})
+    if limit < 1:
+        raise ValidationError({"repairs_limit": "Must be a positive integer."})
+    return min(limit, maximum)
+
+def repairs_page_queryset(computer, limit, cursor=None):
+    '''
+    Newest first; with a limit, one extra row is fetched to tell whether there is a next page.
+    computer may be a Computer or its ComputerSummary, which share the primary key.
+    '''
+    repairs = ComputerRepairHistory.objects.filter(computer_id=computer.pk).order_by('-date_of_repair', '-id')
+    if limit is None:
+        return repairs
+
+    if cursor:
+        try:
+            date_part, id_part = cursor.split('_')
+            before_date, before_id = date.fromisoformat(date_part), int(id_part)
+        except ValueError:
+            raise ValidationError({"repairs_cursor": "Invalid cursor."})
+        repairs = repairs.filter(
+            Q(date_of_repair__lt=before_date) | Q(date_of_repair=before_date, id__lt=before_id)
+        )
+    return repairs[:limit + 1]
+
+def set_repair_page(computer, repairs, limit):
+    '''Attach the rows fetched with repairs_page_queryset as computer.repair_page and repairs_next_cursor'''
+    computer.repair_page = repairs if limit is None else repairs[:limit]
+    if limit is not None and len(repairs) > limit:
+        last = computer.repair_page[-1]
+        computer.repairs_next_cursor = f"{last.date_of_repair.isoformat()}_{last.id}"
+    return computer
+
+class UserComputerView(ReplicaReadMixin, generics.RetrieveAPIView):
+    '''
+    The signed-in employee's computer, built from its ComputerSummary row and one page of
+    repairs. Computers without a summary yet fall back to the computer with its rolled-up
+    repair total and open assignment. Pass ?repairs_limit=N to page the repair history and ?repairs_cursor= to continue.
+    Responses are cached per user and computer and carry an ETag for conditional requests.
+    '''
     serializer_class = UserComputerSerializer
-    permission_clases = [permissions.IsAuthenticated]
+    permission_classes = [permissions.IsAuthenticated]
+    max_repairs_limit = 500
+
+    def get_queryset(self):
+        return my_computer_queryset(self.request.user)
+
+    def get_repairs_limit(self):
+        return repairs_limit(self.request.query_params, self.max_repairs_limit)
 
     def get_object(self):
-        assignment = ComputerAssignment.objects.filter(
-            employee__user=self.request.user,
-            end_date__isnull=True
-        ).select_related('computer__current_user__user', 'computer__department').first()
+        '''The fallback for a computer whose summary has not been built yet'''
+        computer = self.get_queryset().first()
+        if computer is None:
+            raise NotFound("No computer assigned to you currently.")
+
+        limit = self.get_repairs_limit()
+        repairs = repairs_page_queryset(computer, limit, self.request.query_params.get('repairs_cursor'))
+        return set_repair_page(computer, list(repairs), limit)
+
+    def get_data(self, computer_id):
+        '''The response for computer_id, or None if the user no longer holds it'''
+        summary = ComputerSummary.objects.filter(pk=computer_id).first()
+        if summary is None:
+            if not self.get_queryset().filter(pk=computer_id).exists():
+                return None
+            return self.get_serializer(self.get_object()).data
+        if summary.user_id != self.request.user.pk:
+            return None
+
+        limit = self.get_repairs_limit()
+        repairs = repairs_page_queryset(summary, limit, self.request.query_params.get('repairs_cursor'))
+        return UserComputerSummarySerializer(set_repair_page(summary, list(repairs), limit)).data
+
+    def retrieve(self, request, *args, **kwargs):
+        computer_id = caching.get_computer_id(request.user.pk)
+        if computer_id is None:
+            computer_id = ComputerAssignment.objects.filter(
+                employee__user=request.user, end_date__isnull=True
+            ).values_list('computer_id', flat=True).first()
+            if computer_id is None:
+                raise NotFound("No computer assigned to you currently.")
+            caching.set_computer_id(request.user.pk, computer_id)
+
+        params = {
+            name: request.query_params[name]
+            for name in ('repairs_limit', 'repairs_cursor') if name in request.query_params
+        }
+        key = caching.response_key(request.user.pk, computer_id, caching.get_version(computer_id), params)
+        cached = cache.get(key)
+        if cached is None:
+            caching.record('miss')
+            data = self.get_data(computer_id)
+            if data is None:
+                # the cached pointer is stale, e.g. set from a lagging replica: drop it and
+                # answer from the open assignment, without caching under the wrong computer
+                caching.invalidate_user(request.user.pk)
+                data = self.get_serializer(self.get_object()).data
+                etag = caching.make_etag(data)
+            else:
+                etag = caching.make_etag(data)
+                cache.set(key, (etag, data), caching.timeout())
+        else:
+            caching.record('hit')
+            etag, data = cached
+
+        if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+        if etag in if_none_match or '*' in if_none_match:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(data, headers={'ETag': etag})
+
+class HasMetricsToken(permissions.BasePermission):
+    '''Staff, or a scraper sending "Authorization: Bearer <METRICS_TOKEN>"'''
+
+    def has_permission(self, request, view):
+        token = getattr(settings, 'METRICS_TOKEN', None)
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if token and hmac.compare_digest(header.encode(), f"Bearer {token}".encode()):
+            return True
+        return bool(request.user and request.user.is_staff)
+
+class MetricsView(APIView):
+    '''Request metrics of this worker process in the Prometheus text format'''
+    permission_classes = [HasMetricsToken]
+
+    def get(self, request):
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+class UserComputerCacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(caching.stats())
+
+class JobStatsView(APIView):
+    '''Background job queue depth, and latency from enqueue to finish over the last hour'''
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({'enabled': jobs.enabled(), **jobs.stats()})
+
+def filter_fleet(queryset, params):
+    '''Apply the fleet listing filters in params to a ComputerSummary queryset'''
+    department = params.get('department')
+    if department:
+        if department.isdigit():
+            queryset = queryset.filter(department_id=int(department))
+        else:
+            queryset = queryset.filter(department_name=department)
+
+    computer_status = params.get('status')
+    if computer_status:
+        if computer_status not in dict(Computer.STATUS_CHOICES):
+            raise ValidationError({"status": f"Must be one of {', '.join(dict(Computer.STATUS_CHOICES))}."})
+        queryset = queryset.filter(status=computer_status)
+
+    if params.get('brand'):
+        queryset = queryset.filter(brand=params['brand'])
+
+    memory_size = params.get('memory_size')
+    if memory_size:
+        if not memory_size.isdigit():
+            raise ValidationError({"memory_size": "Must be a whole number of GB."})
+        queryset = queryset.filter(memory_size=int(memory_size))
+
+    if params.get('storage_type'):
+        queryset = queryset.filter(storage_type=params['storage_type'])
+
+    # spec ranges compare indexed integers, e.g. memory_size__lt=8 or storage_size_gb__gte=512
+    for field in ('memory_size', 'storage_size_gb'):
+        for lookup in ('lt', 'lte', 'gt', 'gte'):
+            name = f"{field}__{lookup}"
+            value = params.get(name)
+            if value:
+                if not value.isdigit():
+                    raise ValidationError({name: "Must be a whole number of GB."})
+                queryset = queryset.filter(**{name: int(value)})
+
+    return queryset
 
-        if not assignment:
+class FleetCursorPagination(CursorPagination):
+    '''Keyset pagination on the computer id, so deep pages cost the same as the first'''
+    ordering = 'computer_id'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+class ComputerListView(ReplicaReadMixin, generics.ListAPIView):
+    '''
+    Read-only fleet inventory for IT staff, read from the ComputerSummary table alone.
+    Filters: department (id or name), status, brand, memory_size, storage_type, and the ranges
+    memory_size__lt/lte/gt/gte and storage_size_gb__lt/lte/gt/gte.
+    '''
+    serializer_class = ComputerSummaryListSerializer
+    permission_classes = [permissions.IsAdminUser]
+    pagination_class = FleetCursorPagination
+
+    def get_queryset(self):
+        return filter_fleet(ComputerSummary.objects.all(), self.request.query_params)
+
+class FleetExportView(APIView):
+    '''
+    Stream computers, assignments and repairs as CSV.
+    Filters: start and end (YYYY-MM-DD), department (id or name).
+    '''
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        dates = {}
+        for name in ('start', 'end'):
+            value = request.query_params.get(name)
+            try:
+                dates[name] = date.fromisoformat(value) if value else None
+            except ValueError:
+                raise ValidationError({name: "Use the YYYY-MM-DD format."})
+
+        rows = export_rows(department=request.query_params.get('department'), **dates)
+        response = StreamingHttpResponse(stream_csv(rows), content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="fleet_export.csv"'
+        return response
+
+class RepairCostAnalyticsView(APIView):
+    '''
+    Repair spend read from the pre-aggregated rollups.
+    group_by: any of department, component, month (comma separated, default all three).
+    Filters: year, department (id).
+    '''
+    permission_classes = [permissions.IsAdminUser]
+    group_fields = {'department': 'department__name', 'component': 'repaired_component', 'month': 'month'}
+
+    def get(self, request):
+        group_by = request.query_params.get('group_by', 'department,component,month').split(',')
+        unknown = [name for name in group_by if name not in self.group_fields]
+        if unknown:
+            raise ValidationError({"group_by": f"Unknown grouping: {', '.join(unknown)}."})
+
+        rollups = RepairCostRollup.objects.all()
+        year = request.query_params.get('year')
+        if year:
+            if not year.isdigit():
+                raise ValidationError({"year": "Must be a year such as 2024."})
+            rollups = rollups.filter(month__year=int(year))
+        department = request.query_params.get('department')
+        if department:
+            if not department.isdigit():
+                raise ValidationError({"department": "Must be a department id."})
+            rollups = rollups.filter(department_id=int(department))
+
+        fields = [self.group_fields[name] for name in group_by]
+        rows = rollups.order_by(*fields).values(*fields).annotate(
+            total_cost=Sum('total_cost'), repair_count=Sum('repair_count')
+        )
+        return Response([
+            {**{name: row[self.group_fields[name]] for name in group_by},
+             'total_cost': row['total_cost'], 'repair_count': row['repair_count']}
+            for row in rows
+        ])
+
+class SearchView(APIView):
+    '''
+    Find computers by asset tag prefix or by words in their name, department, model,
+    current user and repair comments. ?q=... (required), ?limit=N (default 20, at most 100).
+    '''
+    permission_classes = [permissions.IsAdminUser]
+    max_limit = 100
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({"q": "This parameter is required."})
+        limit = request.query_params.get('limit', '20')
+        if not limit.isdigit() or int(limit) < 1:
+            raise ValidationError({"limit": "Must be a positive integer."})
+
+        matches = search.search(query, min(int(limit), self.max_limit))
+        computers = Computer.objects.select_related('info', 'department', 'current_user__user').in_bulk(
+            [computer_id for computer_id, _, _ in matches]
+        )
+        return Response({'results': [
+            {**ComputerListSerializer(computers[computer_id]).data,
+             'score': None if score is None else round(score, 4), 'match': match}
+            for computer_id, score, match in matches if computer_id in computers
+        ]})
+
+def as_of_moment(value):
+    moment = history.parse_moment(value)
+    if moment is None:
+        raise ValidationError({"as_of": "Use a date (YYYY-MM-DD, meaning the end of that day) or an ISO datetime."})
+    return moment
+
+class ComputerAsOfView(APIView):
+    '''The status, user and department a computer had at a date or datetime, and since when'''
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, asset_tag, when):
+        moment = as_of_moment(when)
+        state = history.computer_as_of(asset_tag, moment)
+        if state is None:
+            raise NotFound(f"No record of {asset_tag} at {moment.isoformat()}.")
+        return Response({'as_of': moment, **state})
+
+class FleetAsOfView(APIView):
+    '''
+    Every computer that existed at a date or datetime with its state then, plus totals by status.
+    ?department=<id> and ?status=... narrow the list.
+    '''
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request, when):
+        moment = as_of_moment(when)
+        department = request.query_params.get('department')
+        if department is not None and not department.isdigit():
+            raise ValidationError({"department": "Must be a department id."})
+        computers, snapshot = history.fleet_as_of(
+            moment,
+            department=int(department) if department else None,
+            status=request.query_params.get('status') or None,
+        )
+        return Response({
+            'as_of': moment,
+            'snapshot': snapshot.taken_at if snapshot else None,
+            'count': len(computers),
+            'by_status': dict(Counter(computer['status'] for computer in computers)),
+            'computers': computers,
+        })
+
+class BulkAssignView(APIView):
+    '''Assign many computers at once: {"assignments": [{"computer": id, "employee": id}, ...]}'''
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        serializer = BulkAssignSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        pairs = [(row['computer'], row['employee']) for row in serializer.validated_data['assignments']]
+        try:
+            created = bulk_assign(pairs, start_date=serializer.validated_data.get('start_date'))
+        except DjangoValidationError as exc:
+            return Response({"detail": exc.messages}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"assigned": created}, status=status.HTTP_201_CREATED)
+
+class BulkReturnView(APIView):
+    '''End the open assignments of many computers at once: {"computers": [id, ...]}'''
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        serializer = BulkReturnSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ended = bulk_return(serializer.validated_data['computers'], end_date=serializer.validated_data.get('end_date'))
+        return Response({"returned": ended})
+
+class ComputerImportView(APIView):
+    '''Bulk import computers from an uploaded CSV/JSON file or a JSON list'''
+    permission_classes = [permissions.IsAdminUser]
+
+    def post(self, request):
+        try:
+            chunk_size = int(request.query_params.get('chunk_size', 500))
+        except ValueError:
+            chunk_size = 0
+        if chunk_size < 1:
             return Response(
-                {"detail": "No computer assigned to you currently."},
-                status=status.HTTP_404_NOT_FOUND
+                {"detail": "chunk_size must be a positive integer."},
+                status=status.HTTP_400_BAD_REQUEST
             )
-        
-        return assignment.computer
\ No newline at end of file
+
+        upload = request.FILES.get('file')
+        if upload is not None:
+            fmt = request.data.get('format') or ('json' if upload.name.lower().endswith('.json') else 'csv')
+            stream = io.TextIOWrapper(upload.file, encoding='utf-8', newline='')
+            try:
+                rows = read_computer_rows(stream, fmt)
+                result = import_computers(rows, chunk_size=chunk_size)
+            except ValueError as exc:
+                return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        elif isinstance(request.data, list):
+            rows = (flatten_row(row) for row in request.data if isinstance(row, dict))
+            result = import_computers(rows, chunk_size=chunk_size)
+        else:
+            return Response(
+                {"detail": "Upload a 'file' or post a JSON list of computers."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response(
+            result,
+            status=status.HTTP_201_CREATED if result['created'] else status.HTTP_400_BAD_REQUEST
+        )
@@ -47,6 +47,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'assets.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,6 +66,29 @@ REST_FRAMEWORK = {
     ]
 }
 
+# login attempts allowed per sliding window: scope -> (attempts, seconds)
+LOGIN_RATE_LIMITS = {
+    'ip': (30, 60),
+    'username': (5, 300),
+}
+
+# share of requests whose queries, cache lookups and saves are collected for /metrics,
+# and whether responses carry a Server-Timing header with them
+REQUEST_METRICS = {
+    'SAMPLE_RATE': 1.0,
+    'SERVER_TIMING': True,
+}
+
+# bearer token a Prometheus scraper sends to /metrics; staff sessions can read it too
+METRICS_TOKEN = os.getenv('METRICS_TOKEN')
+
+# side effects such as search indexing run in the run_jobs worker instead of the request when enabled
+JOB_QUEUE = {
+    'ENABLED': False,
+    'MAX_ATTEMPTS': 5,
+    'RETRY_BACKOFF': 10,
+}
+
 ROOT_URLCONF = 'hardware_mgmnt_system.urls'
 
 TEMPLATES = [
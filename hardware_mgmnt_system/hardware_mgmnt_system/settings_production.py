@@ -0,0 +1,61 @@
+"""
+Production settings: DJANGO_SETTINGS_MODULE=hardware_mgmnt_system.settings_production
+
+Database connections are kept open between requests for DB_CONN_MAX_AGE seconds and
+health checked before they are reused. With DB_ENGINE=postgresql, setting
+DB_POOL_MAX_SIZE switches to Django's native connection pool instead (MySQL has no
+native pool, so it relies on persistent connections). Setting DB_REPLICA_HOST adds a
+read replica that the lag tolerant views read from, see assets/routers.py.
+METRICS_SAMPLE_RATE sets the share of requests whose queries are collected for /metrics.
+JOB_QUEUE_ENABLED=1 moves search indexing to the run_jobs worker.
+"""
+import os
+
+from .settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+ALLOWED_HOSTS = [host for host in os.getenv('ALLOWED_HOSTS', '').split(',') if host]
+
+# Server-Timing would show every client how the database is doing
+REQUEST_METRICS = {
+    'SAMPLE_RATE': float(os.getenv('METRICS_SAMPLE_RATE', 0.1)),
+    'SERVER_TIMING': False,
+}
+
+JOB_QUEUE = {**JOB_QUEUE, 'ENABLED': os.getenv('JOB_QUEUE_ENABLED', '') == '1'}  # noqa: F405
+
+
+def database(prefix='DB_'):
+    def env(name, default=None):
+        return os.getenv(prefix + name) or os.getenv('DB_' + name, default)
+
+    engine = os.getenv('DB_ENGINE', 'mysql')
+    config = {
+        'ENGINE': f'django.db.backends.{engine}',
+        'NAME': env('NAME'),
+        'USER': env('USER'),
+        'PASSWORD': env('PASSWORD'),
+        'HOST': env('HOST'),
+        'PORT': env('PORT'),
+        'CONN_MAX_AGE': int(env('CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    }
+    pool_size = env('POOL_MAX_SIZE')
+    if engine == 'postgresql' and pool_size:
+        # pooled connections go back to the pool at the end of each request
+        config['CONN_MAX_AGE'] = 0
+        config['OPTIONS']['pool'] = {
+            'min_size': int(env('POOL_MIN_SIZE', 2)),
+            'max_size': int(pool_size),
+            'timeout': int(env('POOL_TIMEOUT', 10)),
+        }
+    return config
+
+
+DATABASES = {'default': database()}
+
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {**database('DB_REPLICA_'), 'TEST': {'MIRROR': 'default'}}
+    DATABASE_ROUTERS = ['assets.routers.ReplicaRouter']